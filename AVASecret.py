@@ -1,5 +1,6 @@
-import requests
+import httpx
 from helpers.secret_manager import secret_manager
+from helpers.http_client import http_client
 import json
 from helpers.logger_config import logger
 from fastapi import HTTPException
@@ -14,7 +15,8 @@ def getValue(secret_key):
 
     try:
 
-        response = requests.get(url, params=params, headers=headers)
+        # User tools call this from the crew's worker thread, so it goes through the blocking bridge of the shared client
+        response = http_client.request_sync("GET", url, "secrets", params=params, headers=headers)
 
         response.raise_for_status()
         
@@ -22,6 +24,6 @@ def getValue(secret_key):
 
         return response_dict[secret_key]
     
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error occurred while fetching API key: {e}")
-        raise HTTPException(status_code=400, detail=f"Error occurred while fetching API key: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=f"Error occurred while fetching API key: {e}")
\ No newline at end of file
@@ -0,0 +1,15 @@
+from typing import Optional, Dict
+
+from pydantic import BaseModel
+from PipelineModel.AgentTools import AgentTools, AgentUserTools
+
+class PipelineBatchRequest(BaseModel):
+    pipeLineId: int
+    # Id of the batch, item i runs as execution "<executionId>-<i>"
+    executionId: str
+    items: list[Dict[str,str]]
+    user: str
+    tools: list[AgentTools] = []
+    userTools: Optional[list[AgentUserTools]] = []
+    priority: Optional[str] = None
+    concurrency: Optional[int] = None
@@ -22,5 +22,8 @@ class PipelineModel(BaseModel):
     tasksOutputs: list[TasksOutputModel] = []
     output: Optional[str] = None
     enableAgenticMemory: Optional[bool] = False
+    llmCache: Optional[bool] = False
+    semanticCache: Optional[bool] = False
+    taskMemo: Optional[bool] = False
     file_download_url: str = None
 
@@ -10,3 +10,7 @@ class PipelineRequest(BaseModel):
     user: str
     tools: list[AgentTools] = []
     userTools: Optional[list[AgentUserTools]] = []
+    priority: Optional[str] = None
+    # Wall clock and token budget of the whole execution, capped by EXECUTION_MAX_SECONDS and EXECUTION_MAX_TOKENS
+    maxExecutionSeconds: Optional[int] = None
+    maxTokens: Optional[int] = None
@@ -1,7 +1,10 @@
+from typing import List, Optional
 from pydantic import BaseModel
 from PipelineModel.agentDetails import AgentDetails
 
 class Agent(BaseModel):
     serial: int
     agent: AgentDetails
+    # Serials of the agents whose task output this agent's task needs, the pipeline runs as a task graph when any agent sets it
+    dependsOn: Optional[List[int]] = None
 
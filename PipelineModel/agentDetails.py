@@ -24,3 +24,6 @@ class AgentDetails(BaseModel):
     allowCodeExecution: Optional[bool] = False
     isSafeCodeExecution: Optional[bool] = False
     userTools: Optional[list[AgentUserTools]] = []
+    # None follows the llmCache flag of the pipeline
+    llmCache: Optional[bool] = None
+    semanticCache: Optional[bool] = None
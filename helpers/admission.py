@@ -0,0 +1,135 @@
+import asyncio
+import itertools
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+from helpers.logger_config import logger
+from helpers.executor import EXECUTION_POOL_SIZE
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", str(EXECUTION_POOL_SIZE)))
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", "3"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "100"))
+ADMISSION_MAX_QUEUED_PER_USER = int(os.getenv("ADMISSION_MAX_QUEUED_PER_USER", "20"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Share of the worker an execution class gets while both classes are waiting
+PRIORITY_WEIGHTS = {
+    INTERACTIVE: int(os.getenv("ADMISSION_INTERACTIVE_WEIGHT", "4")),
+    BATCH: int(os.getenv("ADMISSION_BATCH_WEIGHT", "1"))
+}
+
+# Starting estimate of an execution's duration, used for Retry-After until real runs are measured
+DEFAULT_EXECUTION_SECONDS = 60
+
+
+class AdmissionTicket:
+
+    def __init__(self, user, priority, finish_tag, sequence):
+        self.user = user
+        self.priority = priority
+        self.finish_tag = finish_tag
+        self.sequence = sequence
+        self.admitted = asyncio.get_running_loop().create_future()
+        self.started_at = None
+
+
+class AdmissionController:
+    """Caps concurrent executions of this worker globally and per user.
+
+    Waiting executions are admitted by weighted fair queueing: every user has its own virtual
+    clock that advances by 1/weight per execution, so a user with a large batch cannot push
+    other users' executions behind all of its own, and interactive runs overtake batch runs.
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.running_per_user = defaultdict(int)
+        self.waiting = []
+        self.virtual_time = 0.0
+        self.last_finish_tag = {}
+        self.sequence = itertools.count()
+        self.average_duration = DEFAULT_EXECUTION_SECONDS
+
+    def request(self, user, priority=None):
+        """Queues an execution for admission, or raises 429 when the queues are full."""
+        priority = priority or INTERACTIVE
+        if priority not in PRIORITY_WEIGHTS:
+            raise HTTPException(status_code=400, detail=f"Unknown priority {priority}, expected one of {list(PRIORITY_WEIGHTS)}")
+
+        user_waiting = sum(1 for ticket in self.waiting if ticket.user == user)
+        if len(self.waiting) >= ADMISSION_MAX_QUEUED or user_waiting >= ADMISSION_MAX_QUEUED_PER_USER:
+            retry_after = self.retry_after()
+            logger.warning("Rejecting execution of user %s, %s executions are waiting", user, len(self.waiting))
+            raise HTTPException(status_code=429, detail="Too many executions are waiting, please retry later",
+                                headers={"Retry-After": str(retry_after)})
+
+        start_tag = max(self.virtual_time, self.last_finish_tag.get(user, 0.0))
+        finish_tag = start_tag + 1.0 / PRIORITY_WEIGHTS[priority]
+        self.last_finish_tag[user] = finish_tag
+
+        ticket = AdmissionTicket(user, priority, finish_tag, next(self.sequence))
+        self.waiting.append(ticket)
+        self._dispatch()
+        return ticket
+
+    def release(self, ticket):
+        if ticket in self.waiting:
+            self.waiting.remove(ticket)
+            # Hands the share the ticket reserved back, the user's clock and its later tickets move up
+            cost = 1.0 / PRIORITY_WEIGHTS[ticket.priority]
+            for later in self.waiting:
+                if later.user == ticket.user and later.finish_tag > ticket.finish_tag:
+                    later.finish_tag -= cost
+            self.last_finish_tag[ticket.user] -= cost
+
+        elif ticket.started_at is not None:
+            self.running -= 1
+            self.running_per_user[ticket.user] -= 1
+            if not self.running_per_user[ticket.user]:
+                del self.running_per_user[ticket.user]
+
+            duration = time.monotonic() - ticket.started_at
+            self.average_duration = 0.8 * self.average_duration + 0.2 * duration
+
+        if not self.running and not self.waiting:
+            # Nothing is in flight, so the virtual clocks can start over
+            self.virtual_time = 0.0
+            self.last_finish_tag.clear()
+
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admitted(self, ticket):
+        try:
+            await ticket.admitted
+            yield
+        finally:
+            self.release(ticket)
+
+    def retry_after(self):
+        slots = max(ADMISSION_MAX_CONCURRENT, 1)
+        return max(1, math.ceil(self.average_duration * (len(self.waiting) + 1) / slots))
+
+    def _dispatch(self):
+        while self.running < ADMISSION_MAX_CONCURRENT:
+            eligible = [ticket for ticket in self.waiting
+                        if self.running_per_user[ticket.user] < ADMISSION_MAX_PER_USER and not ticket.admitted.done()]
+            if not eligible:
+                return
+
+            ticket = min(eligible, key=lambda candidate: (candidate.finish_tag, candidate.sequence))
+            self.waiting.remove(ticket)
+            self.running += 1
+            self.running_per_user[ticket.user] += 1
+            self.virtual_time = max(self.virtual_time, ticket.finish_tag - 1.0 / PRIORITY_WEIGHTS[ticket.priority])
+            ticket.started_at = time.monotonic()
+            ticket.admitted.set_result(True)
+            logger.debug("Admitted %s execution of user %s, %s running", ticket.priority, ticket.user, self.running)
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,321 @@
+import contextvars
+import copy
+import functools
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import httpx
+import openai
+from crewai import LLM
+from litellm.llms.custom_httpx.http_handler import HTTPHandler
+from helpers.execution_store import execution_store, ExecutionStatus
+from helpers.logger_config import logger
+from helpers.redis_client import redis_client
+
+# Pipeline level budgets, 0 disables them. A request can ask for a lower limit but not a higher one.
+EXECUTION_MAX_SECONDS = int(os.getenv("EXECUTION_MAX_SECONDS", "0"))
+EXECUTION_MAX_TOKENS = int(os.getenv("EXECUTION_MAX_TOKENS", "0"))
+# Seconds between checks for a cancel request while an LLM call is in flight
+CANCEL_POLL_INTERVAL = float(os.getenv("CANCEL_POLL_INTERVAL", "1"))
+# LLM calls in flight across all executions of the worker, each one waits for its response on a thread of this pool
+LLM_CALL_POOL_SIZE = int(os.getenv("LLM_CALL_POOL_SIZE", "64"))
+
+CANCEL_REQUEST_TTL = 86400
+
+
+class ExecutionCancelled(Exception):
+
+    def __init__(self, executionId, reason):
+        super().__init__(f"Execution {executionId} stopped: {reason}")
+        self.executionId = executionId
+        self.reason = reason
+
+
+def cancel_key(executionId):
+    return f"pipeline:cancel:{executionId}"
+
+
+def effective_limit(default, requested):
+    limits = [limit for limit in (default, requested) if limit]
+    return min(limits) if limits else None
+
+
+llm_call_pool = ThreadPoolExecutor(max_workers=LLM_CALL_POOL_SIZE, thread_name_prefix="llm-call")
+
+
+class AbortableHttpClient(httpx.Client):
+    """HTTP client of the LLM calls of one execution.
+
+    Every connection it opens is recorded through the httpcore trace extension, abort() shuts them down
+    so a call blocked on a response fails at once and the provider sees the request go away.
+    """
+
+    def __init__(self):
+        super().__init__(event_hooks={"request": [self._trace]})
+        self.sockets = []
+        self.aborted = False
+        self.sockets_lock = threading.Lock()
+
+    def _trace(self, request):
+        if self.aborted:
+            raise httpx.ConnectError("execution stopped", request=request)
+        request.extensions["trace"] = self._record
+
+    def _record(self, event, info):
+        if event not in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            return
+        sock = info["return_value"].get_extra_info("socket")
+        with self.sockets_lock:
+            self.sockets = [open_socket for open_socket in self.sockets if open_socket.fileno() != -1]
+            self.sockets.append(sock)
+            aborted = self.aborted
+        if aborted:
+            self._shutdown([sock])
+
+    @staticmethod
+    def _shutdown(sockets):
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def abort(self):
+        with self.sockets_lock:
+            self.aborted = True
+            sockets, self.sockets = self.sockets, []
+        self._shutdown(sockets)
+
+
+class CancellationScope:
+    """Tracks whether an execution has been cancelled or ran out of its wall clock or token budget.
+
+    Every LLM call of the execution goes through run(), which refuses to start a call once the
+    execution is stopped and aborts a call in flight as soon as it is. Calls get a litellm timeout of
+    the remaining wall clock budget, and Azure, Bedrock and Vertex calls are sent on the execution's
+    own HTTP client, whose connections are shut down on abort.
+    """
+
+    def __init__(self, executionId, deadline=None, max_tokens=None):
+        self.executionId = executionId
+        self.deadline = deadline
+        self.max_tokens = max_tokens
+        self.reason = None
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.polled_at = 0.0
+        self.http_client = None
+        self.provider_clients = {}
+
+    @classmethod
+    def for_execution(cls, executionId, max_seconds=None, max_tokens=None):
+        seconds = effective_limit(EXECUTION_MAX_SECONDS, max_seconds)
+        return cls(executionId, time.time() + seconds if seconds else None, effective_limit(EXECUTION_MAX_TOKENS, max_tokens))
+
+    def __reduce__(self):
+        # Only the limits cross into a process pool child, a cancel request reaches the child through Redis
+        return (CancellationScope, (self.executionId, self.deadline, self.max_tokens))
+
+    def cancel(self, reason):
+        if self.reason is None:
+            self.reason = reason
+
+    def used_tokens(self):
+        with self.lock:
+            return sum(self.tokens.values())
+
+    def record_tokens(self, callbacks):
+        # The agents' token counters arrive as LLM callbacks, each one holds the running total of its agent
+        for callback in callbacks or []:
+            process = getattr(callback, "token_cost_process", None)
+            if process is not None:
+                with self.lock:
+                    self.tokens[id(process)] = process.total_tokens
+
+    def stop_reason(self):
+        if self.reason:
+            return self.reason
+
+        if self.deadline and time.time() >= self.deadline:
+            self.cancel("wall clock budget exceeded")
+        elif self.max_tokens and self.used_tokens() >= self.max_tokens:
+            self.cancel(f"token budget of {self.max_tokens} exhausted")
+        elif redis_client and time.monotonic() - self.polled_at >= CANCEL_POLL_INTERVAL:
+            self.polled_at = time.monotonic()
+            try:
+                requested = redis_client.get(cancel_key(self.executionId))
+            except Exception as e:
+                logger.error("Failed to check cancel request of execution %s: %s", self.executionId, str(e))
+                requested = None
+            if requested:
+                self.cancel(requested)
+
+        return self.reason
+
+    def check(self):
+        if self.stop_reason():
+            raise ExecutionCancelled(self.executionId, self.reason)
+
+    def provider_client(self, llm):
+        """The client litellm sends the call on, None for providers it cannot be handed to."""
+        provider = llm.model.split("/", 1)[0]
+        if provider not in ("azure", "bedrock", "vertex_ai"):
+            return None
+
+        key = (provider, llm.base_url or llm.api_base, llm.api_key, llm.api_version)
+        with self.lock:
+            client = self.provider_clients.get(key)
+            if client is None:
+                if self.http_client is None:
+                    self.http_client = AbortableHttpClient()
+                if provider == "azure":
+                    # litellm retries itself, the openai client must not retry on an aborted connection
+                    client = openai.AzureOpenAI(api_key=llm.api_key, api_version=llm.api_version, azure_endpoint=llm.base_url or llm.api_base,
+                                                http_client=self.http_client, max_retries=0)
+                else:
+                    client = HTTPHandler(client=self.http_client)
+                self.provider_clients[key] = client
+        return client
+
+    def bind(self, llm):
+        """Copy of the LLM whose call ends with the wall clock budget and can be aborted with the execution."""
+        llm = copy.copy(llm)
+        if self.deadline:
+            remaining = max(self.deadline - time.time(), 0.05)
+            llm.timeout = min(llm.timeout, remaining) if llm.timeout else remaining
+        client = self.provider_client(llm)
+        if client is not None:
+            llm.additional_params = {**llm.additional_params, "client": client}
+        return llm
+
+    def abort(self):
+        with self.lock:
+            http_client = self.http_client
+        if http_client is not None:
+            http_client.abort()
+
+    def close(self):
+        with self.lock:
+            http_client, self.http_client = self.http_client, None
+            self.provider_clients = {}
+        if http_client is not None:
+            http_client.close()
+
+    def run(self, func, llm, *args, **kwargs):
+        self.check()
+
+        call = llm_call_pool.submit(contextvars.copy_context().run, func, self.bind(llm), *args, **kwargs)
+        while True:
+            try:
+                result = call.result(timeout=self.poll_timeout())
+                break
+            except FutureTimeoutError:
+                if call.done():
+                    # The call itself timed out
+                    raise
+                if not self.stop_reason():
+                    continue
+            logger.warning("Aborting in flight LLM call of execution %s: %s", self.executionId, self.reason)
+            self.abort()
+            try:
+                # The aborted call fails on its own, waiting for it gives its thread back to the pool
+                call.result(timeout=CANCEL_POLL_INTERVAL)
+            except Exception:
+                pass
+            raise ExecutionCancelled(self.executionId, self.reason)
+
+        self.record_tokens(kwargs.get("callbacks") or (args[2] if len(args) > 2 else None))
+        return result
+
+    def poll_timeout(self):
+        if self.deadline:
+            return max(0.05, min(CANCEL_POLL_INTERVAL, self.deadline - time.time()))
+        return CANCEL_POLL_INTERVAL
+
+
+_cancellation_scope: ContextVar[Optional[CancellationScope]] = ContextVar("cancellation_scope", default=None)
+
+
+def current_cancellation_scope() -> Optional[CancellationScope]:
+    return _cancellation_scope.get()
+
+
+class CancellationRegistry:
+    """The cancellation scopes of the executions running in this process."""
+
+    def __init__(self):
+        self.scopes = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def track(self, scope):
+        token = _cancellation_scope.set(scope)
+        with self.lock:
+            self.scopes[scope.executionId] = scope
+        try:
+            yield scope
+        finally:
+            _cancellation_scope.reset(token)
+            with self.lock:
+                if self.scopes.get(scope.executionId) is scope:
+                    del self.scopes[scope.executionId]
+            scope.close()
+
+    def cancel(self, executionId, reason="cancelled by request"):
+        """Stops the execution wherever it runs, returns False when it is not running here or in the execution store."""
+        with self.lock:
+            scope = self.scopes.get(executionId)
+        if scope is not None:
+            scope.cancel(reason)
+        elif not self.is_pending(executionId):
+            return False
+
+        if redis_client:
+            redis_client.set(cancel_key(executionId), reason, ex=CANCEL_REQUEST_TTL)
+        return True
+
+    @staticmethod
+    def is_pending(executionId):
+        # Executions of other workers and processes are only known through the execution store
+        if execution_store is None:
+            return False
+        execution = execution_store.get(executionId)
+        return execution is not None and execution["status"] in (ExecutionStatus.QUEUED, ExecutionStatus.RUNNING)
+
+    def cancel_all(self, reason):
+        with self.lock:
+            executionIds = list(self.scopes)
+        for executionId in executionIds:
+            self.cancel(executionId, reason)
+        return executionIds
+
+    def clear(self, executionId):
+        # A resumed or retried execution must not pick up the cancel request of its previous run
+        if redis_client:
+            redis_client.delete(cancel_key(executionId))
+
+
+cancellation_registry = CancellationRegistry()
+
+
+def guard_llm_calls():
+    """Routes every crewai LLM call through the cancellation scope of the execution that makes it."""
+    if getattr(LLM.call, "cancellation_guard", False):
+        return
+
+    unguarded = LLM.call
+
+    @functools.wraps(unguarded)
+    def call(self, *args, **kwargs):
+        scope = _cancellation_scope.get()
+        if scope is None:
+            return unguarded(self, *args, **kwargs)
+        return scope.run(unguarded, self, *args, **kwargs)
+
+    call.cancellation_guard = True
+    LLM.call = call
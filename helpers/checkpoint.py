@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+from crewai.tasks.task_output import TaskOutput
+from helpers.logger_config import logger
+from helpers.redis_client import redis_client
+
+ENABLE_CHECKPOINTS = os.getenv("ENABLE_CHECKPOINTS", "False") == 'True'
+# Seconds the completed tasks of a failed execution are kept for a resume
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", "86400"))
+
+REQUEST_FIELD = "request"
+# Set once the tasks of an execution are checkpointed, hierarchical and file pipelines never are
+CHECKPOINTED_FIELD = "checkpointed"
+
+
+def upstream_tasks(tasks, index):
+    """Tasks whose output feeds tasks[index], the explicit context or every earlier task in a sequential crew."""
+    task = tasks[index]
+    return task.context if isinstance(task.context, list) else tasks[:index]
+
+
+def task_definition(task):
+    agent = task.agent
+    tools = task.tools or (agent.tools if agent else None) or []
+    return {
+        "description": task.description,
+        "expected_output": task.expected_output,
+        "role": agent.role if agent else None,
+        "goal": agent.goal if agent else None,
+        "backstory": agent.backstory if agent else None,
+        "model": getattr(agent.llm, "model", None) if agent else None,
+        "temperature": getattr(agent.llm, "temperature", None) if agent else None,
+        "top_p": getattr(agent.llm, "top_p", None) if agent else None,
+        "max_tokens": getattr(agent.llm, "max_tokens", None) if agent else None,
+        "tools": sorted(tool.name for tool in tools),
+    }
+
+
+class CheckpointStore:
+    """Keeps the output of every completed task of an execution in a Redis hash so a failed run can be resumed.
+
+    Outputs are stored under a fingerprint of the task definition chained with the fingerprints of its
+    upstream tasks. A task is only restored when neither it nor anything it depends on has changed.
+    """
+
+    def __init__(self, redis_client, ttl=CHECKPOINT_TTL):
+        self.redis_client = redis_client
+        self.ttl = ttl
+
+    @staticmethod
+    def key(executionId):
+        return f"pipeline:checkpoint:{executionId}"
+
+    @staticmethod
+    def fingerprints(tasks):
+        position = {id(task): index for index, task in enumerate(tasks)}
+        fingerprints = []
+        for index, task in enumerate(tasks):
+            upstream = [fingerprints[position[id(dependency)]] for dependency in upstream_tasks(tasks, index) if id(dependency) in position]
+            content = json.dumps({"task": task_definition(task), "upstream": upstream}, sort_keys=True, default=str)
+            fingerprints.append(hashlib.sha256(content.encode("utf-8")).hexdigest())
+        return fingerprints
+
+    def save_request(self, executionId, request):
+        key = self.key(executionId)
+        self.redis_client.hset(key, REQUEST_FIELD, json.dumps(request, default=str))
+        self.redis_client.expire(key, self.ttl)
+
+    def get_request(self, executionId):
+        request = self.redis_client.hget(self.key(executionId), REQUEST_FIELD)
+        return json.loads(request) if request else None
+
+    def is_checkpointed(self, executionId):
+        return bool(self.redis_client.hexists(self.key(executionId), CHECKPOINTED_FIELD))
+
+    def save_output(self, executionId, fingerprint, output):
+        try:
+            key = self.key(executionId)
+            self.redis_client.hset(key, fingerprint, output.model_dump_json())
+            self.redis_client.expire(key, self.ttl)
+        except Exception as e:
+            # A lost checkpoint only costs a rerun of the task, it must not fail the execution
+            logger.error("Failed to checkpoint task of execution %s: %s", executionId, str(e))
+
+    def attach(self, executionId, tasks):
+        """Restores task.output for every task that completed in an earlier run of the execution and
+        checkpoints the others when they complete. Returns the number of restored tasks."""
+        key = self.key(executionId)
+        fingerprints = self.fingerprints(tasks)
+        stored = self.redis_client.hmget(key, fingerprints)
+        self.redis_client.hset(key, CHECKPOINTED_FIELD, 1)
+        self.redis_client.expire(key, self.ttl)
+
+        position = {id(task): index for index, task in enumerate(tasks)}
+        restored = set()
+        for index, task in enumerate(tasks):
+            upstream = [position[id(dependency)] for dependency in upstream_tasks(tasks, index) if id(dependency) in position]
+            if stored[index] and all(dependency in restored for dependency in upstream):
+                task.output = TaskOutput.model_validate_json(stored[index])
+                restored.add(index)
+                continue
+
+            def checkpoint(output, fingerprint=fingerprints[index], previous=task.callback):
+                self.save_output(executionId, fingerprint, output)
+                if previous:
+                    previous(output)
+
+            task.callback = checkpoint
+
+        if restored:
+            logger.info("Restored %s of %s tasks from checkpoint ---------------- %s", len(restored), len(tasks), executionId)
+        return len(restored)
+
+    def clear(self, executionId):
+        self.redis_client.delete(self.key(executionId))
+
+
+checkpoint_store = CheckpointStore(redis_client) if redis_client and ENABLE_CHECKPOINTS else None
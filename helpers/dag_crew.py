@@ -0,0 +1,158 @@
+import contextvars
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional
+from crewai import Crew
+from pydantic import Field
+from helpers.logger_config import logger
+from helpers.task_memo import task_memo
+
+# Tasks of one task graph pipeline that may run at the same time
+DAG_MAX_PARALLEL_TASKS = int(os.getenv("DAG_MAX_PARALLEL_TASKS", "4"))
+
+
+def has_task_graph(pipeLineAgents):
+    return any(agent_data.dependsOn is not None for agent_data in pipeLineAgents)
+
+
+def build_task_graph(pipeLineAgents, tasks):
+    """Wires every task's context to the tasks of the agents it depends on and returns the tasks in
+    dependency order, keeping the pipeline order between tasks that do not depend on each other."""
+    position = {}
+    for index, agent_data in enumerate(pipeLineAgents):
+        if agent_data.serial in position:
+            raise ValueError(f"Duplicate agent serial {agent_data.serial} in task graph pipeline")
+        position[agent_data.serial] = index
+
+    upstream = []
+    for agent_data in pipeLineAgents:
+        dependencies = []
+        for serial in agent_data.dependsOn or []:
+            if serial not in position:
+                raise ValueError(f"Agent {agent_data.serial} depends on unknown agent {serial}")
+            if serial == agent_data.serial:
+                raise ValueError(f"Agent {agent_data.serial} depends on itself")
+            dependencies.append(position[serial])
+        upstream.append(dependencies)
+
+    downstream = [[] for _ in tasks]
+    remaining = [len(set(dependencies)) for dependencies in upstream]
+    for index, dependencies in enumerate(upstream):
+        for dependency in set(dependencies):
+            downstream[dependency].append(index)
+
+    ready = [index for index, count in enumerate(remaining) if count == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        index = heapq.heappop(ready)
+        order.append(index)
+        for child in downstream[index]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                heapq.heappush(ready, child)
+
+    if len(order) != len(tasks):
+        cycle = [pipeLineAgents[index].serial for index, count in enumerate(remaining) if count > 0]
+        raise ValueError(f"Task graph has a dependency cycle between agents {cycle}")
+
+    for index, task in enumerate(tasks):
+        # An empty context keeps a root task from receiving the output of whatever ran before it
+        task.context = [tasks[dependency] for dependency in upstream[index]]
+
+    return [tasks[index] for index in order]
+
+
+def chain_tasks(tasks):
+    """Gives a sequential pipeline the explicit contexts of a task graph, each task depends on all earlier tasks."""
+    for index, task in enumerate(tasks):
+        task.context = tasks[:index]
+    return tasks
+
+
+class DagCrew(Crew):
+    """Crew that runs its tasks as a dependency graph instead of one after another.
+
+    A task starts as soon as every task in its context has finished, so independent branches run
+    concurrently. Tasks must be in dependency order with explicit contexts, see build_task_graph.
+    """
+
+    memo_scope: Optional[str] = Field(default=None, description="Scope of memoized task outputs, memoization is off when unset.")
+
+    def _execute_tasks(self, tasks, start_index=0, was_replayed=False):
+        position = {id(task): index for index, task in enumerate(tasks)}
+        upstream = [
+            [position[id(dependency)] for dependency in task.context if id(dependency) in position]
+            if isinstance(task.context, list) else []
+            for task in tasks
+        ]
+
+        outputs = [None] * len(tasks)
+        for index, task in enumerate(tasks):
+            # Tasks that already carry an output, restored from a checkpoint or before a replay's start_index, are not run again
+            if task.output is not None:
+                outputs[index] = task.output
+
+        running = {}
+        pool = ThreadPoolExecutor(max_workers=DAG_MAX_PARALLEL_TASKS, thread_name_prefix="dag-task")
+        try:
+            while True:
+                started = set(running.values())
+                for index, task in enumerate(tasks):
+                    if outputs[index] is None and index not in started and all(outputs[dependency] is not None for dependency in upstream[index]):
+                        logger.debug("Starting task graph task %s", index)
+                        # Each task gets a copy of the caller's context so the execution scoped log routing follows it
+                        running[pool.submit(contextvars.copy_context().run, self._execute_graph_task, task)] = index
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    task_output = future.result()
+                    outputs[index] = task_output
+                    self._process_task_result(tasks[index], task_output)
+                    self._store_execution_log(tasks[index], task_output, index, was_replayed)
+
+        except Exception:
+            # Tasks that have not started are dropped, the ones in flight finish on their own
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+        pool.shutdown(wait=False)
+
+        if any(output is None for output in outputs):
+            raise ValueError("Task graph could not be completed, check the dependencies between agents")
+
+        return self._create_crew_output(outputs)
+
+    def _execute_graph_task(self, task):
+        memo_key = None
+        if self.memo_scope and task_memo and task_memo.memoizable(task):
+            memo_key = task_memo.key(self.memo_scope, task, task.context)
+            memoized = task_memo.get(memo_key)
+            if memoized is not None:
+                logger.info("Task output served from memo ---------------- %s", task.agent.role if task.agent else task.description[:50])
+                task.output = memoized
+                if task.callback:
+                    task.callback(memoized)
+                return memoized
+
+        agent_to_use = self._get_agent_to_use(task)
+        if agent_to_use is None:
+            raise ValueError(f"No agent available for task: {task.description}")
+
+        tools_for_task = self._prepare_tools(agent_to_use, task, task.tools or agent_to_use.tools or [])
+        self._log_task_start(task, agent_to_use.role)
+
+        task_output = task.execute_sync(
+            agent=agent_to_use,
+            context=self._get_context(task, []),
+            tools=tools_for_task,
+        )
+
+        if memo_key:
+            task_memo.put(memo_key, task_output)
+        return task_output
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import time
+from fastapi import HTTPException
+from helpers.cancellation import cancellation_registry
+from helpers.logger_config import logger
+
+# Seconds a stopping worker gives its running executions to finish before interrupting them
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "300"))
+# Touched by a preStop hook to drain every worker process of the pod before the stop signal arrives
+DRAIN_FILE = os.getenv("DRAIN_FILE", "/tmp/pipeline-drain")
+# Seconds interrupted executions get to stop at their next LLM call and record their outcome
+DRAIN_INTERRUPT_TIMEOUT = 30
+
+SHUTDOWN_REASON = "worker shutting down"
+
+
+class ExecutionInterrupted(HTTPException):
+    """An execution stopped because its worker shut down, the checkpoints of its completed tasks are kept."""
+
+    def __init__(self, executionId):
+        super().__init__(status_code=503, detail=f"Execution {executionId} was interrupted by a worker shutdown, retry to resume it")
+        self.executionId = executionId
+
+
+class DrainState:
+    """Whether this worker has stopped taking new executions."""
+
+    def __init__(self):
+        self.started_at = None
+
+    def start(self):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+            logger.info("---------------- Draining, no new executions are accepted ----------------")
+
+    def is_draining(self):
+        if self.started_at is None and os.path.exists(DRAIN_FILE):
+            self.start()
+        return self.started_at is not None
+
+
+drain_state = DrainState()
+
+
+async def drain(tasks, timeout=DRAIN_TIMEOUT):
+    """Waits for the running executions to finish, then interrupts the ones still running when the timeout
+    runs out and waits for them to stop. Returns the number of interrupted executions."""
+    pending = [task for task in tasks if not task.done()]
+    if not pending:
+        return 0
+
+    logger.info("Waiting up to %ss for %s running executions", timeout, len(pending))
+    _, pending = await asyncio.wait(pending, timeout=timeout)
+    if not pending:
+        return 0
+
+    logger.warning("Interrupting %s executions still running after the drain timeout", len(pending))
+    cancellation_registry.cancel_all(SHUTDOWN_REASON)
+    _, stuck = await asyncio.wait(pending, timeout=DRAIN_INTERRUPT_TIMEOUT)
+    if stuck:
+        logger.error("%s executions did not stop after being interrupted", len(stuck))
+    return len(pending)
@@ -0,0 +1,30 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class ExecutionContext:
+    """Per execution state that used to live on PipelineAILogs and secret_manager."""
+
+    executionId: Optional[str] = None
+    pipelineId: Optional[int] = None
+    sender: Optional[str] = None
+    access_key: str = ""
+
+
+_execution_context: ContextVar[ExecutionContext] = ContextVar("execution_context", default=ExecutionContext())
+
+
+def current_execution_context() -> ExecutionContext:
+    return _execution_context.get()
+
+
+def set_execution_context(context: ExecutionContext):
+    _execution_context.set(context)
+
+
+def bind_execution_context(**fields):
+    # Each request and each submitted execution runs in its own asyncio task with its own copy of
+    # the context, so binding here never leaks into a concurrent execution.
+    _execution_context.set(replace(_execution_context.get(), **fields))
@@ -0,0 +1,122 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+from helpers.logger_config import logger
+from helpers.redis_client import redis_client
+
+EXECUTION_STATE_TTL = int(os.getenv("EXECUTION_STATE_TTL", "86400"))
+# Seconds an API worker holds an execution without renewing it, after that a retry may take the execution over
+EXECUTION_LEASE_SECONDS = int(os.getenv("EXECUTION_LEASE_SECONDS", "60"))
+
+# Creates the execution unless it already succeeded or is queued or running under a valid lease.
+# Returns nothing when the caller now owns the execution, otherwise the status of the existing one.
+CLAIM_SCRIPT = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if status == 'SUCCESS' then
+    return status
+end
+if status and status ~= 'FAILED' then
+    local lease = tonumber(redis.call('HGET', KEYS[1], 'leaseUntil'))
+    if not lease or lease > tonumber(ARGV[1]) then
+        return status
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return false
+"""
+
+
+class ExecutionStatus:
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    SUCCESS = "SUCCESS"
+    FAILED = "FAILED"
+
+
+class ExecutionStore:
+    """Keeps the status and result of submitted executions in a Redis hash per executionId."""
+
+    key_prefix = "pipeline:execution:"
+
+    def __init__(self, redisClient):
+        self.redis_client = redisClient
+
+    def _key(self, executionId):
+        return self.key_prefix + executionId
+
+    def _now(self):
+        return datetime.now(timezone.utc).isoformat()
+
+    def _save(self, executionId, fields):
+        key = self._key(executionId)
+        pipe = self.redis_client.pipeline()
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, EXECUTION_STATE_TTL)
+        pipe.execute()
+
+    def claim(self, executionId, pipelineId, user, request, leased=False):
+        """Creates the execution state unless the executionId is already taken, see CLAIM_SCRIPT.
+
+        Leased executions are owned by an API worker that renews the lease while it runs them. Queued
+        executions are not leased, the job queue hands them to another worker when one crashes.
+        """
+        fields = {
+            "executionId": executionId,
+            "pipelineId": str(pipelineId),
+            "user": user or "",
+            "status": ExecutionStatus.QUEUED,
+            "request": json.dumps(request),
+            "submittedAt": self._now()
+        }
+        if leased:
+            fields["leaseUntil"] = str(time.time() + EXECUTION_LEASE_SECONDS)
+
+        arguments = [item for field in fields.items() for item in field]
+        existing = self.redis_client.eval(CLAIM_SCRIPT, 1, self._key(executionId), time.time(), EXECUTION_STATE_TTL, *arguments)
+        if existing is None:
+            logger.debug("Created execution state for %s", executionId)
+        return existing
+
+    def renew_lease(self, executionId):
+        self._save(executionId, {"leaseUntil": str(time.time() + EXECUTION_LEASE_SECONDS)})
+
+    @staticmethod
+    def is_abandoned(execution):
+        lease = execution.get("leaseUntil")
+        return execution["status"] in (ExecutionStatus.QUEUED, ExecutionStatus.RUNNING) and lease is not None and float(lease) < time.time()
+
+    def mark_queued(self, executionId):
+        self._save(executionId, {"status": ExecutionStatus.QUEUED})
+
+    def mark_running(self, executionId):
+        self._save(executionId, {"status": ExecutionStatus.RUNNING, "startedAt": self._now()})
+
+    def mark_succeeded(self, executionId, result):
+        self._save(executionId, {
+            "status": ExecutionStatus.SUCCESS,
+            "result": json.dumps(result),
+            "finishedAt": self._now()
+        })
+
+    def mark_failed(self, executionId, status_code, detail):
+        self._save(executionId, {
+            "status": ExecutionStatus.FAILED,
+            "error": json.dumps({"status_code": status_code, "detail": detail}, default=str),
+            "finishedAt": self._now()
+        })
+
+    def get(self, executionId):
+        record = self.redis_client.hgetall(self._key(executionId))
+        if not record:
+            return None
+
+        for field in ("request", "result", "error"):
+            if field in record:
+                record[field] = json.loads(record[field])
+        return record
+
+
+execution_store = ExecutionStore(redis_client) if redis_client else None
@@ -0,0 +1,83 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from helpers.logger_config import logger
+
+# "thread" runs blocking pipeline work on a thread pool inside the uvicorn worker,
+# "process" hands the whole crew run to a pool of child processes.
+EXECUTION_POOL_TYPE = os.getenv("EXECUTION_POOL_TYPE", "thread").lower()
+
+EXECUTION_POOL_SIZE = int(os.getenv("EXECUTION_POOL_SIZE", "10"))
+
+# Child processes are recycled after this many pipelines to release leaked memory
+EXECUTION_PROCESS_MAX_TASKS = int(os.getenv("EXECUTION_PROCESS_MAX_TASKS", "50"))
+
+
+def _initialize_child_process():
+    # A pipeline running inside a child process uses the child's own thread pool,
+    # otherwise it would try to hand itself to yet another process.
+    os.environ["EXECUTION_POOL_TYPE"] = "thread"
+
+
+class ExecutionPool:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        logger.info("---------------- Execution Pool ---------------- ")
+        logger.info("Execution pool type is %s and size is %s", EXECUTION_POOL_TYPE, EXECUTION_POOL_SIZE)
+
+        self.thread_pool = ThreadPoolExecutor(max_workers=EXECUTION_POOL_SIZE, thread_name_prefix="pipeline-worker")
+        # Lease renewals and heartbeats keep running executions alive, on the thread pool they would
+        # queue behind the crews they belong to once every worker is busy
+        self.control_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-control")
+        self.process_pool = None
+
+        if EXECUTION_POOL_TYPE == "process":
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=EXECUTION_POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_initialize_child_process,
+                max_tasks_per_child=EXECUTION_PROCESS_MAX_TASKS
+            )
+
+    @property
+    def uses_processes(self):
+        return self.process_pool is not None
+
+    async def run(self, func, *args, **kwargs):
+        """Runs a blocking callable on the thread pool without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        # Copy the caller's context so the execution context reaches tools, Printer and the parser
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.thread_pool, functools.partial(context.run, func, *args, **kwargs))
+
+    async def run_control(self, func, *args):
+        """Runs a short blocking bookkeeping call on its own thread, it never waits for a free pipeline worker."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.control_pool, func, *args)
+
+    async def run_isolated(self, func, *args):
+        """Runs a picklable top level callable on the process pool, or on the thread pool in thread mode."""
+        if not self.uses_processes:
+            return await self.run(func, *args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.process_pool, func, *args)
+
+    def shutdown(self):
+        self.thread_pool.shutdown(wait=False, cancel_futures=True)
+        self.control_pool.shutdown(wait=False, cancel_futures=True)
+        if self.process_pool:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+
+
+execution_pool = ExecutionPool()
@@ -1,14 +1,20 @@
-import boto3
+import asyncio
 import base64
+import time
 import json
-import httpx
 from langchain_core.documents import Document
 import os
 import zipfile
-import requests
 from helpers.logger_config import logger
 from PipelineModel.PipelineModel import PipelineModel
 from crewai import LLM as BaseLLM
+from helpers.executor import execution_pool
+from helpers.http_client import http_client
+from helpers.outbox import outbox
+from helpers.registry import provider_registry
+from helpers.llm_cache import llm_response_cache
+
+USE_BEDROCK_CREDENTIALS = os.getenv("USE_BEDROCK_CREDENTIALS", 'True')
 
 def decode_access_key(key):
     return base64.b64decode(key).decode("utf-8")
@@ -31,7 +37,7 @@ def create_embedder(payloadObject):
         "AmazonBedrock": lambda: {
             "provider": "bedrock",
             "config": {
-                "session": boto3.Session(
+                "session": provider_registry.get("boto3").Session(
                     aws_access_key_id=decode_access_key(payloadObject.embedding_aws_key),
                     aws_secret_access_key=decode_access_key(payloadObject.embedding_aws_secret_key),
                     region_name=payloadObject.embedding_aws_region
@@ -51,6 +57,50 @@ def create_embedder(payloadObject):
     return embedder
 
 
+def decode_embedding_keys(embedding):
+    """Copy of a masterEmbedding with its keys decoded, unlike agent embeddings it carries them base64 encoded."""
+    keys = ("embedding_api_key", "embedding_aws_key", "embedding_aws_secret_key")
+    return embedding.model_copy(update={key: decode_access_key(getattr(embedding, key)) for key in keys if getattr(embedding, key)})
+
+
+def embedding_function(embedding):
+    """The LangChain embeddings of an AgentEmbedding with plain keys, None when its aiEngine is not supported."""
+    if embedding.aiEngine == 'AzureOpenAI':
+        return provider_registry.get("AzureOpenAIEmbeddings")(
+            model=embedding.embedding_model,
+            azure_deployment=embedding.embedding_deployment_name,
+            openai_api_version=embedding.embedding_api_version,
+            api_key=embedding.embedding_api_key,
+            azure_endpoint=embedding.embedding_azure_endpoint
+        )
+
+    if embedding.aiEngine == 'AmazonBedrock':
+        if USE_BEDROCK_CREDENTIALS.lower() == 'true':
+            logger.debug("Bedrock Credentials are used. %s", USE_BEDROCK_CREDENTIALS)
+            client = provider_registry.get("boto3").client(
+                service_name='bedrock-runtime',
+                region_name=embedding.embedding_aws_region,
+                aws_access_key_id=embedding.embedding_aws_key,
+                aws_secret_access_key=embedding.embedding_aws_secret_key
+            )
+        else:
+            logger.debug("Bedrock Credentials are not used. %s", USE_BEDROCK_CREDENTIALS)
+            client = provider_registry.get("boto3").client(
+                service_name='bedrock-runtime',
+                region_name=embedding.embedding_aws_region
+            )
+        return provider_registry.get("BedrockEmbeddings")(model_id=embedding.embedding_model_id, client=client)
+
+    if embedding.aiEngine == 'GoogleAI':
+        return provider_registry.get("VertexAIEmbeddings")(
+            location=embedding.embedding_gcp_location,
+            project=embedding.embedding_gcp_project_id,
+            model_name=embedding.embedding_model_id
+        )
+
+    return None
+
+
 def parent_doc_retriever(docs):
 
     matching_documents = []
@@ -71,7 +121,7 @@ def parent_doc_retriever(docs):
 
     return matching_documents
 
-def save_initial_workflow_history(pipelineId, executionId, user, md_requests, adminUrl, access_key):
+async def save_initial_workflow_history(pipelineId, executionId, user, md_requests, adminUrl, access_key):
     try:
         data = {
             "pipelineId": pipelineId,
@@ -81,12 +131,12 @@ def save_initial_workflow_history(pipelineId, executionId, user, md_requests, ad
                 "request": json.dumps(md_requests)
             }
         }
-        response = httpx.post(adminUrl + '/ava/force/workflow/history', headers=get_headers(access_key), json=data)
+        response = await post_workflow_history(adminUrl, executionId, data, access_key)
         logger.info(f"save initial workflow history response : {response}")
     except Exception as e:
         logger.error(f"Error in save_initial_workflow_history: {e}")
 
-def save_payload_workflow_history(pipelineId, executionId, fullpayload, adminUrl, access_key):
+async def save_payload_workflow_history(pipelineId, executionId, fullpayload, adminUrl, access_key):
     try:
         data = {
             "pipelineId": pipelineId,
@@ -95,7 +145,7 @@ def save_payload_workflow_history(pipelineId, executionId, fullpayload, adminUrl
                 "full_payload": json.dumps(fullpayload)
             }
         }
-        response = httpx.post(adminUrl + '/ava/force/workflow/history', headers=get_headers(access_key), json=data)
+        response = await post_workflow_history(adminUrl, executionId, data, access_key)
         logger.info(f"save full payload workflow history response : {response}")
     except Exception as e:
         logger.error(f"Error in save_payload_workflow_history: {e}")
@@ -141,7 +191,7 @@ def mask_response(response: PipelineModel):
     return response
 
 
-def save_final_workflow_history(pipelineId, executionId, crew_output, finalResponse, adminUrl, access_key,upload_file_id):
+async def save_final_workflow_history(pipelineId, executionId, crew_output, finalResponse, adminUrl, access_key,upload_file_id):
     try:
 
         masked_response = mask_response(finalResponse)
@@ -157,11 +207,20 @@ def save_final_workflow_history(pipelineId, executionId, crew_output, finalRespo
                 "cached_prompt_tokens": crew_output[0].token_usage.cached_prompt_tokens,
                 "completion_tokens": crew_output[0].token_usage.completion_tokens,
                 "successful_requests": crew_output[0].token_usage.successful_requests,
+                "agent_token_usage": crew_output[2],
                 "upload_file_id": upload_file_id
             }
         }
+
+        if llm_response_cache:
+            llm_cache_stats = await execution_pool.run(llm_response_cache.pop_stats, executionId)
+            if llm_cache_stats:
+                data["record"]["llm_cache_hits"] = llm_cache_stats.get("hits", 0)
+                data["record"]["llm_cache_misses"] = llm_cache_stats.get("misses", 0)
+                data["record"]["llm_semantic_cache_hits"] = llm_cache_stats.get("semantic_hits", 0)
+                data["record"]["llm_semantic_cache_misses"] = llm_cache_stats.get("semantic_misses", 0)
     
-        response = httpx.post(adminUrl + '/ava/force/workflow/history', headers=get_headers(access_key), json=data)
+        response = await post_workflow_history(adminUrl, executionId, data, access_key)
         
         logger.info(f"save final workflow history response : {response}")
     
@@ -170,6 +229,15 @@ def save_final_workflow_history(pipelineId, executionId, crew_output, finalRespo
 
 
 
+async def post_workflow_history(adminUrl, executionId, data, access_key):
+    url = adminUrl + '/ava/force/workflow/history'
+    if outbox.enabled:
+        # Delivered by the outbox flusher, off the request path
+        await outbox.enqueue(executionId, "history", url, get_headers(access_key), data)
+        return "queued in outbox"
+    return await http_client.request("POST", url, "history", headers=get_headers(access_key), json=data)
+
+
 def get_headers(access_key):
     return {
         "Content-Type": "application/json",
@@ -177,7 +245,17 @@ def get_headers(access_key):
     }
 
 
-def zip_and_upload_folder(pipelineId, executionId, user, folder_path, access_key):
+def zip_folder(folder_path, zip_filename):
+    # Create a zip file containing the folder contents
+    with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for root, _, files in os.walk(folder_path):
+            for file in files:
+                file_path = os.path.join(root, file)
+                arcname = os.path.relpath(file_path, folder_path)
+                zipf.write(file_path, arcname)
+
+
+async def zip_and_upload_folder(pipelineId, executionId, user, folder_path, access_key):
     
     if not os.path.exists(folder_path):
 
@@ -188,15 +266,9 @@ def zip_and_upload_folder(pipelineId, executionId, user, folder_path, access_key
     zip_filename = f'{executionId}.zip'
     
     try:
-        # Create a zip file containing the folder contents
-        with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, _, files in os.walk(folder_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, folder_path)
-                    zipf.write(file_path, arcname)
+        # Compressing is CPU and disk bound, it runs on the execution pool while the upload stays on the loop
+        await execution_pool.run(zip_folder, folder_path, zip_filename)
 
-        
         # Define the file and form data
         with open(f"{zip_filename}", "rb") as file:
 
@@ -210,14 +282,14 @@ def zip_and_upload_folder(pipelineId, executionId, user, folder_path, access_key
             headers = {"access-Key":str(access_key)}
 
             # Upload the zip file to the endpoint
-            response = requests.post(upload_url, files=files, data=data, headers=headers)
+            response = await http_client.request("POST", upload_url, "upload", files=files, data=data, headers=headers)
 
         # Check if the request was successful
         if response.status_code == 201:
             file_id = response.json()
             return str(file_id)
         else:
-            raise Exception(f"File Upload failed with status code: {response.status_code}, reason: {response.reason}")
+            raise Exception(f"File Upload failed with status code: {response.status_code}, reason: {response.reason_phrase}")
 
     except Exception as e:
         logger.error(f"Exception while trying to create zip file : {e}")
@@ -228,20 +300,59 @@ def zip_and_upload_folder(pipelineId, executionId, user, folder_path, access_key
         if os.path.exists(zip_filename):
             os.remove(zip_filename)
 
-def send_execution_status(execution_id: str, status: str, instructionUrl: str, access_key: str):
+async def send_execution_status(execution_id: str, status: str, instructionUrl: str, access_key: str):
     try:
         status_url = f"{instructionUrl}/ava/force/workflow-executions/{execution_id}/status"
         
         data = {
             "status": status
         }
-        response = httpx.post(status_url, headers=get_headers(access_key), json=data)
+        if outbox.enabled:
+            await outbox.enqueue(execution_id, "status", status_url, get_headers(access_key), data)
+            return True
+
+        response = await http_client.request("POST", status_url, "status", headers=get_headers(access_key), json=data)
 
         return response.status_code == 200
     except Exception as e:
         logger.error(f"Error sending execution status for execution_id {execution_id}: {e}")
         return False
 
+def agent_token_usage(crew):
+    """Token usage of every agent of a finished crew and of its manager, to see what prompt caching saves per agent."""
+    agents = list(crew.agents) + ([crew.manager_agent] if crew.manager_agent else [])
+    usage = []
+    for agent in agents:
+        summary = agent._token_process.get_summary()
+        usage.append({
+            "agent": agent.role,
+            "total_tokens": summary.total_tokens,
+            "prompt_tokens": summary.prompt_tokens,
+            "cached_prompt_tokens": summary.cached_prompt_tokens,
+            "completion_tokens": summary.completion_tokens,
+            "successful_requests": summary.successful_requests,
+        })
+    return usage
+
+
+async def setup_agents_concurrently(setup, pipeLineAgents, **kwargs):
+    """Runs the blocking agent setup of every pipeline agent at the same time on the execution pool.
+
+    Returns the agents and tasks in pipeline order.
+    """
+    def timed_setup(agent_data):
+        started = time.perf_counter()
+        result = setup(agent=agent_data.agent, **kwargs)
+        logger.info("Agent %s set up in %.3f seconds", agent_data.agent.role, time.perf_counter() - started)
+        return result
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(execution_pool.run(timed_setup, agent_data) for agent_data in pipeLineAgents))
+    logger.info("Set up %s agents in %.3f seconds", len(results), time.perf_counter() - started)
+
+    return [agent for agent, _ in results], [task for _, task in results]
+
+
 class PatchedBedrockLLM(BaseLLM):
     def call(self, prompt: str, **kwargs):
         if isinstance(prompt, str):
@@ -255,4 +366,4 @@ class PatchedBedrockLLM(BaseLLM):
             raise ValueError("Invalid prompt format passed to Bedrock model")
         kwargs.pop("prompt", None)
         kwargs["messages"] = messages
-        return super().call(**kwargs)
\ No newline at end of file
+        return super().call(**kwargs)
\ No newline at end of file
@@ -0,0 +1,141 @@
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+import httpx
+from helpers.logger_config import logger
+
+HTTP_CLIENT_HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "False") == 'True'
+HTTP_CLIENT_MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "100"))
+HTTP_CLIENT_MAX_KEEPALIVE = int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE", "20"))
+
+
+# Errors raised before the request reached the server, retrying them cannot apply a request twice
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class EndpointPolicy:
+
+    def __init__(self, timeout, retries, retry_statuses=(502, 503, 504), retry_errors=(httpx.TransportError,)):
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_statuses = retry_statuses
+        self.retry_errors = retry_errors
+
+
+# Timeouts and retries per outbound integration. History and status POSTs are not idempotent and only carry
+# an Idempotency-Key through the outbox, so they are only retried when the server cannot have processed them
+ENDPOINT_POLICIES = {
+    "payload": EndpointPolicy(httpx.Timeout(connect=30.0, read=60.0, write=10.0, pool=5.0), retries=2),
+    "history": EndpointPolicy(httpx.Timeout(connect=10.0, read=30.0, write=30.0, pool=5.0), retries=2,
+                              retry_statuses=(503,), retry_errors=CONNECT_ERRORS),
+    "status": EndpointPolicy(httpx.Timeout(connect=5.0, read=10.0, write=10.0, pool=5.0), retries=3,
+                             retry_statuses=(503,), retry_errors=CONNECT_ERRORS),
+    "upload": EndpointPolicy(httpx.Timeout(connect=10.0, read=300.0, write=300.0, pool=5.0), retries=0),
+    "secrets": EndpointPolicy(httpx.Timeout(connect=5.0, read=15.0, write=10.0, pool=5.0), retries=2),
+}
+
+
+class HttpClient:
+    """One pooled keep-alive client for the admin, instructions and secrets APIs.
+
+    The async client belongs to the event loop that first uses it. request_sync lets code running on
+    worker threads (tools, AVASecret) use the same pool, and falls back to a pooled sync client where no
+    loop is serving the async one, e.g. inside a process pool child.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.http2 = HTTP_CLIENT_HTTP2 and importlib.util.find_spec("h2") is not None
+        if HTTP_CLIENT_HTTP2 and not self.http2:
+            logger.warning("HTTP_CLIENT_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+
+        self.limits = httpx.Limits(max_connections=HTTP_CLIENT_MAX_CONNECTIONS, max_keepalive_connections=HTTP_CLIENT_MAX_KEEPALIVE)
+        self.client = None
+        self.loop = None
+        self.sync_client = None
+        self.sync_lock = threading.Lock()
+
+    def get_client(self):
+        loop = asyncio.get_running_loop()
+        if self.client is None or self.loop is not loop:
+            # A new loop (asyncio.run in a process pool child) cannot use connections of the previous one
+            self.client = httpx.AsyncClient(http2=self.http2, limits=self.limits)
+            self.loop = loop
+        return self.client
+
+    def get_sync_client(self):
+        with self.sync_lock:
+            if self.sync_client is None:
+                self.sync_client = httpx.Client(http2=self.http2, limits=self.limits)
+            return self.sync_client
+
+    async def close_loop_client(self):
+        """Closes the async client of the running loop, for loops that end with their asyncio.run."""
+        if self.client is not None and self.loop is asyncio.get_running_loop():
+            client, self.client, self.loop = self.client, None, None
+            await client.aclose()
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            self.loop = None
+        if self.sync_client is not None:
+            self.sync_client.close()
+            self.sync_client = None
+
+    async def request(self, method, url, endpoint, **kwargs):
+        policy = ENDPOINT_POLICIES[endpoint]
+        client = self.get_client()
+
+        for attempt in range(policy.retries + 1):
+            try:
+                response = await client.request(method, url, timeout=policy.timeout, **kwargs)
+                if response.status_code not in policy.retry_statuses or attempt == policy.retries:
+                    return response
+                logger.warning("%s %s returned %s, retrying (%s/%s)", method, url, response.status_code, attempt + 1, policy.retries)
+
+            except policy.retry_errors as e:
+                if attempt == policy.retries:
+                    raise
+                logger.warning("%s %s failed with %s, retrying (%s/%s)", method, url, str(e), attempt + 1, policy.retries)
+
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    def request_sync(self, method, url, endpoint, **kwargs):
+        """Blocking variant for worker threads, must not be called from the event loop thread."""
+        loop = self.loop
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                raise RuntimeError("request_sync called from the event loop, use await http_client.request instead")
+            return asyncio.run_coroutine_threadsafe(self.request(method, url, endpoint, **kwargs), loop).result()
+
+        policy = ENDPOINT_POLICIES[endpoint]
+        client = self.get_sync_client()
+        for attempt in range(policy.retries + 1):
+            try:
+                response = client.request(method, url, timeout=policy.timeout, **kwargs)
+                if response.status_code not in policy.retry_statuses or attempt == policy.retries:
+                    return response
+
+            except policy.retry_errors:
+                if attempt == policy.retries:
+                    raise
+
+            time.sleep(0.5 * 2 ** attempt)
+
+
+http_client = HttpClient()
@@ -0,0 +1,112 @@
+import json
+import os
+import socket
+from cryptography.fernet import Fernet
+from redis.exceptions import ResponseError
+from helpers.logger_config import logger
+from helpers.redis_client import redis_client
+
+# When enabled the execute endpoints hand executions to pipeline_worker.py through a Redis Stream
+EXECUTION_QUEUE_MODE = os.getenv("EXECUTION_QUEUE_MODE", "False") == 'True'
+
+QUEUE_STREAM = os.getenv("QUEUE_STREAM", "pipeline:executions")
+QUEUE_GROUP = os.getenv("QUEUE_GROUP", "pipeline-workers")
+QUEUE_DEAD_LETTER_STREAM = QUEUE_STREAM + ":dead"
+
+# An entry whose consumer has not sent a heartbeat for this long is reassigned to another worker
+QUEUE_CLAIM_IDLE_MS = int(os.getenv("QUEUE_CLAIM_IDLE_MS", "300000"))
+
+# Entries delivered more often than this are moved to the dead letter stream instead of being run again
+QUEUE_MAX_DELIVERIES = int(os.getenv("QUEUE_MAX_DELIVERIES", "3"))
+
+QUEUE_MAX_LENGTH = int(os.getenv("QUEUE_MAX_LENGTH", "100000"))
+
+# Fernet key the access key of an entry is encrypted with, shared by the API and every queue worker.
+# The queue is not available without it.
+QUEUE_ENCRYPTION_KEY = os.getenv("QUEUE_ENCRYPTION_KEY")
+
+
+class JobQueue:
+    """Durable execution queue on a Redis Stream consumed through a consumer group.
+
+    Entries stay in the stream until they are acknowledged or trimmed, so the access key of the caller
+    is only stored encrypted.
+    """
+
+    def __init__(self, redisClient, encryption_key):
+        self.redis_client = redisClient
+        self.cipher = Fernet(encryption_key)
+
+    def ensure_group(self):
+        try:
+            self.redis_client.xgroup_create(QUEUE_STREAM, QUEUE_GROUP, id="0", mkstream=True)
+            logger.info("Created consumer group %s on stream %s", QUEUE_GROUP, QUEUE_STREAM)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def enqueue(self, request, access_key):
+        entry_id = self.redis_client.xadd(QUEUE_STREAM, {
+            "executionId": request["executionId"],
+            "request": json.dumps(request),
+            "access_key": self.cipher.encrypt((access_key or "").encode("utf-8")).decode("utf-8")
+        }, maxlen=QUEUE_MAX_LENGTH, approximate=True)
+        logger.info("Execution %s enqueued as ---------------- %s", request["executionId"], entry_id)
+        return entry_id
+
+    def access_key(self, fields):
+        """The access key of an entry, raises cryptography.fernet.InvalidToken when QUEUE_ENCRYPTION_KEY has changed."""
+        return self.cipher.decrypt(fields.get("access_key", "").encode("utf-8")).decode("utf-8") or None
+
+    def read(self, consumer, count=1, block_ms=5000):
+        response = self.redis_client.xreadgroup(QUEUE_GROUP, consumer, {QUEUE_STREAM: ">"}, count=count, block=block_ms)
+        if not response:
+            return []
+        return response[0][1]
+
+    def claim_stalled(self, consumer, count=1):
+        # XAUTOCLAIM returns [next_start_id, entries, deleted_ids] on Redis 7 and the first two on Redis 6.2
+        response = self.redis_client.xautoclaim(QUEUE_STREAM, QUEUE_GROUP, consumer, QUEUE_CLAIM_IDLE_MS, start_id="0-0", count=count)
+        entries = [entry for entry in response[1] if entry[1]]
+        for entry_id, _ in entries:
+            logger.warning("Claimed stalled execution entry ---------------- %s", entry_id)
+        return entries
+
+    def heartbeat(self, consumer, entry_id):
+        # Re-claiming an entry we already own resets its idle time so it is not handed to another worker
+        self.redis_client.xclaim(QUEUE_STREAM, QUEUE_GROUP, consumer, 0, [entry_id], justid=True)
+
+    def delivery_count(self, entry_id):
+        pending = self.redis_client.xpending_range(QUEUE_STREAM, QUEUE_GROUP, min=entry_id, max=entry_id, count=1)
+        return pending[0]["times_delivered"] if pending else 0
+
+    def ack(self, entry_id):
+        pipe = self.redis_client.pipeline()
+        pipe.xack(QUEUE_STREAM, QUEUE_GROUP, entry_id)
+        pipe.xdel(QUEUE_STREAM, entry_id)
+        pipe.execute()
+
+    def requeue(self, entry_id, fields):
+        # A fresh entry goes to the end of the stream without counting the interrupted delivery against it
+        new_entry_id = self.redis_client.xadd(QUEUE_STREAM, fields, maxlen=QUEUE_MAX_LENGTH, approximate=True)
+        self.ack(entry_id)
+        logger.info("Execution %s requeued as ---------------- %s", fields.get("executionId"), new_entry_id)
+        return new_entry_id
+
+    def dead_letter(self, entry_id, fields, reason):
+        logger.error("Moving execution entry %s to the dead letter stream: %s", entry_id, reason)
+        dead_fields = {key: value for key, value in fields.items() if key != "access_key"}
+        dead_fields["entryId"] = entry_id
+        dead_fields["reason"] = reason
+        self.redis_client.xadd(QUEUE_DEAD_LETTER_STREAM, dead_fields, maxlen=QUEUE_MAX_LENGTH, approximate=True)
+        self.ack(entry_id)
+
+
+def consumer_name(index=0):
+    return f"{socket.gethostname()}-{os.getpid()}-{index}"
+
+
+if EXECUTION_QUEUE_MODE and not QUEUE_ENCRYPTION_KEY:
+    logger.error("EXECUTION_QUEUE_MODE is set without QUEUE_ENCRYPTION_KEY, the execution queue is not available")
+
+job_queue = JobQueue(redis_client, QUEUE_ENCRYPTION_KEY) if redis_client and QUEUE_ENCRYPTION_KEY else None
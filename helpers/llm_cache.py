@@ -0,0 +1,145 @@
+import functools
+import hashlib
+import json
+import os
+import time
+from crewai import LLM
+from helpers.execution_context import current_execution_context
+from helpers.logger_config import logger
+from helpers.redis_client import redis_client
+
+# Seconds a cached LLM response is kept and the number of responses kept, the least recently used go first
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+INDEX_KEY = "pipeline:llmcache:index"
+STATS_TTL = 86400
+
+# Parameters that change the response of a call, credentials and endpoints are left out so a rotated key keeps its cache
+KEY_PARAMETERS = ("temperature", "top_p", "max_tokens", "max_completion_tokens", "stop", "seed", "response_format", "reasoning_effort")
+
+
+def normalize_messages(messages):
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+
+    normalized = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            # Line endings and surrounding whitespace do not change what the model is asked
+            content = content.replace("\r\n", "\n").strip()
+        normalized.append({"role": message.get("role"), "content": content})
+    return normalized
+
+
+class LLMResponseCache:
+    """Exact match cache of LLM responses in Redis for deterministic calls.
+
+    Only calls of an LLM opted in through its response_cache attribute at temperature 0 without native
+    tool calling are cached. Hits and misses are counted per execution for the workflow history.
+    """
+
+    def __init__(self, redis_client, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key(llm, messages):
+        content = json.dumps({
+            "class": type(llm).__name__,
+            "model": llm.model,
+            "parameters": {name: getattr(llm, name, None) for name in KEY_PARAMETERS},
+            "messages": normalize_messages(messages),
+        }, sort_keys=True, default=str)
+        return f"pipeline:llmcache:{hashlib.sha256(content.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def cacheable(llm, tools, available_functions):
+        return getattr(llm, "response_cache", False) and getattr(llm, "temperature", None) == 0 and not tools and not available_functions
+
+    @staticmethod
+    def stats_key(executionId):
+        return f"pipeline:llmcache:stats:{executionId}"
+
+    def get(self, key):
+        try:
+            response = self.redis_client.get(key)
+            if response is not None:
+                self.redis_client.zadd(INDEX_KEY, {key: time.time()}, xx=True)
+            return response
+        except Exception as e:
+            logger.error("Failed to read cached LLM response: %s", str(e))
+            return None
+
+    def put(self, key, response):
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.set(key, response, ex=self.ttl)
+            pipe.zadd(INDEX_KEY, {key: time.time()})
+            pipe.zcard(INDEX_KEY)
+            size = pipe.execute()[-1]
+
+            if size > self.max_entries:
+                evicted = [member for member, _ in self.redis_client.zpopmin(INDEX_KEY, size - self.max_entries)]
+                if evicted:
+                    self.redis_client.delete(*evicted)
+        except Exception as e:
+            logger.error("Failed to cache LLM response: %s", str(e))
+
+    def record(self, outcome):
+        executionId = current_execution_context().executionId
+        if not executionId:
+            return
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.hincrby(self.stats_key(executionId), outcome, 1)
+            pipe.expire(self.stats_key(executionId), STATS_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.error("Failed to count LLM cache %s: %s", outcome, str(e))
+
+    def pop_stats(self, executionId):
+        """Hit and miss counts of the execution, empty when it made no cacheable call."""
+        pipe = self.redis_client.pipeline()
+        pipe.hgetall(self.stats_key(executionId))
+        pipe.delete(self.stats_key(executionId))
+        stats = pipe.execute()[0]
+        return {outcome: int(count) for outcome, count in stats.items()}
+
+
+llm_response_cache = LLMResponseCache(redis_client) if redis_client else None
+
+
+def cache_llm_calls():
+    """Serves repeated deterministic LLM calls from llm_response_cache, see LLMResponseCache."""
+    if llm_response_cache is None or getattr(LLM.call, "response_cache", False):
+        return
+
+    uncached = LLM.call
+
+    @functools.wraps(uncached)
+    def call(self, *args, **kwargs):
+        messages = kwargs.get("messages", args[0] if args else None)
+        tools = kwargs.get("tools", args[1] if len(args) > 1 else None)
+        available_functions = kwargs.get("available_functions", args[3] if len(args) > 3 else None)
+
+        if messages is None or not llm_response_cache.cacheable(self, tools, available_functions):
+            return uncached(self, *args, **kwargs)
+
+        key = llm_response_cache.key(self, messages)
+        cached = llm_response_cache.get(key)
+        if cached is not None:
+            logger.debug("LLM response served from cache for %s", self.model)
+            llm_response_cache.record("hits")
+            return cached
+
+        llm_response_cache.record("misses")
+        response = uncached(self, *args, **kwargs)
+        if isinstance(response, str) and response:
+            llm_response_cache.put(key, response)
+        return response
+
+    call.response_cache = True
+    LLM.call = call
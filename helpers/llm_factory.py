@@ -0,0 +1,138 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from crewai import LLM
+from helpers.helpers import PatchedBedrockLLM
+from helpers.logger_config import logger
+
+USE_BEDROCK_CREDENTIALS = os.getenv("USE_BEDROCK_CREDENTIALS", 'True')
+# Distinct LLM configurations kept per worker
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "128"))
+# Marks the system prompt of Bedrock Claude calls as a cache point, Azure OpenAI caches repeated prefixes without a marker
+PROMPT_CACHING = os.getenv("PROMPT_CACHING", 'True')
+
+# litellm turns this into a cachePoint after the system prompt of a Bedrock converse request
+SYSTEM_PROMPT_CACHE_POINT = [{"location": "message", "role": "system"}]
+
+
+def with_prompt_caching(config, bedrock_model_id):
+    if PROMPT_CACHING == 'True' and ("claude" in bedrock_model_id.lower() or "anthropic" in bedrock_model_id.lower()):
+        return {**config, "cache_control_injection_points": SYSTEM_PROMPT_CACHE_POINT}
+    return config
+
+
+def llm_config(llm_details):
+    """The LLM class and constructor arguments for an agentLLM definition, without the per run metadata."""
+    if llm_details.aiEngine == 'AzureOpenAI':
+        if "o1" in llm_details.model or "o3" in llm_details.model:
+            return LLM, {
+                "model": "azure/" + llm_details.llmDeploymentName,
+                "base_url": llm_details.azureEndpoint,
+                "api_key": llm_details.apiKey,
+                "api_version": llm_details.llmApiVersion,
+            }
+        if "deepseek" in llm_details.model.lower():
+            return LLM, {
+                "model": llm_details.model,
+                "temperature": llm_details.temperature,
+                "max_tokens": llm_details.maxToken,
+                "base_url": llm_details.azureEndpoint,
+                "api_key": llm_details.apiKey,
+            }
+        return LLM, {
+            "model": "azure/" + llm_details.llmDeploymentName,
+            "temperature": llm_details.temperature,
+            "max_tokens": llm_details.maxToken,
+            "base_url": llm_details.azureEndpoint,
+            "api_key": llm_details.apiKey,
+            "api_version": llm_details.llmApiVersion,
+        }
+
+    if llm_details.aiEngine == 'AmazonBedrock':
+        config = {
+            "model": "bedrock/" + llm_details.bedrockModelId,
+            "aws_region_name": llm_details.region,
+            "max_tokens": llm_details.maxToken,
+            "temperature": llm_details.temperature,
+            "top_p": llm_details.topP,
+        }
+        if USE_BEDROCK_CREDENTIALS.lower() != 'true':
+            logger.debug("Bedrock Credentials are not used. %s", USE_BEDROCK_CREDENTIALS)
+            return LLM, with_prompt_caching(config, llm_details.bedrockModelId)
+
+        logger.debug("Bedrock Credentials are used. %s", USE_BEDROCK_CREDENTIALS)
+        config["aws_access_key_id"] = llm_details.accessKey
+        config["aws_secret_access_key"] = llm_details.secretKey
+        if 'llama' in llm_details.bedrockModelId.lower():
+            logger.debug("Using Patched Bedrock LLM for Llama model")
+            return PatchedBedrockLLM, config
+        return LLM, with_prompt_caching(config, llm_details.bedrockModelId)
+
+    if llm_details.aiEngine == 'GoogleAI':
+        return LLM, {
+            "model": "vertex_ai/" + llm_details.model,
+            "gcp_project_id": llm_details.gcpProjectId,
+            "temperature": llm_details.temperature,
+            "max_tokens": llm_details.maxToken,
+            "location": llm_details.gcpLocation,
+        }
+
+    raise ValueError(f"Unsupported LLM type {llm_details.aiEngine}")
+
+
+def bind_metadata(llm, langfuse_config):
+    # The LLM object is only configuration, a shallow copy is enough to give the run its own langfuse metadata
+    llm = copy.copy(llm)
+    if "metadata" in llm.additional_params:
+        llm.additional_params = {**llm.additional_params, "metadata": langfuse_config}
+    return llm
+
+
+class LLMFactory:
+    """Builds the LLM of an agent or crew manager and pools it by a hash of its configuration.
+
+    Agents of any pipeline with the same model and credentials share one instance, so litellm sees the
+    same configuration on every call and reuses its provider clients and their connections. The langfuse
+    metadata of a run is bound to a shallow copy by create().
+    """
+
+    def __init__(self, max_size=LLM_POOL_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(llm_class, config):
+        content = json.dumps({"class": llm_class.__name__, **config}, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, llm_details):
+        """The pooled LLM for the definition, without run metadata."""
+        llm_class, config = llm_config(llm_details)
+        key = self.key(llm_class, config)
+
+        with self.lock:
+            llm = self.entries.get(key)
+            if llm is not None:
+                self.entries.move_to_end(key)
+                return llm
+
+        # The patched Llama LLM has never carried metadata, the others get a placeholder bound per run
+        llm = llm_class(**config) if llm_class is PatchedBedrockLLM else llm_class(**config, metadata={})
+        logger.debug("Created pooled LLM for %s", config["model"])
+
+        with self.lock:
+            llm = self.entries.setdefault(key, llm)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return llm
+
+    def create(self, llm_details, langfuse_config):
+        return bind_metadata(self.get(llm_details), langfuse_config)
+
+
+llm_factory = LLMFactory()
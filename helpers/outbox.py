@@ -0,0 +1,244 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.fernet import Fernet, InvalidToken
+from helpers.logger_config import logger
+from helpers.http_client import http_client
+
+# When enabled workflow history and execution status callbacks are written to a local outbox
+# and delivered by a background flusher instead of on the request path.
+ENABLE_OUTBOX = os.getenv("ENABLE_OUTBOX", "False") == 'True'
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.db")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+# Seconds dead records are kept for inspection before they are purged
+OUTBOX_DEAD_RETENTION = int(os.getenv("OUTBOX_DEAD_RETENTION", "604800"))
+# Fernet key the request headers are encrypted with, they carry the access-key of the execution.
+# Shared by every worker of a pod, the outbox stays disabled without it.
+OUTBOX_ENCRYPTION_KEY = os.getenv("OUTBOX_ENCRYPTION_KEY")
+
+# A claimed batch is released to other workers if it is not settled within this many seconds
+OUTBOX_CLAIM_LEASE = 120
+OUTBOX_PURGE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    execution_id TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    url TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    body TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (dead, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_execution ON outbox (execution_id, id);
+"""
+
+
+class Outbox:
+    """Durable SQLite outbox shared by the uvicorn workers of a pod.
+
+    Records of one execution are delivered in the order they were written, a record is only claimed
+    together with every earlier live record of the same execution, and the rest of a claimed run is
+    released when one of them fails. Request headers are stored encrypted.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.cipher = Fernet(OUTBOX_ENCRYPTION_KEY) if OUTBOX_ENCRYPTION_KEY else None
+        self.enabled = ENABLE_OUTBOX and self.cipher is not None
+        if ENABLE_OUTBOX and self.cipher is None:
+            logger.error("ENABLE_OUTBOX is set without OUTBOX_ENCRYPTION_KEY, callbacks are sent directly")
+        # SQLite calls are short but blocking, they get their own thread so a busy execution pool cannot delay them
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self.connection = None
+        self.flusher = None
+        self.stopping = None
+        self.purged_at = 0.0
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(OUTBOX_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _insert(self, execution_id, endpoint, url, headers, body):
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO outbox (idempotency_key, execution_id, endpoint, url, headers, body, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (str(uuid.uuid4()), str(execution_id), endpoint, url, self.cipher.encrypt(json.dumps(headers).encode("utf-8")).decode("utf-8"), json.dumps(body), now, now)
+        )
+
+    async def enqueue(self, execution_id, endpoint, url, headers, body):
+        await self._run(self._insert, execution_id, endpoint, url, headers, body)
+        logger.debug("Outbox record queued for %s ---------------- %s", endpoint, execution_id)
+
+    def _claim(self):
+        now = time.time()
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                """
+                UPDATE outbox SET claimed_until = ?
+                WHERE id IN (
+                    SELECT id FROM outbox AS o
+                    WHERE o.dead = 0 AND o.next_attempt_at <= ? AND o.claimed_until <= ?
+                    AND NOT EXISTS (
+                        SELECT 1 FROM outbox AS earlier
+                        WHERE earlier.execution_id = o.execution_id AND earlier.id < o.id AND earlier.dead = 0
+                        AND (earlier.next_attempt_at > ? OR earlier.claimed_until > ?)
+                    )
+                    ORDER BY o.id LIMIT ?
+                )
+                RETURNING id, idempotency_key, execution_id, endpoint, url, headers, body, attempts
+                """,
+                (now + OUTBOX_CLAIM_LEASE, now, now, now, now, OUTBOX_BATCH_SIZE)
+            ).fetchall()
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return sorted(rows)
+
+    def _delivered(self, record_id):
+        self._connect().execute("DELETE FROM outbox WHERE id = ?", (record_id,))
+
+    def _failed(self, record_id, attempts, error, retryable):
+        dead = 1 if not retryable or attempts >= OUTBOX_MAX_ATTEMPTS else 0
+        # A dead record keeps the time it died, the purge counts its retention from there
+        backoff = 0 if dead else min(2 ** attempts, 300)
+        self._connect().execute(
+            "UPDATE outbox SET attempts = ?, last_error = ?, dead = ?, claimed_until = 0, next_attempt_at = ? WHERE id = ?",
+            (attempts, error, dead, time.time() + backoff, record_id)
+        )
+        return dead
+
+    def _purge(self):
+        return self._connect().execute(
+            "DELETE FROM outbox WHERE dead = 1 AND next_attempt_at < ?", (time.time() - OUTBOX_DEAD_RETENTION,)
+        ).rowcount
+
+    async def purge(self):
+        purged = await self._run(self._purge)
+        if purged:
+            logger.info("Purged %s dead outbox records", purged)
+        return purged
+
+    async def _deliver(self, row):
+        record_id, idempotency_key, execution_id, endpoint, url, headers, body, attempts = row
+
+        try:
+            headers = {**json.loads(self.cipher.decrypt(headers.encode("utf-8"))), "Idempotency-Key": idempotency_key}
+            response = await http_client.request("POST", url, endpoint, headers=headers, json=json.loads(body))
+            if response.is_success:
+                await self._run(self._delivered, record_id)
+                return True
+            error = f"{response.status_code} {response.text[:500]}"
+            retryable = response.status_code >= 500 or response.status_code in (408, 429)
+
+        except InvalidToken:
+            error = "headers cannot be decrypted, OUTBOX_ENCRYPTION_KEY has changed"
+            retryable = False
+
+        except Exception as e:
+            error = str(e)
+            retryable = True
+
+        dead = await self._run(self._failed, record_id, attempts + 1, error, retryable)
+        if dead:
+            logger.error("Outbox record %s for execution %s dropped after %s attempts: %s", endpoint, execution_id, attempts + 1, error)
+        else:
+            logger.warning("Outbox record %s for execution %s failed, will retry: %s", endpoint, execution_id, error)
+        return False
+
+    async def flush(self):
+        rows = await self._run(self._claim)
+        if not rows:
+            return 0
+
+        # Executions are delivered concurrently, the records of one execution in order
+        by_execution = {}
+        for row in rows:
+            by_execution.setdefault(row[2], []).append(row)
+
+        async def deliver_in_order(execution_rows):
+            for index, row in enumerate(execution_rows):
+                if not await self._deliver(row):
+                    # Release the rest of this execution, they are claimed again once the failed record is settled
+                    await self._run(self._release, [later[0] for later in execution_rows[index + 1:]])
+                    return
+
+        await asyncio.gather(*(deliver_in_order(execution_rows) for execution_rows in by_execution.values()))
+        return len(rows)
+
+    def _release(self, record_ids):
+        if record_ids:
+            self._connect().executemany("UPDATE outbox SET claimed_until = 0 WHERE id = ?", [(record_id,) for record_id in record_ids])
+
+    async def _flush_loop(self):
+        while not self.stopping.is_set():
+            try:
+                claimed = await self.flush()
+            except Exception as e:
+                logger.error("Outbox flush failed: %s", str(e))
+                claimed = 0
+
+            if time.monotonic() - self.purged_at >= OUTBOX_PURGE_INTERVAL:
+                self.purged_at = time.monotonic()
+                try:
+                    await self.purge()
+                except Exception as e:
+                    logger.error("Outbox purge failed: %s", str(e))
+
+            if claimed < OUTBOX_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), timeout=OUTBOX_FLUSH_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        if not self.enabled or self.flusher is not None:
+            return
+        logger.info("---------------- Outbox flusher started ---------------- %s", OUTBOX_PATH)
+        self.stopping = asyncio.Event()
+        self.flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.flusher is None:
+            return
+        self.stopping.set()
+        await self.flusher
+        self.flusher = None
+
+        # One last attempt so records written just before shutdown are not left for the next start
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error("Final outbox flush failed: %s", str(e))
+
+
+outbox = Outbox()
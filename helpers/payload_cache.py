@@ -0,0 +1,97 @@
+import asyncio
+import copy
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from helpers.logger_config import logger
+
+# Seconds a payload is served without asking the admin API, after that it is revalidated with If-None-Match
+PAYLOAD_CACHE_TTL = float(os.getenv("PAYLOAD_CACHE_TTL", "30"))
+PAYLOAD_CACHE_SIZE = int(os.getenv("PAYLOAD_CACHE_SIZE", "1024"))
+
+
+class CachedPayload:
+
+    def __init__(self, payload, etag, last_modified):
+        self.payload = payload
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.monotonic()
+
+    def is_fresh(self):
+        return time.monotonic() - self.fetched_at < PAYLOAD_CACHE_TTL
+
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PayloadCache:
+    """Caches admin pipeline payloads and collapses concurrent fetches of the same pipeline into one request.
+
+    Entries are keyed by pipeline id and a hash of the access key, so a payload is only served to
+    callers that presented the same key when it was fetched.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.inflight = {}
+
+    @staticmethod
+    def key(pipeLineId, access_key):
+        return (str(pipeLineId), hashlib.sha256(access_key.encode("utf-8")).hexdigest())
+
+    async def get(self, pipeLineId, access_key, fetch):
+        """Returns a copy of the payload, fetch(headers) performs the admin request with the given conditional headers."""
+        key = self.key(pipeLineId, access_key)
+
+        entry = self.entries.get(key)
+        if entry is not None and entry.is_fresh():
+            self.entries.move_to_end(key)
+            logger.debug("Pipeline payload cache hit ---------------- %s", pipeLineId)
+            return copy.deepcopy(entry.payload)
+
+        inflight = self.inflight.get(key)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._refresh(key, entry, fetch))
+            self.inflight[key] = inflight
+            inflight.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            logger.debug("Joining in flight pipeline payload fetch ---------------- %s", pipeLineId)
+
+        # Shielded so a caller that disconnects does not cancel the fetch other callers are waiting on
+        payload = await asyncio.shield(inflight)
+        return copy.deepcopy(payload)
+
+    async def _refresh(self, key, entry, fetch):
+        response = await fetch(entry.validators() if entry else {})
+
+        if response.status_code == 304 and entry is not None:
+            logger.debug("Pipeline payload not modified ---------------- %s", key[0])
+            entry.fetched_at = time.monotonic()
+            self.entries.move_to_end(key)
+            return entry.payload
+
+        payload = response.json()
+        self.entries[key] = CachedPayload(payload, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return payload
+
+    def invalidate(self, pipeLineId=None):
+        if pipeLineId is None:
+            self.entries.clear()
+            return
+
+        for key in [key for key in self.entries if key[0] == str(pipeLineId)]:
+            del self.entries[key]
+
+
+payload_cache = PayloadCache(PAYLOAD_CACHE_SIZE)
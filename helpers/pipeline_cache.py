@@ -0,0 +1,114 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from helpers.llm_factory import bind_metadata
+from helpers.logger_config import logger
+from helpers.redis_client import redis_client
+
+PIPELINE_CACHE_ENABLED = os.getenv("PIPELINE_CACHE_ENABLED", "True") == 'True'
+PIPELINE_CACHE_SIZE = int(os.getenv("PIPELINE_CACHE_SIZE", "256"))
+
+# Invalidations are broadcast on this channel so every uvicorn worker drops its copy
+INVALIDATION_CHANNEL = "pipeline:cache:invalidate"
+
+
+class PerRunTool:
+    """Placeholder in a compiled toolbox for a tool that holds per execution state and is built on every run."""
+
+    def __init__(self, build):
+        self.build = build
+
+
+class CompiledAgent:
+    """The parts of an agent that only depend on its definition: the LLM, the static agent arguments
+    with the tool instructions in the backstory, the task template and the tools that can be shared
+    between executions."""
+
+    def __init__(self, llm, agent_args, task_template, tools, expected_output, embedding=None, uses_memory_tool=False):
+        self.llm = llm
+        self.agent_args = agent_args
+        self.task_template = task_template
+        self.tools = tools
+        self.expected_output = expected_output
+        self.embedding = embedding
+        self.uses_memory_tool = uses_memory_tool
+
+    def bind_llm(self, langfuse_config):
+        return bind_metadata(self.llm, langfuse_config)
+
+    def bind_task(self, userInputs):
+        task = self.task_template
+        for key, value in userInputs.items():
+            task = task.replace(key, value)
+        return task
+
+    def bind_tools(self, executionId, llm):
+        return [tool.build(executionId, llm) if isinstance(tool, PerRunTool) else tool for tool in self.tools]
+
+
+class PipelineCache:
+    """LRU cache of compiled agents keyed by pipeline id, a hash of the agent definition and the variant."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(pipelineId, agent, variant):
+        digest = hashlib.sha256(agent.model_dump_json().encode("utf-8")).hexdigest()
+        return (str(pipelineId), digest, variant)
+
+    def get_or_compile(self, key, compile_agent):
+        if not PIPELINE_CACHE_ENABLED:
+            return compile_agent()
+
+        with self.lock:
+            compiled = self.entries.get(key)
+            if compiled is not None:
+                self.entries.move_to_end(key)
+                logger.debug("Compiled agent cache hit for pipeline %s", key[0])
+                return compiled
+
+        # Compiled outside the lock, a concurrent miss on the same key only costs a duplicate compile
+        compiled = compile_agent()
+
+        with self.lock:
+            self.entries[key] = compiled
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return compiled
+
+    def invalidate(self, pipelineId=None, broadcast=True):
+        with self.lock:
+            if pipelineId is None:
+                removed = len(self.entries)
+                self.entries.clear()
+            else:
+                keys = [key for key in self.entries if key[0] == str(pipelineId)]
+                for key in keys:
+                    del self.entries[key]
+                removed = len(keys)
+
+        logger.info("Invalidated %s compiled agents for pipeline ---------------- %s", removed, pipelineId or "all")
+
+        if broadcast and redis_client:
+            redis_client.publish(INVALIDATION_CHANNEL, "" if pipelineId is None else str(pipelineId))
+        return removed
+
+    def listen_for_invalidations(self):
+        """Subscribes this worker to invalidations triggered on other workers, returns the listener thread."""
+        if not redis_client:
+            return None
+
+        def on_invalidate(message):
+            self.invalidate(message["data"] or None, broadcast=False)
+
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{INVALIDATION_CHANNEL: on_invalidate})
+        return pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+
+pipeline_cache = PipelineCache(PIPELINE_CACHE_SIZE)
@@ -0,0 +1,224 @@
+import functools
+import hashlib
+import json
+import os
+import time
+from crewai import LLM
+from litellm import token_counter
+from litellm.exceptions import RateLimitError
+from helpers.cancellation import current_cancellation_scope, CANCEL_POLL_INTERVAL
+from helpers.logger_config import logger
+from helpers.redis_client import redis_client
+
+# Requests and tokens per minute allowed per LLM deployment across all workers and pods, 0 disables a limit.
+# LLM_RATE_LIMITS overrides them per model, e.g. {"azure/gpt-4o": {"rpm": 300, "tpm": 150000}}.
+LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+LLM_RATE_LIMIT_TPM = int(os.getenv("LLM_RATE_LIMIT_TPM", "0"))
+LLM_RATE_LIMITS = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+# Seconds a call waits for capacity before it is sent anyway, and retries of a call the provider rejected with a 429
+LLM_RATE_LIMIT_MAX_WAIT = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT", "60"))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+
+RATE_LIMIT_BACKOFF = 2
+BUCKET_TTL = 120
+# Calls sent without capacity after LLM_RATE_LIMIT_MAX_WAIT, counted per deployment across all workers
+OVERRUNS_KEY = "pipeline:ratelimit:overruns"
+
+# Two token buckets in one hash, requests and tokens, each refilled at its limit per minute up to one minute
+# of capacity. "acquire" takes one request and the prompt tokens when both are available and otherwise
+# returns the seconds until they are, "charge" takes the completion tokens after the call and may leave
+# the token bucket in debt, "drain" empties both buckets after the provider returned a 429.
+# Redis time is used so every pod refills the bucket on the same clock.
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local mode = ARGV[4]
+
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'at')
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+
+local function refill(level, limit)
+    if limit <= 0 then
+        return 0
+    end
+    if level == nil then
+        return limit
+    end
+    return math.min(limit, level + elapsed * limit / 60)
+end
+
+local requests = refill(tonumber(state[1]), rpm)
+local tokens = refill(tonumber(state[2]), tpm)
+local wait = 0
+
+if mode == 'acquire' then
+    if rpm > 0 and requests < 1 then
+        wait = math.max(wait, (1 - requests) * 60 / rpm)
+    end
+    local needed = math.min(cost, tpm)
+    if tpm > 0 and tokens < needed then
+        wait = math.max(wait, (needed - tokens) * 60 / tpm)
+    end
+    if wait == 0 then
+        if rpm > 0 then
+            requests = requests - 1
+        end
+        if tpm > 0 then
+            tokens = tokens - cost
+        end
+    end
+elseif mode == 'charge' then
+    if tpm > 0 then
+        tokens = tokens - cost
+    end
+elseif mode == 'drain' then
+    requests = math.min(requests, 0)
+    tokens = math.min(tokens, 0)
+end
+
+redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', tokens, 'at', now)
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return tostring(wait)
+"""
+
+
+def deployment(llm):
+    """The model and the endpoint or region it is served from, the unit providers enforce their quota on."""
+    params = llm.additional_params or {}
+    endpoint = llm.base_url or llm.api_base or params.get("aws_region_name") or params.get("location") or ""
+    return f"{llm.model}@{endpoint}"
+
+
+def count_tokens(model, messages=None, text=None):
+    if isinstance(messages, str):
+        messages, text = None, messages
+    try:
+        return token_counter(model=model, messages=messages, text=text)
+    except Exception:
+        # Unknown tokenizer, four characters per token is close enough to pace the calls
+        content = text if text is not None else json.dumps(messages, default=str)
+        return len(content) // 4
+
+
+class LLMRateLimiter:
+    """Paces LLM calls per deployment with a token bucket in Redis shared by every worker.
+
+    A call waits until its deployment has a request and the estimated prompt tokens left in the current
+    minute, the completion tokens are charged once the response is in. A call the provider still rejects
+    with a rate limit error is retried after a backoff instead of failing the execution.
+    """
+
+    def __init__(self, redis_client, max_wait=LLM_RATE_LIMIT_MAX_WAIT, retries=LLM_RATE_LIMIT_RETRIES):
+        self.redis_client = redis_client
+        self.max_wait = max_wait
+        self.retries = retries
+
+    @staticmethod
+    def limits(llm):
+        limits = LLM_RATE_LIMITS.get(llm.model, {})
+        return int(limits.get("rpm", LLM_RATE_LIMIT_RPM)), int(limits.get("tpm", LLM_RATE_LIMIT_TPM))
+
+    @staticmethod
+    def key(llm):
+        return f"pipeline:ratelimit:{hashlib.sha256(deployment(llm).encode('utf-8')).hexdigest()}"
+
+    def bucket(self, llm, rpm, tpm, tokens, mode):
+        try:
+            return float(self.redis_client.eval(TOKEN_BUCKET_SCRIPT, 1, self.key(llm), rpm, tpm, tokens, mode, BUCKET_TTL))
+        except Exception as e:
+            # Pacing is best effort, an unreachable Redis must not stop the calls
+            logger.error("Failed to update rate limit of %s: %s", llm.model, str(e))
+            return 0.0
+
+    def acquire(self, llm, tokens):
+        rpm, tpm = self.limits(llm)
+        if not rpm and not tpm:
+            return
+
+        started = time.monotonic()
+        while True:
+            wait = self.bucket(llm, rpm, tpm, tokens, "acquire")
+            if wait <= 0:
+                return
+
+            waited = time.monotonic() - started
+            if waited + wait > self.max_wait:
+                self.overrun(llm, waited)
+                return
+            self.sleep(wait)
+
+    def overrun(self, llm, waited):
+        try:
+            overruns = self.redis_client.hincrby(OVERRUNS_KEY, deployment(llm), 1)
+        except Exception:
+            overruns = None
+        logger.error("Sending LLM call to %s over its rate limit after waiting %.1f seconds, %s calls sent over the limit so far",
+                     deployment(llm), waited, overruns if overruns is not None else "unknown")
+
+    def charge(self, llm, tokens):
+        rpm, tpm = self.limits(llm)
+        if tpm and tokens:
+            self.bucket(llm, rpm, tpm, tokens, "charge")
+
+    def drain(self, llm):
+        rpm, tpm = self.limits(llm)
+        if rpm or tpm:
+            self.bucket(llm, rpm, tpm, 0, "drain")
+
+    @staticmethod
+    def sleep(seconds):
+        # Waits in slices so a cancelled or over budget execution stops waiting
+        deadline = time.monotonic() + seconds
+        scope = current_cancellation_scope()
+        while True:
+            if scope is not None:
+                scope.check()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, CANCEL_POLL_INTERVAL))
+
+    def call(self, limited, llm, messages, *args, **kwargs):
+        rpm, tpm = self.limits(llm)
+        # Tokens are only counted for a token limit, without any limit a call is just retried on a 429
+        prompt_tokens = count_tokens(llm.model, messages=messages) if tpm and messages is not None else 0
+
+        for attempt in range(self.retries + 1):
+            self.acquire(llm, prompt_tokens)
+            try:
+                response = limited(llm, *args, **kwargs)
+            except RateLimitError as e:
+                if attempt == self.retries:
+                    raise
+                backoff = RATE_LIMIT_BACKOFF * 2 ** attempt
+                logger.warning("Rate limited by %s, retrying in %s seconds: %s", deployment(llm), backoff, str(e))
+                # Every worker holds back until the bucket refills, not only the one that got the 429
+                self.drain(llm)
+                self.sleep(backoff)
+                continue
+
+            if tpm and isinstance(response, str):
+                self.charge(llm, count_tokens(llm.model, text=response))
+            return response
+
+
+llm_rate_limiter = LLMRateLimiter(redis_client) if redis_client else None
+
+
+def rate_limit_llm_calls():
+    """Routes every crewai LLM call through llm_rate_limiter, see LLMRateLimiter."""
+    if llm_rate_limiter is None or getattr(LLM.call, "rate_limiter", False):
+        return
+
+    unlimited = LLM.call
+
+    @functools.wraps(unlimited)
+    def call(self, *args, **kwargs):
+        messages = kwargs.get("messages", args[0] if args else None)
+        return llm_rate_limiter.call(unlimited, self, messages, *args, **kwargs)
+
+    call.rate_limiter = True
+    LLM.call = call
@@ -0,0 +1,59 @@
+import importlib
+import threading
+import time
+from helpers.logger_config import logger
+
+
+class LazyRegistry:
+    """Maps names to "module:attribute" paths that are only imported on first use.
+
+    Tools and providers most executions never touch stay out of worker startup, the first pipeline
+    using one pays for its import and later lookups are a dict read. A path without an attribute
+    resolves to the module itself.
+    """
+
+    def __init__(self, kind, entries):
+        self.kind = kind
+        self.entries = dict(entries)
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def get(self, name):
+        loaded = self.loaded.get(name)
+        if loaded is not None:
+            return loaded
+
+        if name not in self.entries:
+            raise KeyError(f"Unknown {self.kind} {name}")
+
+        # Agents are set up concurrently, the lock keeps two of them from importing the same module halfway
+        with self.lock:
+            if name not in self.loaded:
+                module, _, attribute = self.entries[name].partition(":")
+                started = time.perf_counter()
+                loaded = importlib.import_module(module)
+                self.loaded[name] = getattr(loaded, attribute) if attribute else loaded
+                logger.info("Loaded %s %s in %.3f seconds", self.kind, name, time.perf_counter() - started)
+        return self.loaded[name]
+
+
+tool_registry = LazyRegistry("tool", {
+    "ScrapeWebsiteTool": "crewai_tools.tools.scrape_website_tool.scrape_website_tool:ScrapeWebsiteTool",
+    "DirectoryReadTool": "crewai_tools.tools.directory_read_tool.directory_read_tool:DirectoryReadTool",
+    "SerperDevTool": "tools.serperTool:ScopedSerperDevTool",
+    "NL2SQLTool": "tools.sqltool:SQLTool",
+    "FileReadTool": "tools.filereadtool:FileReadTool",
+    "KnowledgeRAGTool": "knowledgeRagTool:KnowledgeRAGTool",
+})
+
+provider_registry = LazyRegistry("provider", {
+    "boto3": "boto3",
+    "chromadb": "chromadb",
+    "Chroma": "langchain_community.vectorstores:Chroma",
+    "AzureOpenAIEmbeddings": "langchain_openai:AzureOpenAIEmbeddings",
+    "BedrockEmbeddings": "langchain_community.embeddings.bedrock:BedrockEmbeddings",
+    "VertexAIEmbeddings": "langchain_google_vertexai:VertexAIEmbeddings",
+})
@@ -1,13 +1,23 @@
+from helpers.execution_context import current_execution_context, bind_execution_context
+
+
 class SecretManager:
     _instance = None
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance.access_key = ""
         return cls._instance
     
     def __init__(self):
         pass
 
-secret_manager = SecretManager()
\ No newline at end of file
+    @property
+    def access_key(self):
+        return current_execution_context().access_key
+
+    @access_key.setter
+    def access_key(self, value):
+        bind_execution_context(access_key=value)
+
+secret_manager = SecretManager()
\ No newline at end of file
@@ -0,0 +1,219 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from crewai import LLM
+from helpers.helpers import embedding_function, decode_embedding_keys
+from helpers.llm_cache import llm_response_cache, normalize_messages, KEY_PARAMETERS
+from helpers.logger_config import logger
+
+# Cosine similarity from which a cached response is returned for a new prompt
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+# Responses kept per pipeline and pipelines kept per worker, the least recently used go first
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+SEMANTIC_CACHE_MAX_NAMESPACES = int(os.getenv("SEMANTIC_CACHE_MAX_NAMESPACES", "256"))
+
+# Embedding clients kept per worker
+EMBEDDING_POOL_SIZE = 32
+
+
+class SemanticCacheBinding:
+    """What an opted in LLM copy carries, the pipeline namespace and the embedding config of its agent."""
+
+    def __init__(self, namespace, embedding):
+        self.namespace = namespace
+        self.embedding = embedding
+
+
+class Namespace:
+    """Vector index of one pipeline, rows of a normalized matrix so a lookup is one matrix product."""
+
+    def __init__(self):
+        self.vectors = None
+        self.scopes = []
+        self.responses = []
+        self.created = []
+        self.used = []
+
+    def __len__(self):
+        return len(self.responses)
+
+    def remove(self, rows):
+        keep = [row for row in range(len(self)) if row not in rows]
+        self.vectors = self.vectors[keep] if keep else None
+        self.scopes = [self.scopes[row] for row in keep]
+        self.responses = [self.responses[row] for row in keep]
+        self.created = [self.created[row] for row in keep]
+        self.used = [self.used[row] for row in keep]
+
+    def expire(self, ttl):
+        now = time.time()
+        expired = {row for row, created in enumerate(self.created) if now - created > ttl}
+        if expired:
+            self.remove(expired)
+
+    def search(self, scope, vector, threshold):
+        if self.vectors is None:
+            return None
+        similarities = self.vectors @ vector
+        best, best_similarity = None, threshold
+        for row in np.flatnonzero(similarities >= threshold):
+            if self.scopes[row] == scope and similarities[row] >= best_similarity:
+                best, best_similarity = row, similarities[row]
+        if best is None:
+            return None
+        self.used[best] = time.time()
+        return self.responses[best], float(best_similarity)
+
+    def add(self, scope, vector, response, max_entries):
+        self.vectors = vector[np.newaxis, :] if self.vectors is None else np.vstack([self.vectors, vector])
+        self.scopes.append(scope)
+        self.responses.append(response)
+        self.created.append(time.time())
+        self.used.append(time.time())
+        if len(self) > max_entries:
+            self.remove(set(np.argsort(self.used)[:len(self) - max_entries].tolist()))
+
+
+class SemanticResponseCache:
+    """Returns the cached response of a similar earlier prompt of the same pipeline.
+
+    Only the last message of a call is embedded, everything before it (the system prompt with role, goal,
+    backstory and tools, and the earlier turns) and the model parameters form a scope that has to match
+    exactly, so a hit is a near duplicate task for the same agent and not just a similar system prompt.
+    The index lives in the worker, a new worker starts empty.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, max_namespaces=SEMANTIC_CACHE_MAX_NAMESPACES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_namespaces = max_namespaces
+        self.namespaces = OrderedDict()
+        self.embedders = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def scope(llm, messages):
+        content = json.dumps({
+            "class": type(llm).__name__,
+            "model": llm.model,
+            "parameters": {name: getattr(llm, name, None) for name in KEY_PARAMETERS},
+            "messages": messages[:-1],
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def embedder(self, embedding):
+        key = hashlib.sha256(embedding.model_dump_json().encode("utf-8")).hexdigest()
+        with self.lock:
+            embedder = self.embedders.get(key)
+            if embedder is not None:
+                self.embedders.move_to_end(key)
+                return embedder
+
+        embedder = embedding_function(embedding)
+        if embedder is None:
+            raise ValueError(f"Unsupported embedder type: {embedding.aiEngine}")
+
+        with self.lock:
+            embedder = self.embedders.setdefault(key, embedder)
+            while len(self.embedders) > EMBEDDING_POOL_SIZE:
+                self.embedders.popitem(last=False)
+        return embedder
+
+    def embed(self, binding, text):
+        vector = np.asarray(self.embedder(binding.embedding).embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def namespace(self, name):
+        namespace = self.namespaces.get(name)
+        if namespace is None:
+            namespace = self.namespaces[name] = Namespace()
+            while len(self.namespaces) > self.max_namespaces:
+                self.namespaces.popitem(last=False)
+        self.namespaces.move_to_end(name)
+        return namespace
+
+    def get(self, binding, scope, vector):
+        with self.lock:
+            namespace = self.namespace(binding.namespace)
+            namespace.expire(self.ttl)
+            return namespace.search(scope, vector, self.threshold)
+
+    def put(self, binding, scope, vector, response):
+        with self.lock:
+            self.namespace(binding.namespace).add(scope, vector, response, self.max_entries)
+
+
+semantic_response_cache = SemanticResponseCache()
+
+
+def bind_semantic_cache(llm, pipelineId, agent_embeddings, master_embedding):
+    """Opts the LLM copy of a run into the semantic cache of its pipeline.
+
+    Prompts are embedded with the first embedding of the agent, or with the masterEmbedding of the pipeline
+    for agents without one and for the crew manager. A no-op without either.
+    """
+    if agent_embeddings:
+        embedding = agent_embeddings[0]
+    elif master_embedding is not None:
+        embedding = decode_embedding_keys(master_embedding)
+    else:
+        logger.warning("Semantic cache requested without an embedding config, pipeline %s", pipelineId)
+        return
+    llm.semantic_cache = SemanticCacheBinding(str(pipelineId), embedding)
+
+
+def semantic_cache_llm_calls():
+    """Serves LLM calls of opted in agents from semantic_response_cache, see SemanticResponseCache."""
+    if getattr(LLM.call, "semantic_cache", False):
+        return
+
+    uncached = LLM.call
+
+    @functools.wraps(uncached)
+    def call(self, *args, **kwargs):
+        binding = getattr(self, "semantic_cache", None)
+        messages = kwargs.get("messages", args[0] if args else None)
+        tools = kwargs.get("tools", args[1] if len(args) > 1 else None)
+        available_functions = kwargs.get("available_functions", args[3] if len(args) > 3 else None)
+
+        if binding is None or messages is None or tools or available_functions:
+            return uncached(self, *args, **kwargs)
+
+        messages = normalize_messages(messages)
+        if not messages or not isinstance(messages[-1]["content"], str) or not messages[-1]["content"]:
+            return uncached(self, *args, **kwargs)
+
+        scope = semantic_response_cache.scope(self, messages)
+        try:
+            vector = semantic_response_cache.embed(binding, messages[-1]["content"])
+        except Exception as e:
+            # The cache is an optimization, an embedding failure must not fail the call
+            logger.error("Failed to embed prompt for the semantic cache: %s", str(e))
+            return uncached(self, *args, **kwargs)
+
+        cached = semantic_response_cache.get(binding, scope, vector)
+        if cached is not None:
+            response, similarity = cached
+            logger.debug("LLM response served from semantic cache for %s, similarity %.4f", self.model, similarity)
+            if llm_response_cache:
+                llm_response_cache.record("semantic_hits")
+            return response
+
+        if llm_response_cache:
+            llm_response_cache.record("semantic_misses")
+        response = uncached(self, *args, **kwargs)
+        if isinstance(response, str) and response:
+            semantic_response_cache.put(binding, scope, vector, response)
+        return response
+
+    call.semantic_cache = True
+    LLM.call = call
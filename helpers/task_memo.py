@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+from crewai.tasks.task_output import TaskOutput
+from helpers.checkpoint import task_definition
+from helpers.logger_config import logger
+from helpers.redis_client import redis_client
+
+TASK_MEMO_TTL = int(os.getenv("TASK_MEMO_TTL", "3600"))
+
+# Tool classes that only read, a task using any other tool (file writer, memory, SQL, user tools) is always executed
+PURE_TOOLS = frozenset({"ScrapeWebsiteTool", "ScopedSerperDevTool", "KnowledgeRAGTool", "Imagetool"})
+
+
+class TaskMemo:
+    """Cache of task outputs shared by all executions of a pipeline that sets taskMemo.
+
+    The key covers the rendered task, the agent and LLM configuration, the tool set and the outputs of
+    the upstream tasks, so a rerun with one changed user input only recomputes the tasks it reaches.
+    """
+
+    def __init__(self, redis_client, ttl=TASK_MEMO_TTL):
+        self.redis_client = redis_client
+        self.ttl = ttl
+
+    @staticmethod
+    def key(scope, task, upstream):
+        content = json.dumps({
+            "task": task_definition(task),
+            "upstream": [dependency.output.raw if dependency.output else None for dependency in upstream],
+        }, sort_keys=True, default=str)
+        return f"pipeline:memo:{scope}:{hashlib.sha256(content.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def memoizable(task):
+        tools = task.tools or (task.agent.tools if task.agent else None) or []
+        return all(type(tool).__name__ in PURE_TOOLS for tool in tools)
+
+    def get(self, key):
+        try:
+            output = self.redis_client.get(key)
+            return TaskOutput.model_validate_json(output) if output else None
+        except Exception as e:
+            logger.error("Failed to read memoized task output: %s", str(e))
+            return None
+
+    def put(self, key, output):
+        try:
+            self.redis_client.set(key, output.model_dump_json(), ex=self.ttl)
+        except Exception as e:
+            logger.error("Failed to memoize task output: %s", str(e))
+
+
+task_memo = TaskMemo(redis_client) if redis_client else None
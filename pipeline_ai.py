@@ -1,7 +1,11 @@
+import asyncio
+import contextlib
 import json
 import httpx
 from fastapi import FastAPI, Form, Header, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from helpers.helpers import zip_and_upload_folder
 from helpers import agent_image_utils,helpers
 from helpers.logger_config import logger
@@ -10,19 +14,18 @@ import os
 import openai
 from typing import Annotated, Dict, Any
 from PipelineModel.PipelineRequest import PipelineRequest
+from PipelineModel.PipelineBatchRequest import PipelineBatchRequest
 from PipelineModel.PipelineModel import PipelineModel
 from PipelineModel.agentDetails import AgentDetails
 from crewai import Agent, Task, Crew, Process, LLM
-from crewai_tools.tools.scrape_website_tool.scrape_website_tool import ScrapeWebsiteTool
-from crewai_tools.tools.serper_dev_tool.serper_dev_tool import SerperDevTool
 from tools.memReadWriteTool import MemoryReaderWriterTool
-from tools.sqltool import SQLTool
 from langfuse.callback import CallbackHandler
 from pipeline_files import PipelineFiles
-from knowledgeRagTool import KnowledgeRAGTool
 from langchain_core.exceptions import OutputParserException
-from helpers.helpers import create_embedder, PatchedBedrockLLM
+from helpers.helpers import create_embedder, setup_agents_concurrently, agent_token_usage
+from helpers.llm_factory import llm_factory
 from helpers.db_uri import encode_db_uri
+from helpers.registry import tool_registry
 from modified_library.file_writer_tool import FileWriterTool
 # from crewai.tools.structured_tool import CrewStructuredTool
 # from modified_library.file_writer_tool import get_file_writer_tool
@@ -34,8 +37,25 @@ import redis
 import litellm
 from litellm import completion
 from helpers.secret_manager import secret_manager
+from helpers.execution_context import current_execution_context, set_execution_context, bind_execution_context
 from helpers.redis_client import redis_client
 from helpers.pg_client import postgres_client
+from helpers.executor import execution_pool
+from helpers.dag_crew import DagCrew, has_task_graph, build_task_graph, chain_tasks
+from helpers.checkpoint import checkpoint_store
+from helpers.task_memo import task_memo
+from helpers.cancellation import cancellation_registry, CancellationScope, current_cancellation_scope, guard_llm_calls
+from helpers.rate_limiter import rate_limit_llm_calls
+from helpers.llm_cache import cache_llm_calls
+from helpers.semantic_cache import semantic_cache_llm_calls, bind_semantic_cache
+from helpers.execution_store import execution_store, ExecutionStatus, EXECUTION_LEASE_SECONDS
+from helpers.job_queue import job_queue, EXECUTION_QUEUE_MODE
+from helpers.admission import admission_controller, AdmissionTicket, BATCH
+from helpers.pipeline_cache import pipeline_cache, CompiledAgent, PerRunTool
+from helpers.payload_cache import payload_cache
+from helpers.http_client import http_client
+from helpers.outbox import outbox
+from helpers.drain import drain_state, drain, ExecutionInterrupted, SHUTDOWN_REASON
 from redis_logs import PipelineAILogs
 import shutil
 import stat
@@ -59,13 +79,26 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "genai-platform-creds.json"
 litellm.success_callback = ["langfuse"]
 litellm.failure_callback = ["langfuse"]
 
+# LLM calls check the cancellation scope of their execution, so a cancelled or over budget run stops at the next call
+guard_llm_calls()
+# Calls that reach a provider wait for the shared rate limit of their deployment
+rate_limit_llm_calls()
+# Calls of opted in agents are served from the exact response cache first, then from the semantic cache, before the rate limit and the guard are reached
+semantic_cache_llm_calls()
+cache_llm_calls()
+
 adminUrl = os.getenv('ADMIN_URL')
 
 instructionUrl = os.getenv('INSTRUCTIONS_URL')
 
-USE_BEDROCK_CREDENTIALS = os.getenv("USE_BEDROCK_CREDENTIALS", 'True')
+# Seconds between execution state checks while /execute waits on a queued run
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "2"))
+
+# Items of one batch running at the same time, a batch request can ask for fewer
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
 
-def lifespan(app: FastAPI):
+async def lifespan(app: FastAPI):
     # Validate required environment variables
     if not os.getenv('ADMIN_URL'):
         logger.error("Environment variable ADMIN_URL is not set")
@@ -75,18 +108,50 @@ def lifespan(app: FastAPI):
         logger.error("Environment variable INSTRUCTIONS_URL is not set")
         raise HTTPException(status_code=500, detail="Environment variable INSTRUCTIONS_URL is not set. Please add value to the INSTRUCTIONS_URL environment variable")
 
+    cache_listener = pipeline_cache.listen_for_invalidations()
+    outbox.start()
+
     yield
 
+    # Running executions finish, or are interrupted at the drain timeout, before the clients they use are closed
+    drain_state.start()
+    interrupted = await drain(list(inflight_executions.values()))
+    if interrupted:
+        logger.warning("%s executions were interrupted by the shutdown, their checkpoints are kept for a retry", interrupted)
+
+    if cache_listener:
+        cache_listener.stop()
+
+    # Flushed before the client closes so pending history is not held back until the next start
+    await outbox.stop()
+    await http_client.close()
+
     if os.getenv("ENABLE_LOGSTREAMING"):
         redis_client.close()
     
     if os.getenv("PERSISTENT_LOGGING"):
         postgres_client.close_all_connections()
 
+    execution_pool.shutdown()
+
 logger.info('API is starting up')
 
 app = FastAPI(timeout=6000,lifespan=lifespan)
 
+# Executions run by this worker by executionId. Duplicate requests await them instead of starting a second
+# crew, and the references keep submitted executions from being garbage collected mid run.
+inflight_executions = {}
+# Executions started by this worker, supervisor.py replaces the worker after WORKER_MAX_EXECUTIONS
+started_executions = 0
+
+@app.middleware("http")
+async def reject_new_executions_when_draining(request, call_next):
+    # Executions already running finish, new ones go to another worker through the retrying client
+    if request.method == "POST" and drain_state.is_draining() and (
+            request.url.path.startswith("/force/platform/pipeline/api/v1/execute") or request.url.path.endswith("/resume")):
+        return JSONResponse(status_code=503, content={"detail": "Worker is shutting down, retry the execution"}, headers={"Retry-After": "5"})
+    return await call_next(request)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -102,7 +167,7 @@ async def health_check():
         logger.isEnabledFor(logging.INFO),
         logger.isEnabledFor(logging.DEBUG)
     )
-    return {"status": "healthy"}
+    return {"status": "draining" if drain_state.is_draining() else "healthy"}
 
 @app.get("/platform/pipeline/api/v1/health")
 async def health_check_endpoint():
@@ -116,6 +181,13 @@ async def health_check_endpoint():
 
         raise HTTPException(status_code=500, detail=f"Internal server error during health check: {e}")
 
+@app.get("/platform/pipeline/api/v1/health/ready")
+async def readiness_check_endpoint():
+    # Liveness stays healthy while draining, readiness takes the worker out of the load balancer
+    if drain_state.is_draining():
+        return JSONResponse(status_code=503, content={"status": "draining", "running": len(inflight_executions)})
+    return {"status": "ready"}
+
 def initialize_user_tool(class_name, class_definition):
     try:
         local_namespace = {}
@@ -150,7 +222,11 @@ async def execute_pipeline(payload: PipelineModel,access_key: str):
 
         langfuse_config = setup_langfuse(payload)
         logger.debug('---------------- Setup LangFuse Config ---------------- ')
-        response = await execute_pipeline_logic(payload, langfuse_config, access_key)
+
+        if execution_pool.uses_processes:
+            response = await execution_pool.run_isolated(run_pipeline_logic_in_process, payload.model_dump(), langfuse_config, current_execution_context(), current_cancellation_scope())
+        else:
+            response = await execute_pipeline_logic(payload, langfuse_config, access_key)
         return response
 
     except Exception as e:
@@ -160,6 +236,348 @@ async def execute_pipeline(payload: PipelineModel,access_key: str):
 
 @app.post("/force/platform/pipeline/api/v1/execute")
 async def execute(access_key: Annotated[str | None, Header()] = None, pipelineRequest: PipelineRequest = None):
+    if EXECUTION_QUEUE_MODE:
+        # The run happens on a queue worker, the caller still gets the pipeline response on this request
+        enqueue_execution(pipelineRequest, access_key)
+        return await wait_for_execution(pipelineRequest.executionId)
+
+    async def run():
+        ticket = admission_controller.request(pipelineRequest.user, pipelineRequest.priority)
+        return await run_admitted_execution(pipelineRequest, access_key, ticket)
+
+    return await run_once(pipelineRequest.executionId, pipelineRequest.pipeLineId, pipelineRequest.user, pipelineRequest.model_dump(), run)
+
+
+@app.post("/force/platform/pipeline/api/v1/execute/submit", status_code=202)
+async def submit_execution(access_key: Annotated[str | None, Header()] = None, pipelineRequest: PipelineRequest = None):
+    if execution_store is None:
+        logger.error("Asynchronous execution requires ENABLE_LOGSTREAMING for the Redis execution store")
+        raise HTTPException(status_code=503, detail="Asynchronous execution is not available, Redis is not configured")
+
+    if not pipelineRequest.executionId.strip():
+        logger.error("Execution ID is required")
+        raise HTTPException(status_code=400, detail="Execution ID is required")
+
+    existing = None
+    if EXECUTION_QUEUE_MODE:
+        existing = enqueue_execution(pipelineRequest, access_key)
+    elif pipelineRequest.executionId not in inflight_executions:
+        # Submitted executions default to the batch class so they do not hold up interactive callers
+        ticket = admission_controller.request(pipelineRequest.user, pipelineRequest.priority or BATCH)
+        existing = execution_store.claim(pipelineRequest.executionId, pipelineRequest.pipeLineId, pipelineRequest.user, pipelineRequest.model_dump(), leased=True)
+
+        if existing:
+            admission_controller.release(ticket)
+        else:
+            inflight = start_execution(pipelineRequest.executionId, run_admitted_execution(pipelineRequest, access_key, ticket))
+            # The outcome is read from the execution store, this only marks the exception as retrieved
+            inflight.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    if existing:
+        logger.info("Execution %s is already %s, not submitted again", pipelineRequest.executionId, existing)
+    else:
+        logger.info("Execution submitted ---------------- %s", pipelineRequest.executionId)
+
+    return {
+        "executionId": pipelineRequest.executionId,
+        "status": existing or ExecutionStatus.QUEUED,
+        "statusUrl": f"/force/platform/pipeline/api/v1/executions/{pipelineRequest.executionId}"
+    }
+
+
+@app.post("/force/platform/pipeline/api/v1/execute/batch")
+async def execute_batch(access_key: Annotated[str | None, Header()] = None, batchRequest: PipelineBatchRequest = None):
+    if not batchRequest.executionId.strip():
+        logger.error("Execution ID is required")
+        raise HTTPException(status_code=400, detail="Execution ID is required")
+
+    if not batchRequest.items or len(batchRequest.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch takes between 1 and {BATCH_MAX_ITEMS} items")
+
+    concurrency = min(batchRequest.concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    if concurrency < 1:
+        raise HTTPException(status_code=400, detail="Batch concurrency must be at least 1")
+
+    # Fetched once before streaming so an unknown pipeline or access key fails the batch with a single error,
+    # the items are then served from the payload cache
+    await getPipelinePayload(access_key, batchRequest.pipeLineId)
+
+    logger.info("Batch of %s items started ---------------- %s", len(batchRequest.items), batchRequest.executionId)
+    return StreamingResponse(stream_batch(batchRequest, access_key, concurrency), media_type="application/x-ndjson")
+
+
+async def stream_batch(batchRequest: PipelineBatchRequest, access_key: str, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    request = batchRequest.model_dump(exclude={"executionId", "items", "concurrency"})
+
+    async def run_item(index, userInputs):
+        pipelineRequest = PipelineRequest(**request, executionId=f"{batchRequest.executionId}-{index}", userInputs=userInputs)
+        item = {"index": index, "executionId": pipelineRequest.executionId}
+
+        async with semaphore:
+            try:
+                response = await run_batch_item(pipelineRequest, access_key)
+                return {**item, "status": ExecutionStatus.SUCCESS, "result": jsonable_encoder(response)}
+
+            except HTTPException as e:
+                return {**item, "status": ExecutionStatus.FAILED, "error": {"status_code": e.status_code, "detail": e.detail}}
+
+            except Exception as e:
+                logger.error("Batch item failed ---------------- %s", str(e))
+                return {**item, "status": ExecutionStatus.FAILED, "error": {"status_code": 500, "detail": str(e)}}
+
+    items = [asyncio.create_task(run_item(index, userInputs)) for index, userInputs in enumerate(batchRequest.items)]
+    succeeded = 0
+
+    try:
+        # One JSON line per item as soon as it completes, then a summary line
+        for completed in asyncio.as_completed(items):
+            result = await completed
+            succeeded += result["status"] == ExecutionStatus.SUCCESS
+            yield json.dumps(result, default=str) + "\n"
+
+        logger.info("Batch completed, %s of %s items succeeded ---------------- %s", succeeded, len(items), batchRequest.executionId)
+        yield json.dumps({"executionId": batchRequest.executionId, "completed": len(items), "succeeded": succeeded, "failed": len(items) - succeeded}) + "\n"
+
+    finally:
+        # Items that have not finished are stopped when the client disconnects, run_once shields the execution
+        # from the task so a running crew is stopped through its cancellation scope
+        for index, item in enumerate(items):
+            if not item.done():
+                item.cancel()
+                cancellation_registry.cancel(f"{batchRequest.executionId}-{index}", "batch client disconnected")
+
+
+async def run_batch_item(pipelineRequest: PipelineRequest, access_key: str):
+    if EXECUTION_QUEUE_MODE:
+        enqueue_execution(pipelineRequest, access_key)
+        return await wait_for_execution(pipelineRequest.executionId)
+
+    async def run():
+        while True:
+            try:
+                ticket = admission_controller.request(pipelineRequest.user, pipelineRequest.priority or BATCH)
+                break
+            except HTTPException as e:
+                if e.status_code != 429:
+                    raise
+                # A full admission queue delays the item instead of failing it
+                await asyncio.sleep(admission_controller.retry_after())
+
+        return await run_admitted_execution(pipelineRequest, access_key, ticket)
+
+    return await run_once(pipelineRequest.executionId, pipelineRequest.pipeLineId, pipelineRequest.user, pipelineRequest.model_dump(), run)
+
+
+@app.post("/force/platform/pipeline/api/v1/executions/{executionId}/resume")
+async def resume_execution(executionId: str, access_key: Annotated[str | None, Header()] = None):
+    if checkpoint_store is None:
+        raise HTTPException(status_code=503, detail="Resuming executions is not available, Redis is not configured")
+
+    request = checkpoint_store.get_request(executionId)
+    if request is None:
+        raise HTTPException(status_code=404, detail=f"No checkpoint found for execution {executionId}, it has completed or expired")
+    if not checkpoint_store.is_checkpointed(executionId):
+        # A hierarchical crew delegates through its manager and keeps no task checkpoints, a resume would rerun everything
+        raise HTTPException(status_code=409, detail=f"Execution {executionId} was not checkpointed and cannot be resumed")
+
+    # The run restores every task that completed before the failure and only executes the rest
+    pipelineRequest = PipelineRequest(**request)
+    cancellation_registry.clear(executionId)
+    logger.info("Resuming execution ---------------- %s", executionId)
+
+    if EXECUTION_QUEUE_MODE:
+        enqueue_execution(pipelineRequest, access_key)
+        return await wait_for_execution(executionId)
+
+    async def run():
+        ticket = admission_controller.request(pipelineRequest.user, pipelineRequest.priority)
+        return await run_admitted_execution(pipelineRequest, access_key, ticket)
+
+    return await run_once(executionId, pipelineRequest.pipeLineId, pipelineRequest.user, request, run)
+
+
+@app.post("/force/platform/pipeline/api/v1/executions/{executionId}/cancel", status_code=202)
+async def cancel_execution(executionId: str):
+    if not cancellation_registry.cancel(executionId):
+        raise HTTPException(status_code=404, detail=f"Execution {executionId} is not running")
+
+    logger.info("Cancel requested ---------------- %s", executionId)
+    return {"executionId": executionId, "status": "CANCELLING"}
+
+
+@app.delete("/force/platform/pipeline/api/v1/cache/pipelines/{pipeLineId}")
+async def invalidate_pipeline_cache(pipeLineId: str, access_key: Annotated[str | None, Header()] = None):
+    # The invalidation reaches every worker, only callers the admin API accepts for the pipeline may trigger it
+    await getPipelinePayload(access_key, pipeLineId)
+
+    removed = pipeline_cache.invalidate(pipeLineId)
+    payload_cache.invalidate(pipeLineId)
+    return {"pipeLineId": pipeLineId, "invalidated": removed}
+
+
+@app.get("/force/platform/pipeline/api/v1/executions/{executionId}")
+async def get_execution(executionId: str, access_key: Annotated[str | None, Header()] = None):
+    if execution_store is None:
+        raise HTTPException(status_code=503, detail="Asynchronous execution is not available, Redis is not configured")
+
+    if not access_key:
+        logger.error("Access key is required")
+        raise HTTPException(status_code=400, detail="Access key is required")
+
+    execution = execution_store.get(executionId)
+    if execution is None:
+        raise HTTPException(status_code=404, detail=f"Execution {executionId} not found")
+
+    # Only callers whose access key the admin API accepts for the pipeline, as on /execute, see its executions
+    await getPipelinePayload(access_key, execution["pipelineId"])
+
+    execution.pop("request", None)
+    return execution
+
+
+def enqueue_execution(pipelineRequest: PipelineRequest, access_key: str):
+    if job_queue is None:
+        logger.error("Queue mode requires ENABLE_LOGSTREAMING for the Redis stream and QUEUE_ENCRYPTION_KEY")
+        raise HTTPException(status_code=503, detail="Execution queue is not available, Redis or QUEUE_ENCRYPTION_KEY is not configured")
+
+    if not pipelineRequest.executionId.strip():
+        logger.error("Execution ID is required")
+        raise HTTPException(status_code=400, detail="Execution ID is required")
+
+    request = pipelineRequest.model_dump()
+    existing = execution_store.claim(pipelineRequest.executionId, pipelineRequest.pipeLineId, pipelineRequest.user, request)
+    if existing:
+        # Already queued, running or succeeded, the caller attaches to that execution
+        logger.info("Execution %s is already %s, not enqueued again", pipelineRequest.executionId, existing)
+        return existing
+
+    cancellation_registry.clear(pipelineRequest.executionId)
+    job_queue.enqueue(request, access_key)
+    return None
+
+
+async def wait_for_execution(executionId: str):
+    while True:
+        execution = execution_store.get(executionId)
+        if execution is None:
+            raise HTTPException(status_code=500, detail=f"Execution state for {executionId} has expired")
+
+        if execution["status"] == ExecutionStatus.SUCCESS:
+            return execution["result"]
+
+        if execution["status"] == ExecutionStatus.FAILED:
+            raise HTTPException(status_code=execution["error"]["status_code"], detail=execution["error"]["detail"])
+
+        if execution_store.is_abandoned(execution):
+            raise HTTPException(status_code=500, detail=f"Execution {executionId} was abandoned by its worker, retry to run it again")
+
+        await asyncio.sleep(QUEUE_POLL_INTERVAL)
+
+
+async def run_once(executionId: str, pipelineId, user: str, request: dict, run):
+    """Runs the execution through run() unless the executionId is already queued, running or has succeeded,
+    in which case the caller attaches to that execution and gets its result."""
+    if not executionId or not executionId.strip():
+        logger.error("Execution ID is required")
+        raise HTTPException(status_code=400, detail="Execution ID is required")
+
+    inflight = inflight_executions.get(executionId)
+    if inflight is None and execution_store:
+        existing = execution_store.claim(executionId, pipelineId, user, request, leased=True)
+        if existing:
+            logger.info("Execution %s is already %s, attaching to it", executionId, existing)
+            return await wait_for_execution(executionId)
+
+    if inflight is None:
+        inflight = start_execution(executionId, run())
+    else:
+        logger.info("Attaching to execution running on this worker ---------------- %s", executionId)
+
+    # Shielded so a caller that goes away does not cancel the run other callers are attached to
+    return await asyncio.shield(inflight)
+
+
+def start_execution(executionId: str, run):
+    global started_executions
+    started_executions += 1
+    cancellation_registry.clear(executionId)
+    inflight = asyncio.ensure_future(track_execution(executionId, run))
+    inflight_executions[executionId] = inflight
+    inflight.add_done_callback(lambda _: inflight_executions.pop(executionId, None))
+    return inflight
+
+
+async def track_execution(executionId: str, run, leased: bool = True):
+    """Awaits the run and records its outcome in the execution store, renewing the lease while it runs."""
+    renewal = asyncio.create_task(renew_execution_lease(executionId)) if execution_store and leased else None
+
+    try:
+        response = await run
+        if execution_store:
+            execution_store.mark_succeeded(executionId, jsonable_encoder(response))
+        return response
+
+    except ExecutionInterrupted as e:
+        # A queued execution is requeued by its worker, a leased one fails so a retry resumes it elsewhere
+        if execution_store and leased:
+            execution_store.mark_failed(executionId, e.status_code, e.detail)
+        raise
+
+    except HTTPException as e:
+        if execution_store:
+            execution_store.mark_failed(executionId, e.status_code, e.detail)
+        raise
+
+    except Exception as e:
+        logger.error("Execution failed ---------------- %s", str(e))
+        if execution_store:
+            execution_store.mark_failed(executionId, 500, str(e))
+        raise
+
+    finally:
+        if renewal:
+            renewal.cancel()
+
+
+async def renew_execution_lease(executionId: str):
+    while True:
+        await asyncio.sleep(EXECUTION_LEASE_SECONDS / 3)
+        try:
+            await execution_pool.run_control(execution_store.renew_lease, executionId)
+        except Exception as e:
+            # A missed renewal is retried on the next tick, the lease outlasts two of them
+            logger.error("Failed to renew lease of execution %s: %s", executionId, str(e))
+
+
+async def run_admitted_execution(pipelineRequest: PipelineRequest, access_key: str, ticket: AdmissionTicket = None):
+    async with admission_controller.admitted(ticket) if ticket else contextlib.nullcontext():
+        if execution_store:
+            execution_store.mark_running(pipelineRequest.executionId)
+        return await run_execution(pipelineRequest, access_key)
+
+
+async def run_submitted_execution(pipelineRequest: PipelineRequest, access_key: str):
+    """Runs an execution taken from the queue, the outcome is only recorded in the execution store."""
+    executionId = pipelineRequest.executionId
+
+    execution = execution_store.get(executionId)
+    if execution and execution["status"] == ExecutionStatus.SUCCESS:
+        # Redelivered after it completed, e.g. the worker stopped before acknowledging the entry
+        logger.info("Execution already succeeded, skipping ---------------- %s", executionId)
+        return
+
+    try:
+        await track_execution(executionId, run_admitted_execution(pipelineRequest, access_key), leased=False)
+        logger.info("Submitted execution completed ---------------- %s", executionId)
+    except ExecutionInterrupted:
+        raise
+    except Exception:
+        # Already logged and recorded in the execution store by track_execution
+        pass
+
+
+async def run_execution(pipelineRequest: PipelineRequest, access_key: str):
     temporary_images = None
 
     try:        
@@ -170,21 +588,22 @@ async def execute(access_key: Annotated[str | None, Header()] = None, pipelineRe
         logStream = os.getenv('ENABLE_LOGSTREAMING')
         persistent_logging = os.getenv("PERSISTENT_LOGGING")
 
-        helpers.save_initial_workflow_history(pipelineRequest.pipeLineId,pipelineRequest.executionId,
+        await helpers.save_initial_workflow_history(pipelineRequest.pipeLineId,pipelineRequest.executionId,
                                               pipelineRequest.user, pipelineRequest.model_dump(),adminUrl, access_key)
+        if checkpoint_store:
+            # Kept with the checkpoints so the resume endpoint can rebuild the execution
+            checkpoint_store.save_request(pipelineRequest.executionId, pipelineRequest.model_dump())
         if logStream == 'True' or persistent_logging == 'True':
             logger.info("Log stream enabled is -------------- %s", logStream)
             logger.info("Persistent logging is enabled-------------- %s", persistent_logging)
 
-            PipelineAILogs.executionId = pipelineRequest.executionId
-            PipelineAILogs.pipelineId = pipelineRequest.pipeLineId
-            PipelineAILogs.sender = pipelineRequest.user
+            bind_execution_context(executionId=pipelineRequest.executionId, pipelineId=pipelineRequest.pipeLineId, sender=pipelineRequest.user)
 
         temporary_images, pipelineRequest.userInputs = (
             agent_image_utils.save_temp_images_with_rewrite_inputs(pipelineRequest.userInputs))
 
-        pipelineJson = getPipelinePayload(access_key, pipelineRequest.pipeLineId)
-        helpers.save_payload_workflow_history(pipelineRequest.pipeLineId,pipelineRequest.executionId,pipelineJson,adminUrl,access_key)
+        pipelineJson = await getPipelinePayload(access_key, pipelineRequest.pipeLineId)
+        await helpers.save_payload_workflow_history(pipelineRequest.pipeLineId,pipelineRequest.executionId,pipelineJson,adminUrl,access_key)
         logger.info("Pipeline payload is ---------------- %s", pipelineJson)
 
         payloadObject = PipelineModel(**pipelineJson['pipeline'])
@@ -198,11 +617,16 @@ async def execute(access_key: Annotated[str | None, Header()] = None, pipelineRe
     
     except Exception as e:
         logger.error(f"Unexpected error in pipeline execution: {e}")
-        helpers.send_execution_status(pipelineRequest.executionId, "FAILED", instructionUrl, access_key)
+        await helpers.send_execution_status(pipelineRequest.executionId, "FAILED", instructionUrl, access_key)
         raise HTTPException(status_code=500, detail=f"Unexpected error in pipeline execution: {e}")
 
+    cancellation_scope = CancellationScope.for_execution(pipelineRequest.executionId, pipelineRequest.maxExecutionSeconds, pipelineRequest.maxTokens)
+
     try:
-        pipelineResponse = await execute_pipeline(payloadObject,access_key)
+        with cancellation_registry.track(cancellation_scope):
+            # An execution cancelled while it was queued stops before its first LLM call
+            cancellation_scope.check()
+            pipelineResponse = await execute_pipeline(payloadObject,access_key)
         logger.debug(" Final response ------- %s", pipelineResponse)
 
         payloadObject.tasksOutputs = pipelineResponse[0].tasks_output
@@ -216,10 +640,13 @@ async def execute(access_key: Annotated[str | None, Header()] = None, pipelineRe
 
         logger.debug("Final response payload ------- %s", payloadObject)
 
-        helpers.save_final_workflow_history(pipelineRequest.pipeLineId, pipelineRequest.executionId, pipelineResponse,payloadObject, adminUrl, access_key,upload_file_id=pipelineResponse[1])
+        await helpers.save_final_workflow_history(pipelineRequest.pipeLineId, pipelineRequest.executionId, pipelineResponse,payloadObject, adminUrl, access_key,upload_file_id=pipelineResponse[1])
+
+        if checkpoint_store:
+            checkpoint_store.clear(pipelineRequest.executionId)
         
         # Send success status to Java API
-        helpers.send_execution_status(pipelineRequest.executionId, "SUCCESS", instructionUrl, access_key)
+        await helpers.send_execution_status(pipelineRequest.executionId, "SUCCESS", instructionUrl, access_key)
         
         if pipelineResponse[1]=="Not applicable":
             response = payloadObject.model_dump(exclude={"file_download_url"})
@@ -232,7 +659,11 @@ async def execute(access_key: Annotated[str | None, Header()] = None, pipelineRe
         logger.error("Error from Pipeline execution ------- %s", str(e))
         PipelineAILogs().publishLogs("DA Pipeline Exception:" + str(e), "red", redisClient=redis_client)
         # Send failure status to Java API
-        helpers.send_execution_status(pipelineRequest.executionId, "FAILED", instructionUrl, access_key)
+        await helpers.send_execution_status(pipelineRequest.executionId, "FAILED", instructionUrl, access_key)
+        if cancellation_scope.stop_reason() == SHUTDOWN_REASON:
+            raise ExecutionInterrupted(pipelineRequest.executionId)
+        if cancellation_scope.stop_reason():
+            raise HTTPException(status_code=409, detail=f"Execution stopped: {cancellation_scope.reason}")
         raise HTTPException(status_code=500, detail=str(e))
 
     finally:
@@ -240,7 +671,20 @@ async def execute(access_key: Annotated[str | None, Header()] = None, pipelineRe
 
 
 @app.post("/force/platform/pipeline/api/v1/execute/files")
-async def execute(access_key: Annotated[str | None, Header()] = None, files: list[UploadFile] = None, pipeLineId: Annotated[str, Form()] = None, userInputs: Annotated[str, Form()] = None, user: Annotated[str, Form()] = None, executionId: Annotated[str, Form()] = None):
+async def execute(access_key: Annotated[str | None, Header()] = None, files: list[UploadFile] = None, pipeLineId: Annotated[str, Form()] = None, userInputs: Annotated[str, Form()] = None, user: Annotated[str, Form()] = None, executionId: Annotated[str, Form()] = None, priority: Annotated[str, Form()] = None):
+
+    async def run():
+        ticket = admission_controller.request(user, priority)
+        async with admission_controller.admitted(ticket):
+            if execution_store:
+                execution_store.mark_running(executionId)
+            return await run_files_execution(access_key, files, pipeLineId, userInputs, user, executionId)
+
+    # A retried upload attaches to the running execution instead of starting a second one in the same workspace
+    return await run_once(executionId, pipeLineId, user, {"pipeLineId": pipeLineId, "userInputs": userInputs, "user": user}, run)
+
+
+async def run_files_execution(access_key: str, files: list[UploadFile], pipeLineId: str, userInputs: str, user: str, executionId: str):
 
     temporary_images = None  # Add this to track temporary image files
     try:
@@ -250,17 +694,15 @@ async def execute(access_key: Annotated[str | None, Header()] = None, files: lis
 
         logStream = os.getenv('ENABLE_LOGSTREAMING')
         persistent_logging = os.getenv("PERSISTENT_LOGGING")
-        helpers.save_initial_workflow_history(pipeLineId, executionId, user, userInputs, adminUrl, access_key)        
+        await helpers.save_initial_workflow_history(pipeLineId, executionId, user, userInputs, adminUrl, access_key)        
         if logStream == 'True' or persistent_logging == 'True':
             logger.debug("Log stream enabled is -------------- %s", logStream)
             logger.debug("Persistent logging is enabled-------------- %s", persistent_logging)
 
-            PipelineAILogs.executionId = executionId
-            PipelineAILogs.pipelineId = pipeLineId
-            PipelineAILogs.sender = user
+            bind_execution_context(executionId=executionId, pipelineId=pipeLineId, sender=user)
     
-        pipelineJson = getPipelinePayload(access_key, pipeLineId)
-        helpers.save_payload_workflow_history(pipeLineId, executionId,pipelineJson,adminUrl,access_key)
+        pipelineJson = await getPipelinePayload(access_key, pipeLineId)
+        await helpers.save_payload_workflow_history(pipeLineId, executionId,pipelineJson,adminUrl,access_key)
         logger.debug("Pipeline payload is ---------------- %s", pipelineJson)
 
         try:
@@ -274,7 +716,7 @@ async def execute(access_key: Annotated[str | None, Header()] = None, files: lis
 
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse userInput: {userInputs}. Error: {str(e)}")
-            helpers.send_execution_status(executionId, "FAILED", instructionUrl, access_key)
+            await helpers.send_execution_status(executionId, "FAILED", instructionUrl, access_key)
             raise HTTPException(
                 status_code=400,
                 detail="Invalid format for userInput. Expected JSON string."
@@ -289,10 +731,14 @@ async def execute(access_key: Annotated[str | None, Header()] = None, files: lis
 
         logger.debug(f"Payload created with userInputs: {payloadObject.userInputs}")
 
+        cancellation_scope = CancellationScope.for_execution(executionId)
+
         try:
             pipelineFiles = PipelineFiles()
 
-            pipelineResponse = await pipelineFiles.execute_pipeline_files(payload=payloadObject, files=files, access_key = access_key)
+            with cancellation_registry.track(cancellation_scope):
+                cancellation_scope.check()
+                pipelineResponse = await pipelineFiles.execute_pipeline_files(payload=payloadObject, files=files, access_key = access_key)
 
             payloadObject.tasksOutputs = pipelineResponse[0].tasks_output
 
@@ -306,10 +752,10 @@ async def execute(access_key: Annotated[str | None, Header()] = None, files: lis
 
             logger.info("Final Pipeline response ------- %s", payloadObject)
 
-            helpers.save_final_workflow_history(pipeLineId, executionId, pipelineResponse, payloadObject, adminUrl, access_key, upload_file_id=pipelineResponse[1])
+            await helpers.save_final_workflow_history(pipeLineId, executionId, pipelineResponse, payloadObject, adminUrl, access_key, upload_file_id=pipelineResponse[1])
 
             # Send success status to Java API
-            helpers.send_execution_status(executionId, "SUCCESS", instructionUrl, access_key)
+            await helpers.send_execution_status(executionId, "SUCCESS", instructionUrl, access_key)
 
             if pipelineResponse[1]=="Not applicable":
                 response = payloadObject.model_dump(exclude={"file_download_url"})
@@ -321,12 +767,19 @@ async def execute(access_key: Annotated[str | None, Header()] = None, files: lis
             logger.error("Error from Pipeline execution ------- %s", str(err))
             PipelineAILogs().publishLogs("DA Pipeline Exception:" + str(err), "red",redisClient=redis_client)
             # Send failure status to Java API
-            helpers.send_execution_status(executionId, "FAILED", instructionUrl, access_key)
+            await helpers.send_execution_status(executionId, "FAILED", instructionUrl, access_key)
+            if cancellation_scope.stop_reason() == SHUTDOWN_REASON:
+                raise ExecutionInterrupted(executionId)
+            if cancellation_scope.stop_reason():
+                raise HTTPException(status_code=409, detail=f"Execution stopped: {cancellation_scope.reason}")
             raise HTTPException(status_code=500, detail=str(err))
+
+    except ExecutionInterrupted:
+        raise
      
     except Exception as e:
         logger.error(f"Unexpected error in pipeline execution: {e}")
-        helpers.send_execution_status(executionId, "FAILED", instructionUrl, access_key)
+        await helpers.send_execution_status(executionId, "FAILED", instructionUrl, access_key)
         raise HTTPException(status_code=500, detail=f"Unexpected error in pipeline execution: {e}")
 
     finally:
@@ -350,7 +803,7 @@ def remove_readonly(func, path, exc):
             raise
 
 
-def getPipelinePayload(access_key, pipeLineId):
+async def getPipelinePayload(access_key, pipeLineId):
 
     if not access_key:
         logger.error("Access key is required")
@@ -365,32 +818,32 @@ def getPipelinePayload(access_key, pipeLineId):
     headers = {'access-key': access_key, 'Content-Type': 'application/json'}
     logger.debug("headers is ----------------- %s", headers)
 
-    timeout = httpx.Timeout(connect=30.0, read=60.0, write=10.0, pool=5.0)
-    logger.debug("timeout is ----------------- %s", timeout)
+    logger.debug("adminUrl is ----------------- %s", adminUrl)
+    if adminUrl == None:
+        raise HTTPException(status_code=400, detail="Environment variable ADMIN_URL is not set. Please add value to the ADMIN_URL environment variable")
 
-    try:
+    async def fetch(conditional_headers):
+        try:
+            adminResponse = await http_client.request(
+                "GET", adminUrl+'/ava/force/workflow/payload', "payload",
+                params=params, headers={**headers, **conditional_headers}
+            )
+            if adminResponse.status_code != 304:
+                adminResponse.raise_for_status()
 
-        logger.debug("adminUrl is ----------------- %s", adminUrl)
-        if adminUrl == None:
-            raise HTTPException(status_code=400, detail="Environment variable ADMIN_URL is not set. Please add value to the ADMIN_URL environment variable")
+        except httpx.HTTPStatusError as e:
+            logger.error("Admin api status error ----------------- %s", str(e))
+            raise HTTPException(status_code=adminResponse.status_code, detail = str(e))
+         
+        except httpx.RequestError as e:
+            logger.error("Admin api request error ----------------- %s", str(e))
+            raise HTTPException(status_code=500, detail = str(e)) 
 
-        adminResponse = httpx.get(
-            adminUrl+'/ava/force/workflow/payload',
-            params=params, headers=headers, timeout=timeout
-        )
-        adminResponse.raise_for_status()
+        return adminResponse
 
-    except httpx.HTTPStatusError as e:
-        logger.error("Admin api status error ----------------- %s", str(e))
-        raise HTTPException(status_code=adminResponse.status_code, detail = str(e))
-     
-    except httpx.RequestError as e:
-        logger.error("Admin api request error ----------------- %s", str(e))
-        raise HTTPException(status_code=500, detail = str(e)) 
-
-    logger.info("Admin pipeline payload response ----------------- %s", adminResponse.json())
+    pipelineJson = await payload_cache.get(pipeLineId, access_key, fetch)
 
-    pipelineJson = adminResponse.json()
+    logger.info("Admin pipeline payload response ----------------- %s", pipelineJson)
 
     if 'pipeline' not in pipelineJson:
         logger.info("Pipeline not found in the response")
@@ -404,10 +857,8 @@ async def execute(payload: PipelineModel):
 
 @app.post("/platform/pipeline/api/v1/execute/files")
 async def execute(payload: str = Form(...), files: list[UploadFile] = None):
-    print(f"Payload: {payload}")
     payload_dict = json.loads(payload)
     payloadObject = PipelineModel(**payload_dict)
-    print(f"Payload: {payloadObject}")
     pipelineFiles = PipelineFiles()
     return await pipelineFiles.execute_pipeline_files(payload=payloadObject, files=files)
 
@@ -430,7 +881,144 @@ TOOL_INSTRUCTIONS = {
         "KnowledgeRAGTool": "\n\nYou have access to the KnowledgeRAGTool. It is advised to use this tool when you have access to it irrespective of whether a knowledge retrieval task has been assigned explicitly."
     }
 
-async def setup_agents(agent: AgentDetails, userInputs:Dict[str,str], memory: bool, langfuse_config, executionId):
+def compile_agent(agent: AgentDetails):
+    """Builds the parts of an agent that only depend on its definition, they are cached in pipeline_cache."""
+    has_image = "{{image" in agent.task.description
+
+    toolbox = []
+
+    llm = llm_factory.get(agent.llm)
+    
+    # Build common agent arguments
+    agent_args = {
+        "role": agent.role,
+        "goal": agent.goal,
+        "backstory": agent.backstory,
+        #"callbacks": [langfuse_config],
+        "verbose": agent.verbose,
+        "max_iter": 25 if agent.maxIter == 0 else agent.maxIter,
+        "max_rpm": None if agent.maxRpm == 0 else agent.maxRpm,
+        "max_execution_time": None if agent.maxExecutionTime == 0 else agent.maxExecutionTime,
+        "allow_delegation": agent.allowDelegation,
+        "cache": False,
+        "allow_code_execution": agent.allowCodeExecution,
+        "code_execution_mode": "safe" if agent.isSafeCodeExecution else "unsafe"
+    }
+    
+    # Optional fields
+    logger.debug("Agent tools are ---------------- %s", agent.tools)
+    
+    # Add use_system_prompt only for certain LLMs
+    if any(keyword in agent.llm.model for keyword in ["claude", "anthropic", "bedrock"]):
+        agent_args["use_system_prompt"] = os.getenv("USE_SYSTEM_PROMPT", "true").lower() == "true"
+    elif "o1" in agent.llm.model or "o3" in agent.llm.model:
+        agent_args["use_system_prompt"] = False
+
+    code_conversion_task = agent.task.description
+
+    # Tool instructions go to the end of the backstory instead of the task, so the system prompt holds every
+    # part of the agent that does not change between runs and providers can cache it as a prompt prefix
+    tool_instructions = ""
+    tool_names = [tool.toolName for tool in agent.tools]
+    if "FileWriterTool" in tool_names:
+        tool_instructions += TOOL_INSTRUCTIONS["FileWriterTool"]
+    if "SerperDevTool" in tool_names:
+        tool_instructions += TOOL_INSTRUCTIONS["SerperDevTool"]
+    if "NL2SQLTool" in tool_names:
+        tool_instructions += TOOL_INSTRUCTIONS["NL2SQLTool"]
+    if "ScrapeWebsiteTool" in tool_names:
+        tool_instructions += TOOL_INSTRUCTIONS["ScrapeWebsiteTool"]
+    if "MemoryReaderWriterTool" in tool_names:
+        tool_instructions += TOOL_INSTRUCTIONS["MemoryReaderWriterTool"]
+
+    if has_image:
+        toolbox.append(PerRunTool(lambda executionId, llm: Imagetool(llm=llm)))
+
+    for tool in agent.tools:
+        # Tools that keep a session, scraped content or a database engine are built on every run,
+        # compiling them only validates their parameters
+        if tool.toolName == 'ScrapeWebsiteTool':
+            website_url = None
+            for param in tool.parameters:
+                if param.parameterName == "website_url" and param.value and param.value.strip():
+                    website_url = param.value
+            
+            if website_url == None:
+                PipelineAILogs().publishLogs("Website URL not provided for scrape website tool.", "red", redisClient=redis_client)
+                raise HTTPException(status_code=500, detail="Website URL not provided for scrape website tool.")
+            
+            logger.info("ScrapeWebsiteTool -------------------- %s", website_url)
+            # agent_model.tools.append(scrapeWebsiteTool)
+            toolbox.append(PerRunTool(lambda executionId, llm, url=website_url: tool_registry.get("ScrapeWebsiteTool")(website_url=url)))
+            
+        elif tool.toolName == 'MemoryReaderWriterTool':
+            logger.info("MemoryReaderWriterTool being added to the agent")
+            # agent_model.tools.append(memReadWriteTool)
+            toolbox.append(PerRunTool(lambda executionId, llm: MemoryReaderWriterTool(execution_id=executionId)))
+            
+        elif tool.toolName == 'SerperDevTool':
+            serper_api_key = None
+            for param in tool.parameters:
+                if (param.parameterName.lower() == "serper_api_key") and (param.value is not None) and (param.value.strip()):
+                    serper_api_key = param.value
+
+                elif (param.value is None) or (param.parameterName.lower() == "serper_api_key" and not param.value.strip()):
+                    PipelineAILogs().publishLogs("Serper API key not provided for SerperDevTool.", "red", redisClient=redis_client)
+                    raise HTTPException(status_code=500, detail="Serper API key not provided for SerperDevTool.")
+            
+            logger.info("SerperDevTool being added to the agent")
+
+            toolbox.append(PerRunTool(lambda executionId, llm, api_key=serper_api_key: tool_registry.get("SerperDevTool")(api_key=api_key)))
+            # agent_model.tools.append(serperDevTool)
+
+        elif tool.toolName == "FileWriterTool":
+
+            logger.info("FileWriterTool being added to the agent")
+
+            toolbox.append(PerRunTool(lambda executionId, llm: FileWriterTool(base_dir=os.path.join(os.getcwd(), str(executionId)))))
+
+            # file_writer_tool = get_file_writer_tool(base_dir = base_dir)
+
+            # agent_model.tools.append(file_writer_tool)
+    
+        elif tool.toolName == 'NL2SQLTool':
+            encoded_uri = None
+            for param in tool.parameters:
+                if param.parameterName == "db_uri" and param.value and param.value.strip():
+                    encoded_uri = encode_db_uri(param.value)
+            if encoded_uri == None:
+                PipelineAILogs().publishLogs("Database URI not provided for NL2SQL tool.", "red", redisClient=redis_client)
+                raise HTTPException(status_code=500, detail="Database URI not provided for NL2SQL tool.")
+      
+            # agent_model.tools.append(nl2sql_tool)
+            toolbox.append(PerRunTool(lambda executionId, llm, db_uri=encoded_uri: tool_registry.get("NL2SQLTool")(db_uri=db_uri)))
+        
+
+    for tool in agent.userTools:
+        tool_class_name = tool.toolClassName
+        logger.debug("user tool class name ------------ %s ",tool_class_name)
+        tool_class_definition = tool.toolClassDef
+        # User tool code may read the access key or other per execution state when it is instantiated
+        toolbox.append(PerRunTool(lambda executionId, llm, name=tool_class_name, definition=tool_class_definition: add_dynamic_user_tools(name, definition)))
+        tool_instructions += f"\n\nYou have access to the the tool '{tool_class_name}'. It is advised to use this tool when you have access to it irrespective of whether it has been asked to be used explicitly."
+
+    if not agent.embedding == None:
+        tool_instructions += TOOL_INSTRUCTIONS["KnowledgeRAGTool"]
+
+    agent_args["backstory"] = (agent.backstory or "") + tool_instructions
+
+    return CompiledAgent(
+        llm=llm,
+        agent_args=agent_args,
+        task_template=code_conversion_task,
+        tools=toolbox,
+        expected_output=agent.task.expectedOutput,
+        embedding=agent.embedding,
+        uses_memory_tool=any(tool.toolName == 'MemoryReaderWriterTool' for tool in agent.tools)
+    )
+
+
+def setup_agents(agent: AgentDetails, userInputs:Dict[str,str], memory: bool, langfuse_config, executionId, pipelineId=None, llm_cache=False, semantic_cache=False, master_embedding=None):
     def step_callback_fun(step: Any):
         if isinstance(step, AgentFinish):
             agent_name = step.agent.role
@@ -462,229 +1050,30 @@ async def setup_agents(agent: AgentDetails, userInputs:Dict[str,str], memory: bo
             redis_client.set(key, updated_value, ex=7200)
             logger.info("Updated task list stored")
     try:
+        compiled = pipeline_cache.get_or_compile(pipeline_cache.key(pipelineId, agent, "default"), lambda: compile_agent(agent))
 
-        has_image = "{{image" in agent.task.description
+        llm = compiled.bind_llm(langfuse_config)
+        llm.response_cache = agent.llmCache if agent.llmCache is not None else llm_cache
+        if agent.semanticCache if agent.semanticCache is not None else semantic_cache:
+            bind_semantic_cache(llm, pipelineId, agent.embedding, master_embedding)
 
-        toolbox = []
+        agent_args = dict(compiled.agent_args, llm=llm, function_calling_llm=llm, memory=memory)
 
-        if agent.llm.aiEngine == 'AzureOpenAI':
-            if "o1" in agent.llm.model or "o3" in agent.llm.model:
-                llm = LLM(
-                    model="azure/" + agent.llm.llmDeploymentName,
-                    base_url=agent.llm.azureEndpoint,
-                    api_key=agent.llm.apiKey,
-                    api_version=agent.llm.llmApiVersion,
-                    metadata=langfuse_config,
-                )
-            elif "deepseek" in agent.llm.model.lower():
-                llm = LLM(
-                    model=agent.llm.model,
-                    temperature=agent.llm.temperature,
-                    max_tokens=agent.llm.maxToken,
-                    base_url=agent.llm.azureEndpoint,
-                    api_key=agent.llm.apiKey,
-                    metadata=langfuse_config,
-                )
-            else:
-                llm = LLM(
-                    model="azure/" + agent.llm.llmDeploymentName,
-                    temperature=agent.llm.temperature,
-                    max_tokens=agent.llm.maxToken,
-                    base_url=agent.llm.azureEndpoint,
-                    api_key=agent.llm.apiKey,
-                    api_version=agent.llm.llmApiVersion,
-                    metadata=langfuse_config,
-                )
-        elif agent.llm.aiEngine == 'AmazonBedrock':
-            if USE_BEDROCK_CREDENTIALS == 'True' or USE_BEDROCK_CREDENTIALS == 'true':
-                logger.debug("Bedrock Credentials are used. %s", USE_BEDROCK_CREDENTIALS)
-                
-                if 'llama' in agent.llm.bedrockModelId.lower():
-                    logger.debug("Using Patched Bedrock LLM for Llama model")
-                    
-                    llm = PatchedBedrockLLM(
-                        model="bedrock/" + agent.llm.bedrockModelId,
-                        aws_access_key_id=agent.llm.accessKey,
-                        aws_secret_access_key=agent.llm.secretKey,
-                        aws_region_name=agent.llm.region,
-                        max_tokens=agent.llm.maxToken,
-                        temperature=agent.llm.temperature,
-                        top_p=agent.llm.topP,
-                    )
-                    
-                else: 
-                    logger.debug("Using standard Bedrock LLM") 
-                    llm = LLM(
-                        model="bedrock/" + agent.llm.bedrockModelId,
-                        aws_access_key_id=agent.llm.accessKey,
-                        aws_secret_access_key=agent.llm.secretKey,
-                        aws_region_name=agent.llm.region,
-                        max_tokens=agent.llm.maxToken,
-                        temperature=agent.llm.temperature,
-                        top_p=agent.llm.topP,
-                        metadata=langfuse_config,
-                    )
-            else:
-                logger.debug("Bedrock Credentials are not used. %s", USE_BEDROCK_CREDENTIALS)
-                llm = LLM(
-                    model="bedrock/" + agent.llm.bedrockModelId,
-                    aws_region_name=agent.llm.region,
-                    max_tokens=agent.llm.maxToken,
-                    temperature=agent.llm.temperature,
-                    top_p=agent.llm.topP,
-                    metadata=langfuse_config,
-                )
-        elif agent.llm.aiEngine == 'GoogleAI':
-            logger.debug("Inside GoogleAI Block............")
-            llm = LLM(
-                model="vertex_ai/"+agent.llm.model,
-                gcp_project_id=agent.llm.gcpProjectId,
-                temperature=agent.llm.temperature,
-                max_tokens=agent.llm.maxToken,
-                location=agent.llm.gcpLocation,
-                metadata=langfuse_config,
-            )
-        else:
-            logger.error("Unsupported LLM type ----------------- %s", agent.llm.aiEngine)
-            raise HTTPException(status_code=500, detail="Unsupported LLM type" + agent.llm.aiEngine)
-        
-        # Build common agent arguments
-        agent_args = {
-            "role": agent.role,
-            "goal": agent.goal,
-            "backstory": agent.backstory,
-            #"callbacks": [langfuse_config],
-            "llm": llm,
-            "function_calling_llm": llm,
-            "verbose": agent.verbose,
-            "max_iter": 25 if agent.maxIter == 0 else agent.maxIter,
-            "max_rpm": None if agent.maxRpm == 0 else agent.maxRpm,
-            "max_execution_time": None if agent.maxExecutionTime == 0 else agent.maxExecutionTime,
-            "allow_delegation": agent.allowDelegation,
-            "memory": memory,
-            "cache": False,
-            "allow_code_execution": agent.allowCodeExecution,
-            "code_execution_mode": "safe" if agent.isSafeCodeExecution else "unsafe"
-        }
-        
-        # Optional fields
-        print("Agent tools are ---------------- %s", agent.tools)
-        
-        if any(tool.toolName == 'MemoryReaderWriterTool' for tool in agent.tools):
+        if compiled.uses_memory_tool:
             agent_args["step_callback"] = step_callback_fun
 
-        # Add use_system_prompt only for certain LLMs
-        if any(keyword in agent.llm.model for keyword in ["claude", "anthropic", "bedrock"]):
-            agent_args["use_system_prompt"] = os.getenv("USE_SYSTEM_PROMPT", "true").lower() == "true"
-        elif "o1" in agent.llm.model or "o3" in agent.llm.model:
-            agent_args["use_system_prompt"] = False
-
-        code_conversion_task = agent.task.description
-
-        # Append tool instructions if the tool is present
-        tool_names = [tool.toolName for tool in agent.tools]
-        if "FileWriterTool" in tool_names:
-            code_conversion_task += TOOL_INSTRUCTIONS["FileWriterTool"]
-        if "SerperDevTool" in tool_names:
-            code_conversion_task += TOOL_INSTRUCTIONS["SerperDevTool"]
-        if "NL2SQLTool" in tool_names:
-            code_conversion_task += TOOL_INSTRUCTIONS["NL2SQLTool"]
-        if "ScrapeWebsiteTool" in tool_names:
-            code_conversion_task += TOOL_INSTRUCTIONS["ScrapeWebsiteTool"]
-        if "MemoryReaderWriterTool" in tool_names:
-            code_conversion_task += TOOL_INSTRUCTIONS["MemoryReaderWriterTool"]
-
-        for key, value in userInputs.items():
-            
-            code_conversion_task = code_conversion_task.replace(key, value)
+        code_conversion_task = compiled.bind_task(userInputs)
 
-    
-        if has_image:
-            toolbox.append(Imagetool(llm=llm))
-
-        for tool in agent.tools:
-            if tool.toolName == 'ScrapeWebsiteTool':
-                scrapeWebsiteTool = None
-                for param in tool.parameters:
-                    if param.parameterName == "website_url" and param.value and param.value.strip():
-                        scrapeWebsiteTool = ScrapeWebsiteTool(
-                            website_url=param.value)
-                
-                if scrapeWebsiteTool == None:
-                    PipelineAILogs().publishLogs("Website URL not provided for scrape website tool.", "red", redisClient=redis_client)
-                    raise HTTPException(status_code=500, detail="Website URL not provided for scrape website tool.")
-                
-                logger.info("ScrapeWebsiteTool -------------------- %s", scrapeWebsiteTool)
-                # agent_model.tools.append(scrapeWebsiteTool)
-                toolbox.append(scrapeWebsiteTool)
-                
-            elif tool.toolName == 'MemoryReaderWriterTool':
-                logger.info("MemoryReaderWriterTool being added to the agent")
-                memReadWriteTool = MemoryReaderWriterTool(execution_id=executionId)
-                # agent_model.tools.append(memReadWriteTool)
-                toolbox.append(memReadWriteTool)
-                
-            elif tool.toolName == 'SerperDevTool':
-                serperDevTool = SerperDevTool()
-                for param in tool.parameters:
-                    if (param.parameterName.lower() == "serper_api_key") and (param.value is not None) and (param.value.strip()):
-                        os.environ['SERPER_API_KEY'] = param.value
-
-                    elif (param.value is None) or (param.parameterName.lower() == "serper_api_key" and not param.value.strip()):
-                        PipelineAILogs().publishLogs("Serper API key not provided for SerperDevTool.", "red", redisClient=redis_client)
-                        raise HTTPException(status_code=500, detail="Serper API key not provided for SerperDevTool.")
-                
-                logger.info("SerperDevTool -------------------- %s", serperDevTool)
-
-                toolbox.append(serperDevTool)
-                # agent_model.tools.append(serperDevTool)
-
-            elif tool.toolName == "FileWriterTool":
-
-                logger.info("FileWriterTool being added to the agent")
-
-                base_dir = os.path.join(os.getcwd(), str(executionId))
-
-                toolbox.append(FileWriterTool(base_dir=base_dir))
-
-                # file_writer_tool = get_file_writer_tool(base_dir = base_dir)
-
-                # agent_model.tools.append(file_writer_tool)
-        
-            elif tool.toolName == 'NL2SQLTool':
-                nl2sql_tool = None
-                for param in tool.parameters:
-                    if param.parameterName == "db_uri" and param.value and param.value.strip():
-                        encoded_uri = encode_db_uri(param.value)
-                        nl2sql_tool = SQLTool(db_uri=encoded_uri)
-                if nl2sql_tool == None:
-                    PipelineAILogs().publishLogs("Database URI not provided for NL2SQL tool.", "red", redisClient=redis_client)
-                    raise HTTPException(status_code=500, detail="Database URI not provided for NL2SQL tool.")
-          
-                # agent_model.tools.append(nl2sql_tool)
-                toolbox.append(nl2sql_tool)
-            
+        toolbox = compiled.bind_tools(executionId, llm)
 
-        for tool in agent.userTools:
-            tool_class_name = tool.toolClassName
-            logger.debug("user tool class name ------------ %s ",tool_class_name)
-            tool_class_definition = tool.toolClassDef
-            logger.debug("user tool class def ------------ ")
-            tool_instance = add_dynamic_user_tools(tool_class_name,tool_class_definition)
-            logger.debug("user tool instance created")
-            code_conversion_task += f"\n\nYou have access to the the tool '{tool_class_name}'. It is advised to use this tool when you have access to it irrespective of whether it has been asked to be used explicitly."
-            # agent_model.tools.append(tool_instance)
-            toolbox.append(tool_instance)
-
-        if not agent.embedding == None:
-            logger.debug("Agent embedding ------------ %s ", agent.embedding)
-            code_conversion_task += TOOL_INSTRUCTIONS["KnowledgeRAGTool"]
-            contextTool = KnowledgeRAGTool(input=code_conversion_task,
-                                           agentEmbedding=agent.embedding,
+        if compiled.embedding is not None:
+            logger.debug("Agent embedding ------------ %s ", compiled.embedding)
+            contextTool = tool_registry.get("KnowledgeRAGTool")(input=code_conversion_task,
+                                           agentEmbedding=compiled.embedding,
                                            kwargs={"redis_client": redis_client})
             toolbox.append(contextTool)
             # agent_model.tools.append(contextTool)
-        
+
         agent_args["tools"] = toolbox
 
         # Instantiate the agent
@@ -694,7 +1083,7 @@ async def setup_agents(agent: AgentDetails, userInputs:Dict[str,str], memory: bo
 
         task = Task(
             description=code_conversion_task,
-            expected_output=agent.task.expectedOutput,
+            expected_output=compiled.expected_output,
             agent=agent_model
         )
 
@@ -751,95 +1140,17 @@ async def setup_agents(agent: AgentDetails, userInputs:Dict[str,str], memory: bo
 
 async def execute_pipeline_logic(payload: PipelineModel, langfuse_config, access_key: str):
     try:
-        agents = []
-        tasks = []
         folder_path = os.path.join(os.getcwd(),payload.executionId)
 
-        for agent_data in payload.pipeLineAgents:
-            agent, task = await setup_agents(agent_data.agent, payload.userInputs, payload.enableAgenticMemory, langfuse_config, payload.executionId)
-            agents.append(agent)
-            tasks.append(task)
-
-        manager_llm = None
-        if payload.managerLlm:
-            if payload.managerLlm.aiEngine == 'AmazonBedrock':
-                if USE_BEDROCK_CREDENTIALS == 'True' or USE_BEDROCK_CREDENTIALS == 'true':
-                    logger.debug("Bedrock Credentials are used. %s", USE_BEDROCK_CREDENTIALS)
-                    
-                    if 'llama' in payload.managerLlm.bedrockModelId.lower():
-                        logger.debug("Using Patched Bedrock LLM for Llama model")
-                        manager_llm = PatchedBedrockLLM(
-                            model="bedrock/" + payload.managerLlm.bedrockModelId,
-                            aws_access_key_id=payload.managerLlm.accessKey,
-                            aws_secret_access_key=payload.managerLlm.secretKey,
-                            aws_region_name=payload.managerLlm.region,
-                            max_tokens = payload.managerLlm.maxToken,
-                            temperature = payload.managerLlm.temperature,
-                            top_p = payload.managerLlm.topP,
-                        )
-                        
-                    else:
-                        logger.debug("Using standard Bedrock LLM")
-                        manager_llm = LLM(
-                            model="bedrock/" + payload.managerLlm.bedrockModelId,
-                            aws_access_key_id=payload.managerLlm.accessKey,
-                            aws_secret_access_key=payload.managerLlm.secretKey,
-                            aws_region_name=payload.managerLlm.region,
-                            max_tokens = payload.managerLlm.maxToken,
-                            temperature = payload.managerLlm.temperature,
-                            top_p = payload.managerLlm.topP,
-                            metadata = langfuse_config
-                        )
-                else:
-                    logger.debug("Bedrock Credentials are not used. %s", USE_BEDROCK_CREDENTIALS)
-                    manager_llm = LLM(
-                        model="bedrock/" + payload.managerLlm.bedrockModelId,
-                        aws_region_name=payload.managerLlm.region,
-                        max_tokens = payload.managerLlm.maxToken,
-                        temperature = payload.managerLlm.temperature,
-                        top_p = payload.managerLlm.topP,
-                        metadata = langfuse_config
-                    )
-            elif payload.managerLlm.aiEngine == 'AzureOpenAI':
-                if "o1" in payload.managerLlm.model or "o3" in payload.managerLlm.model:
-                    manager_llm = LLM(
-                        model="azure/" + payload.managerLlm.llmDeploymentName,
-                        base_url=payload.managerLlm.azureEndpoint,
-                        api_key=payload.managerLlm.apiKey,
-                        api_version=payload.managerLlm.llmApiVersion,
-                        metadata = langfuse_config
-                    )
-                elif "deepseek" in payload.managerLlm.model.lower():
-                    manager_llm = LLM(
-                        model=payload.managerLlm.model,
-                        temperature=payload.managerLlm.temperature,
-                        max_tokens=payload.managerLlm.maxToken,
-                        base_url=payload.managerLlm.azureEndpoint,
-                        api_key=payload.managerLlm.apiKey,
-                        metadata = langfuse_config
-                    )
-                else:
-                    manager_llm = LLM(
-                        model="azure/" + payload.managerLlm.llmDeploymentName,
-                        temperature=payload.managerLlm.temperature,
-                        max_tokens=payload.managerLlm.maxToken,
-                        base_url=payload.managerLlm.azureEndpoint,
-                        api_key=payload.managerLlm.apiKey,
-                        api_version=payload.managerLlm.llmApiVersion,
-                        metadata = langfuse_config
-                    )
-            elif payload.managerLlm.aiEngine == 'GoogleAI':
-                logger.debug("Inside GoogleAI Block............")
-                manager_llm = LLM(
-                    model="vertex_ai/" + payload.managerLlm.model,
-                    gcp_project_id=payload.managerLlm.gcpProjectId,
-                    temperature=payload.managerLlm.temperature,
-                    max_tokens=payload.managerLlm.maxToken,
-                    location=payload.managerLlm.gcpLocation,
-                    metadata = langfuse_config
-                )
-            else:
-                raise ValueError("Unsupported LLM type for manager_llm")
+        agents, tasks = await setup_agents_concurrently(setup_agents, payload.pipeLineAgents, userInputs=payload.userInputs, memory=payload.enableAgenticMemory,
+                                                        langfuse_config=langfuse_config, executionId=payload.executionId, pipelineId=payload.pipelineId,
+                                                        llm_cache=payload.llmCache, semantic_cache=payload.semanticCache, master_embedding=payload.masterEmbedding)
+
+        manager_llm = llm_factory.create(payload.managerLlm, langfuse_config) if payload.managerLlm else None
+        if manager_llm:
+            manager_llm.response_cache = payload.llmCache
+            if payload.semanticCache:
+                bind_semantic_cache(manager_llm, payload.pipelineId, None, payload.masterEmbedding)
 
         if manager_llm:
             logger.debug("manager llm values  %s", manager_llm)
@@ -949,27 +1260,48 @@ async def execute_pipeline_logic(payload: PipelineModel, langfuse_config, access
 
             logger.debug("manager llm values null Else block ---------->")
             
-            crew = Crew(
+            crew_class = Crew
+            if has_task_graph(payload.pipeLineAgents):
+                logger.debug("Running pipeline as a task graph ---------------- %s", payload.pipelineId)
+                tasks = build_task_graph(payload.pipeLineAgents, tasks)
+                crew_class = DagCrew
+
+            if checkpoint_store and checkpoint_store.attach(payload.executionId, tasks) and crew_class is Crew:
+                # Only the task graph crew skips tasks restored from a checkpoint, a sequential pipeline becomes a chain
+                tasks = chain_tasks(tasks)
+                crew_class = DagCrew
+
+            crew_options = {}
+            if task_memo and payload.taskMemo:
+                # Memoized outputs are looked up when a task becomes ready, which the task graph crew does per task
+                if crew_class is Crew:
+                    tasks = chain_tasks(tasks)
+                    crew_class = DagCrew
+                crew_options["memo_scope"] = str(payload.pipelineId)
+
+            crew = crew_class(
                 agents=agents,
                 tasks=tasks,
                 verbose=True,
                 memory=payload.enableAgenticMemory,
-                embedder=create_embedder(payload.masterEmbedding) if payload.enableAgenticMemory else None
+                embedder=create_embedder(payload.masterEmbedding) if payload.enableAgenticMemory else None,
+                **crew_options
             )
 
-        crew_output = crew.kickoff()
+        crew_output = await execution_pool.run(crew.kickoff)
+        token_usage = agent_token_usage(crew)
 
-        file_id = zip_and_upload_folder(pipelineId=payload.pipelineId,executionId=payload.executionId,user=payload.user,folder_path=folder_path,access_key=access_key)
+        file_id = await zip_and_upload_folder(pipelineId=payload.pipelineId,executionId=payload.executionId,user=payload.user,folder_path=folder_path,access_key=access_key)
         
         PipelineAILogs().publishLogs("DA Pipeline Logs Completed", "green",redisClient=redis_client)
         
         for agent in agents:
             if any(isinstance(tool, FileWriterTool) for tool in agent.tools):
-                return crew_output, file_id
+                return crew_output, file_id, token_usage
             else:
                 continue
 
-        return crew_output,"Not applicable"
+        return crew_output,"Not applicable", token_usage
     
     except OutputParserException as err:
         logger.error("Output Parser ----------------- %s", str(err))
@@ -1028,12 +1360,43 @@ async def execute_pipeline_logic(payload: PipelineModel, langfuse_config, access
         # Ignore errors if folder doesn't exist
         try:
             if os.path.exists(folder_path):
-                shutil.rmtree(folder_path, ignore_errors=False, onerror=remove_readonly)
+                await execution_pool.run(shutil.rmtree, folder_path, ignore_errors=False, onerror=remove_readonly)
         except Exception as e:
             logger.error("Error Deleting generated file: %s", str(e))
             PipelineAILogs().publishLogs("DA Pipeline Exception:" + str(e), "red",redisClient=redis_client)
 
 
+def run_in_child_loop(coroutine):
+    # Every execution in a process pool child runs on a new loop, the HTTP client of the loop is closed with it
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await http_client.close_loop_client()
+
+    return asyncio.run(run())
+
+
+def run_pipeline_logic_in_process(payload_json, langfuse_config, execution_context, cancellation_scope=None):
+    # Entry point of the process pool, the crew is rebuilt from the payload inside the child process
+    set_execution_context(execution_context)
+    try:
+        with cancellation_registry.track(cancellation_scope) if cancellation_scope else contextlib.nullcontext():
+            return run_in_child_loop(execute_pipeline_logic(PipelineModel(**payload_json), langfuse_config, execution_context.access_key))
+    except HTTPException as err:
+        # Rebuild with positional arguments so the exception can be unpickled in the parent
+        raise HTTPException(err.status_code, err.detail)
+
+
+def run_pipeline_logic_files_in_process(payload_json, langfuse_config, subfolder_path, execution_context, cancellation_scope=None):
+    set_execution_context(execution_context)
+    try:
+        with cancellation_registry.track(cancellation_scope) if cancellation_scope else contextlib.nullcontext():
+            return run_in_child_loop(PipelineFiles().execute_pipeline_logic_files(PipelineModel(**payload_json), langfuse_config, subfolder_path, access_key=execution_context.access_key))
+    except HTTPException as err:
+        raise HTTPException(err.status_code, err.detail)
+
+
 def add_dynamic_user_tools(class_name, class_definition):
     try:
         # Execute the class definition
@@ -1052,4 +1415,4 @@ if __name__ == "__main__":
 
     import uvicorn
 
-    uvicorn.run(app=app, port=8081)
\ No newline at end of file
+    uvicorn.run(app=app, port=8081)
\ No newline at end of file
@@ -8,14 +8,13 @@ import errno
 import openai
 import litellm
 import json
-from helpers.helpers import zip_and_upload_folder, PatchedBedrockLLM
-from crewai_tools.tools.scrape_website_tool.scrape_website_tool import ScrapeWebsiteTool
-from crewai_tools.tools.serper_dev_tool.serper_dev_tool import SerperDevTool
+from helpers.helpers import zip_and_upload_folder
+from helpers.llm_factory import llm_factory
+from helpers.semantic_cache import bind_semantic_cache
 # from crewai.tools.structured_tool import CrewStructuredTool
 # from modified_library.file_writer_tool import get_file_writer_tool
-from knowledgeRagTool import KnowledgeRAGTool
 from helpers.db_uri import encode_db_uri
-from tools.sqltool import SQLTool
+from helpers.registry import tool_registry
 from typing import Dict, Any
 from fastapi import UploadFile, File, HTTPException
 from PipelineModel.PipelineModel import PipelineModel
@@ -24,18 +23,19 @@ from helpers.logger_config import logger
 from crewai import Agent, Task, Crew, Process, LLM
 from redis_logs import PipelineAILogs
 from langfuse.callback import CallbackHandler
-from crewai_tools import DirectoryReadTool
-from tools.filereadtool import FileReadTool
 from tools.memReadWriteTool import MemoryReaderWriterTool
 from crewai.agents.parser import AgentFinish
-from helpers.helpers import create_embedder
+from helpers.helpers import create_embedder, setup_agents_concurrently, agent_token_usage
 from modified_library.file_writer_tool import FileWriterTool
 from tools.image_tool import Imagetool
 
-import chardet
 from helpers.redis_client import redis_client
+from helpers.executor import execution_pool
+from helpers.dag_crew import DagCrew, has_task_graph, build_task_graph
+from helpers.execution_context import current_execution_context
+from helpers.cancellation import current_cancellation_scope
+from helpers.pipeline_cache import pipeline_cache, CompiledAgent, PerRunTool
 
-USE_BEDROCK_CREDENTIALS = os.getenv("USE_BEDROCK_CREDENTIALS", 'True')
 
 class PipelineFiles:
     
@@ -127,7 +127,12 @@ class PipelineFiles:
 
             langfuse_config = self.setup_langfuse(payload)
 
-            response = await self.execute_pipeline_logic_files(payload, langfuse_config, subfolder_path, access_key=access_key)
+            if execution_pool.uses_processes:
+                # Imported here as pipeline_ai imports this module
+                from pipeline_ai import run_pipeline_logic_files_in_process
+                response = await execution_pool.run_isolated(run_pipeline_logic_files_in_process, payload.model_dump(), langfuse_config, subfolder_path, current_execution_context(), current_cancellation_scope())
+            else:
+                response = await self.execute_pipeline_logic_files(payload, langfuse_config, subfolder_path, access_key=access_key)
             
             self.logger.info("Final Pipeline files Response.......... %s", response)
 
@@ -144,7 +149,7 @@ class PipelineFiles:
             # Ignore errors if folder doesn't exist
             try:
                 if os.path.exists(subfolder_path):
-                    shutil.rmtree(subfolder_path, ignore_errors=False, onerror=self.remove_readonly)
+                    await execution_pool.run(shutil.rmtree, subfolder_path, ignore_errors=False, onerror=self.remove_readonly)
             except Exception as e:
                 self.logger.error("Error Deleting zip file: %s", str(e))
                 PipelineAILogs().publishLogs("DA Pipeline Exception:" + str(e), "red",redisClient=self.redis_client)
@@ -182,99 +187,16 @@ class PipelineFiles:
 
     async def execute_pipeline_logic_files(self, payload: PipelineModel, langfuse_config, subfolder_path,access_key):
         try:
-            agents = []
-            tasks = []
-
-            for agent_data in payload.pipeLineAgents:
-                agent, task = await self.setup_agents_files(agent=agent_data.agent, userInputs=payload.userInputs, memory=payload.enableAgenticMemory, langfuse_config=langfuse_config,
-                                                            subfolder_path=subfolder_path,executionId=payload.executionId)
-                agents.append(agent)
-                tasks.append(task)
-
-            manager_llm = None
-            if payload.managerLlm:
-                if payload.managerLlm.aiEngine == 'AmazonBedrock':
-                    self.logger.info("Inside AmazonBedrock Block............")
-                    
-                    if USE_BEDROCK_CREDENTIALS == 'True' or USE_BEDROCK_CREDENTIALS == 'true':
-                        logger.debug("Bedrock Credentials are used. %s", USE_BEDROCK_CREDENTIALS)
-                        
-                        if 'llama' in payload.managerLlm.bedrockModelId.lower():
-                            logger.debug("Using Patched Bedrock LLM for Llama model")
-                            manager_llm = PatchedBedrockLLM(
-                                model="bedrock/" + payload.managerLlm.bedrockModelId,
-                                aws_access_key_id=payload.managerLlm.accessKey,
-                                aws_secret_access_key=payload.managerLlm.secretKey,
-                                aws_region_name=payload.managerLlm.region,
-                                max_tokens = payload.managerLlm.maxToken,
-                                temperature = payload.managerLlm.temperature,
-                                top_p = payload.managerLlm.topP,
-                            )
-                            
-                        else:
-                            logger.debug("Using standard Bedrock LLM")
-                            manager_llm = LLM(
-                                model="bedrock/" + payload.managerLlm.bedrockModelId,
-                                aws_access_key_id=payload.managerLlm.accessKey,
-                                aws_secret_access_key=payload.managerLlm.secretKey,
-                                aws_region_name=payload.managerLlm.region,
-                                temperature=payload.managerLlm.temperature,
-                                top_p=payload.managerLlm.topP,
-                                max_tokens=payload.managerLlm.maxToken,
-                                metadata=langfuse_config,
-                            )
-                    else:
-                        logger.debug("Bedrock Credentials are not used. %s", USE_BEDROCK_CREDENTIALS)
-                        manager_llm = LLM(
-                            model="bedrock/" + payload.managerLlm.bedrockModelId,
-                            aws_region_name=payload.managerLlm.region,
-                            temperature=payload.managerLlm.temperature,
-                            top_p=payload.managerLlm.topP,
-                            max_tokens=payload.managerLlm.maxToken,
-                            metadata=langfuse_config,
-                        )
-                elif payload.managerLlm.aiEngine == 'AzureOpenAI':
-                    self.logger.info("Inside AzureOpenAI Block............")
-                    if "o1" in payload.managerLlm.model or "o3" in payload.managerLlm.model:
-                        manager_llm = LLM(
-                            model="azure/" + payload.managerLlm.llmDeploymentName,
-                            base_url=payload.managerLlm.azureEndpoint,
-                            api_key=payload.managerLlm.apiKey,
-                            api_version=payload.managerLlm.llmApiVersion,
-                            metadata=langfuse_config,
-                        )
-                    elif "deepseek" in payload.managerLlm.model.lower():
-                        manager_llm = LLM(
-                            model=payload.managerLlm.model,
-                            temperature=payload.managerLlm.temperature,
-                            max_tokens=payload.managerLlm.maxToken,
-                            base_url=payload.managerLlm.azureEndpoint,
-                            api_key=payload.managerLlm.apiKey,
-                            metadata=langfuse_config,
-                        )
-                    else:
-                        manager_llm = LLM(
-                            model="azure/" + payload.managerLlm.llmDeploymentName,
-                            temperature=payload.managerLlm.temperature,
-                            max_tokens=payload.managerLlm.maxToken,
-                            base_url=payload.managerLlm.azureEndpoint,
-                            api_key=payload.managerLlm.apiKey,
-                            api_version=payload.managerLlm.llmApiVersion,
-                            metadata=langfuse_config,
-                        )
-                elif payload.managerLlm.aiEngine == 'GoogleAI':
-                    self.logger.info("Inside GoogleAI Block............")
-                    manager_llm = LLM(
-                        model="vertex_ai/" + payload.managerLlm.model,
-                        gcp_project_id=payload.managerLlm.gcpProjectId,
-                        temperature=payload.managerLlm.temperature,
-                        max_tokens=payload.managerLlm.maxToken,
-                        location=payload.managerLlm.gcpLocation,
-                        metadata=langfuse_config,
-                    )
-                else:
-                    self.logger.error("Unsupported LLM type for manager_llm ----------------- %s", payload.managerLlm.aiEngine)
-                    raise ValueError("Unsupported LLM type for manager_llm")
+            agents, tasks = await setup_agents_concurrently(self.setup_agents_files, payload.pipeLineAgents, userInputs=payload.userInputs, memory=payload.enableAgenticMemory,
+                                                            langfuse_config=langfuse_config, subfolder_path=subfolder_path, executionId=payload.executionId,
+                                                            pipelineId=payload.pipelineId, llm_cache=payload.llmCache,
+                                                            semantic_cache=payload.semanticCache, master_embedding=payload.masterEmbedding)
+
+            manager_llm = llm_factory.create(payload.managerLlm, langfuse_config) if payload.managerLlm else None
+            if manager_llm:
+                manager_llm.response_cache = payload.llmCache
+                if payload.semanticCache:
+                    bind_semantic_cache(manager_llm, payload.pipelineId, None, payload.masterEmbedding)
 
             if manager_llm:
                 self.logger.debug("manager llm values  %s", manager_llm)
@@ -382,7 +304,13 @@ class PipelineFiles:
                 )
             else:
                 self.logger.debug("manager llm values null Else block ---------->")
-                crew = Crew(
+                crew_class = Crew
+                if has_task_graph(payload.pipeLineAgents):
+                    self.logger.debug("Running pipeline as a task graph ---------------- %s", payload.pipelineId)
+                    tasks = build_task_graph(payload.pipeLineAgents, tasks)
+                    crew_class = DagCrew
+
+                crew = crew_class(
                     agents=agents,
                     tasks=tasks,
                     verbose=True,
@@ -390,21 +318,22 @@ class PipelineFiles:
                     embedder=create_embedder(payload.masterEmbedding) if payload.enableAgenticMemory else None
                 )
 
-            crew_output = crew.kickoff()
+            crew_output = await execution_pool.run(crew.kickoff)
+            token_usage = agent_token_usage(crew)
 
             folder_path = os.path.join(os.getcwd(),payload.executionId)
             
-            file_id = zip_and_upload_folder(pipelineId=payload.pipelineId,executionId=payload.executionId,user=payload.user,folder_path=folder_path,access_key=access_key)
+            file_id = await zip_and_upload_folder(pipelineId=payload.pipelineId,executionId=payload.executionId,user=payload.user,folder_path=folder_path,access_key=access_key)
 
             PipelineAILogs().publishLogs("DA Pipeline Logs Completed", "green",redisClient=self.redis_client)
 
             for agent in agents:
                 if any(isinstance(tool, FileWriterTool) for tool in agent.tools):
-                    return crew_output, file_id
+                    return crew_output, file_id, token_usage
                 else:
                     continue
 
-            return crew_output,"Not applicable"
+            return crew_output,"Not applicable", token_usage
 
         except openai.BadRequestError as err:
             self.logger.error("Failed to execute Pipeline files ----------------- %s", str(err))
@@ -470,7 +399,137 @@ class PipelineFiles:
             logger.error(f"Error adding dynamic user tool: {str(e)}")
             raise HTTPException(status_code=500,detail=f"Error adding dynamic user tool, there's an error in the tool code: {str(e)}")
 
-    async def setup_agents_files(self, agent: AgentDetails, userInputs: Dict[str, str], memory: bool, langfuse_config, subfolder_path,executionId):
+    def compile_agent_files(self, agent: AgentDetails):
+        """Files variant of compile_agent, the directory and file read tools are bound per execution in setup_agents_files."""
+        has_image = "{{image" in agent.task.description
+
+        toolbox = []
+
+        llm = llm_factory.get(agent.llm)
+
+        agent_args = {
+            "role": agent.role,
+            "goal": agent.goal,
+            "backstory": agent.backstory,
+            #"callbacks": [langfuse_config],
+            "verbose": agent.verbose,
+            "max_iter": 25 if agent.maxIter == 0 else agent.maxIter,
+            "max_rpm": None if agent.maxRpm == 0 else agent.maxRpm,
+            "max_execution_time": None if agent.maxExecutionTime == 0 else agent.maxExecutionTime,
+            "allow_delegation": agent.allowDelegation,
+            "cache": False,  # Passing human tools to the agent
+            "allow_code_execution": agent.allowCodeExecution,
+            "code_execution_mode": "safe" if agent.isSafeCodeExecution else "unsafe",
+        }
+
+        # Determine the use_system_prompt based on the model
+        if "o1" in agent.llm.model or "o3" in agent.llm.model:
+            agent_args["use_system_prompt"] = False
+        elif any(keyword in agent.llm.model for keyword in ["claude", "anthropic", "bedrock"]):
+            agent_args["use_system_prompt"] = os.getenv("USE_SYSTEM_PROMPT", "true").lower() == "true"
+
+        code_conversion_task = agent.task.description
+
+        # Tool instructions go to the end of the backstory, see compile_agent
+        tool_instructions = ""
+        tool_names = [tool.toolName for tool in agent.tools]
+        if "FileWriterTool" in tool_names:
+            tool_instructions += self.TOOL_INSTRUCTIONS["FileWriterTool"]
+        if "SerperDevTool" in tool_names:
+            tool_instructions += self.TOOL_INSTRUCTIONS["SerperDevTool"]
+        if "NL2SQLTool" in tool_names:
+            tool_instructions += self.TOOL_INSTRUCTIONS["NL2SQLTool"]
+        if "ScrapeWebsiteTool" in tool_names:
+            tool_instructions += self.TOOL_INSTRUCTIONS["ScrapeWebsiteTool"]
+        if "MemoryReaderWriterTool" in tool_names:
+            tool_instructions += self.TOOL_INSTRUCTIONS["MemoryReaderWriterTool"]
+
+        if has_image:
+            toolbox.append(PerRunTool(lambda executionId, llm: Imagetool(llm=llm)))
+
+        for tool in agent.tools:
+            # Tools that keep a session, scraped content or a database engine are built on every run,
+            # compiling them only validates their parameters
+            if tool.toolName == 'ScrapeWebsiteTool':
+                website_url = None
+                for param in tool.parameters:
+                    if param.parameterName == "website_url" and param.value and param.value.strip():
+                        website_url = param.value
+                        toolbox.append(PerRunTool(lambda executionId, llm, url=website_url: tool_registry.get("ScrapeWebsiteTool")(website_url=url)))
+                if website_url == None:
+                    PipelineAILogs().publishLogs("Website URL not provided for scrape website tool.", "red", redisClient=redis_client)
+                    raise HTTPException(status_code=500, detail="Website URL not provided for scrape website tool.")
+                logger.info("ScrapeWebsiteTool -------------------- %s", website_url)
+                # agent_model.tools.append(scrapeWebsiteTool)
+            
+            elif tool.toolName == 'MemoryReaderWriterTool':
+                logger.info("MemoryReaderWriterTool being added to the agent")
+                toolbox.append(PerRunTool(lambda executionId, llm: MemoryReaderWriterTool(execution_id=executionId)))
+                # agent_model.tools.append(memReadWriteTool)
+            
+            elif tool.toolName == 'SerperDevTool':
+                serper_api_key = None
+                for param in tool.parameters:
+                    if (param.parameterName.lower() == "serper_api_key") and (param.value is not None) and (param.value.strip()):
+                        serper_api_key = param.value
+
+                    elif (param.value is None) or (param.parameterName.lower() == "serper_api_key" and not param.value.strip()):
+                        PipelineAILogs().publishLogs("Serper API key not provided for SerperDevTool.", "red", redisClient=redis_client)
+                        raise HTTPException(status_code=500, detail="Serper API key not provided for SerperDevTool.")
+
+                logger.info("SerperDevTool being added to the agent")
+                toolbox.append(PerRunTool(lambda executionId, llm, api_key=serper_api_key: tool_registry.get("SerperDevTool")(api_key=api_key)))
+                # agent_model.tools.append(serperDevTool)
+
+            elif tool.toolName == "FileWriterTool":
+
+                logger.info("FileWriterTool being added to the agent")
+
+                toolbox.append(PerRunTool(lambda executionId, llm: FileWriterTool(base_dir=os.path.join(os.getcwd(), str(executionId)))))
+
+                # file_writer_tool = get_file_writer_tool(base_dir = base_dir)
+                
+                # toolbox.append(file_writer_tool)
+                # agent_model.tools.append(FileWriterTool(base_dir=base_dir))
+                
+            elif tool.toolName == 'NL2SQLTool':
+                encoded_uri = None
+                for param in tool.parameters:
+                    if param.parameterName == "db_uri" and param.value and param.value.strip():
+                        encoded_uri = encode_db_uri(param.value)
+
+                if encoded_uri == None:
+                    PipelineAILogs().publishLogs("Database URI not provided for NL2SQL tool.", "red", redisClient=redis_client)
+                    raise HTTPException(status_code=500, detail="Database URI not provided for NL2SQL tool.")
+
+                toolbox.append(PerRunTool(lambda executionId, llm, db_uri=encoded_uri: tool_registry.get("NL2SQLTool")(db_uri=db_uri)))
+                # agent_model.tools.append(nl2sql_tool)
+
+
+        for tool in agent.userTools:
+            tool_class_name = tool.toolClassName
+            logger.debug("user tool class name ------------ %s ",tool_class_name)
+            tool_class_definition = tool.toolClassDef
+            # User tool code may read the access key or other per execution state when it is instantiated
+            toolbox.append(PerRunTool(lambda executionId, llm, name=tool_class_name, definition=tool_class_definition: self.add_dynamic_user_tools(name, definition)))
+            tool_instructions += f"\n\nYou have access to the the tool '{tool_class_name}'. It is advised to use this tool when you have access to it irrespective of whether it has been asked to be used explicitly."
+
+        if agent.embedding:
+            tool_instructions += self.TOOL_INSTRUCTIONS["KnowledgeRAGTool"]
+
+        agent_args["backstory"] = (agent.backstory or "") + tool_instructions
+
+        return CompiledAgent(
+            llm=llm,
+            agent_args=agent_args,
+            task_template=code_conversion_task,
+            tools=toolbox,
+            expected_output=agent.task.expectedOutput,
+            embedding=agent.embedding,
+            uses_memory_tool=any(tool.toolName == 'MemoryReaderWriterTool' for tool in agent.tools)
+        )
+
+    def setup_agents_files(self, agent: AgentDetails, userInputs: Dict[str, str], memory: bool, langfuse_config, subfolder_path,executionId, pipelineId=None, llm_cache=False, semantic_cache=False, master_embedding=None):
         def step_callback_fun(step: Any):
             if isinstance(step, AgentFinish):
                 agent_name = step.agent.role
@@ -503,234 +562,31 @@ class PipelineFiles:
                 logger.info("Updated task list stored")
         
         try:
-            has_image = "{{image" in agent.task.description
-
-            toolbox = []
-
-            if agent.llm.aiEngine == 'AzureOpenAI':
-                self.logger.info("Inside AzureOpenAI Block............")
-                if "o1" in agent.llm.model or "o3" in agent.llm.model:
-                    llm = LLM(
-                        model="azure/" + agent.llm.llmDeploymentName,
-                        base_url=agent.llm.azureEndpoint,
-                        api_key=agent.llm.apiKey,
-                        api_version=agent.llm.llmApiVersion,
-                        metadata=langfuse_config,
-                    )
-                elif "deepseek" in agent.llm.model.lower():
-                    llm = LLM(
-                        model=agent.llm.model,
-                        temperature=agent.llm.temperature,
-                        max_tokens=agent.llm.maxToken,
-                        base_url=agent.llm.azureEndpoint,
-                        api_key=agent.llm.apiKey,
-                        metadata=langfuse_config,
-                    )
-                else:
-                    llm = LLM(
-                        model="azure/" + agent.llm.llmDeploymentName,
-                        temperature=agent.llm.temperature,
-                        max_tokens=agent.llm.maxToken,
-                        base_url=agent.llm.azureEndpoint,
-                        api_key=agent.llm.apiKey,
-                        api_version=agent.llm.llmApiVersion,
-                        metadata=langfuse_config,
-                    )
-            elif agent.llm.aiEngine == 'AmazonBedrock':
-                self.logger.info("Inside AmazonBedrock Block............")
-                
-                if USE_BEDROCK_CREDENTIALS == 'True' or USE_BEDROCK_CREDENTIALS == 'true':
-                    logger.debug("Bedrock Credentials are used. %s", USE_BEDROCK_CREDENTIALS)
-                    
-                    if 'llama' in agent.llm.bedrockModelId.lower():
-                        logger.debug("Using Patched Bedrock LLM for Llama model")
-                        
-                        llm = PatchedBedrockLLM(
-                            model="bedrock/" + agent.llm.bedrockModelId,
-                            aws_access_key_id=agent.llm.accessKey,
-                            aws_secret_access_key=agent.llm.secretKey,
-                            aws_region_name=agent.llm.region,
-                            max_tokens=agent.llm.maxToken,
-                            temperature=agent.llm.temperature,
-                            top_p=agent.llm.topP,
-                        )
-                        
-                    else:
-                        logger.debug("Using standard Bedrock LLM")
-                        llm = LLM(
-                            model="bedrock/" + agent.llm.bedrockModelId,
-                            aws_access_key_id=agent.llm.accessKey,
-                            aws_secret_access_key=agent.llm.secretKey,
-                            aws_region_name=agent.llm.region,
-                            temperature=agent.llm.temperature,
-                            top_p=agent.llm.topP,
-                            max_tokens=agent.llm.maxToken,
-                            metadata=langfuse_config,
-                        )
-                else:
-                    logger.debug("Bedrock Credentials are not used. %s", USE_BEDROCK_CREDENTIALS)
-                    llm = LLM(
-                        model="bedrock/" + agent.llm.bedrockModelId,
-                        aws_region_name=agent.llm.region,
-                        temperature=agent.llm.temperature,
-                        top_p=agent.llm.topP,
-                        max_tokens=agent.llm.maxToken,
-                        metadata=langfuse_config,
-                    )
-            elif agent.llm.aiEngine == 'GoogleAI':
-                self.logger.info("Inside GoogleAI Block............")
-                llm = LLM(
-                    model="vertex_ai/" + agent.llm.model,
-                    gcp_project_id=agent.llm.gcpProjectId,
-                    temperature=agent.llm.temperature,
-                    max_tokens=agent.llm.maxToken,
-                    location=agent.llm.gcpLocation,
-                    metadata=langfuse_config,
-                )
-            else:
-                self.logger.error("Unsupported LLM type ----------------- %s", agent.llm.aiEngine)
-                raise HTTPException(status_code=500, detail="Unsupported LLM type" + agent.llm.aiEngine)
-
-            dirTool = DirectoryReadTool(directory=str(subfolder_path))
-
-            file_read_tool = FileReadTool()
-
-            toolbox.append(dirTool)
-            toolbox.append(file_read_tool)
-
-            agent_args = {
-                "role": agent.role,
-                "goal": agent.goal,
-                "backstory": agent.backstory,
-                #"callbacks": [langfuse_config],
-                "llm": llm,
-                "function_calling_llm": llm,
-                "verbose": agent.verbose,
-                "max_iter": 25 if agent.maxIter == 0 else agent.maxIter,
-                "max_rpm": None if agent.maxRpm == 0 else agent.maxRpm,
-                "max_execution_time": None if agent.maxExecutionTime == 0 else agent.maxExecutionTime,
-                "allow_delegation": agent.allowDelegation,
-                "memory": memory,
-                "cache": False,  # Passing human tools to the agent
-                "allow_code_execution": agent.allowCodeExecution,
-                "code_execution_mode": "safe" if agent.isSafeCodeExecution else "unsafe",
-            }
+            compiled = pipeline_cache.get_or_compile(pipeline_cache.key(pipelineId, agent, "files"), lambda: self.compile_agent_files(agent))
+
+            llm = compiled.bind_llm(langfuse_config)
+            llm.response_cache = agent.llmCache if agent.llmCache is not None else llm_cache
+            if agent.semanticCache if agent.semanticCache is not None else semantic_cache:
+                bind_semantic_cache(llm, pipelineId, agent.embedding, master_embedding)
+
+            agent_args = dict(compiled.agent_args, llm=llm, function_calling_llm=llm, memory=memory)
 
             # Check if the tool is 'MemoryReaderWriterTool' and add step_callback
-            if any(tool.toolName == 'MemoryReaderWriterTool' for tool in agent.tools):
+            if compiled.uses_memory_tool:
                 agent_args["step_callback"] = step_callback_fun
 
-            # Determine the use_system_prompt based on the model
-            if "o1" in agent.llm.model or "o3" in agent.llm.model:
-                agent_args["use_system_prompt"] = False
-            elif any(keyword in agent.llm.model for keyword in ["claude", "anthropic", "bedrock"]):
-                agent_args["use_system_prompt"] = os.getenv("USE_SYSTEM_PROMPT", "true").lower() == "true"
-
-            code_conversion_task = agent.task.description
-
-            # Append tool instructions if the tool is present
-            tool_names = [tool.toolName for tool in agent.tools]
-            if "FileWriterTool" in tool_names:
-                code_conversion_task += self.TOOL_INSTRUCTIONS["FileWriterTool"]
-            if "SerperDevTool" in tool_names:
-                code_conversion_task += self.TOOL_INSTRUCTIONS["SerperDevTool"]
-            if "NL2SQLTool" in tool_names:
-                code_conversion_task += self.TOOL_INSTRUCTIONS["NL2SQLTool"]
-            if "ScrapeWebsiteTool" in tool_names:
-                code_conversion_task += self.TOOL_INSTRUCTIONS["ScrapeWebsiteTool"]
-            if "MemoryReaderWriterTool" in tool_names:
-                code_conversion_task += self.TOOL_INSTRUCTIONS["MemoryReaderWriterTool"]
-
-            for key, value in userInputs.items():
-                
-                code_conversion_task = code_conversion_task.replace(key, value)
-            
-            # agent_model.tools.append(dirTool)
-            # agent_model.tools.append(file_read_tool)
-
-            if has_image:
-                toolbox.append(Imagetool(llm=llm))
-
-            for tool in agent.tools:
-                if tool.toolName == 'ScrapeWebsiteTool':
-                    scrapeWebsiteTool = None
-                    for param in tool.parameters:
-                        if param.parameterName == "website_url" and param.value and param.value.strip():
-                            scrapeWebsiteTool = ScrapeWebsiteTool(
-                                website_url=param.value)
-                            toolbox.append(scrapeWebsiteTool)
-                    if scrapeWebsiteTool == None:
-                        PipelineAILogs().publishLogs("Website URL not provided for scrape website tool.", "red", redisClient=redis_client)
-                        raise HTTPException(status_code=500, detail="Website URL not provided for scrape website tool.")
-                    logger.info("ScrapeWebsiteTool -------------------- %s", scrapeWebsiteTool)
-                    # agent_model.tools.append(scrapeWebsiteTool)
-                
-                elif tool.toolName == 'MemoryReaderWriterTool':
-                    logger.info("MemoryReaderWriterTool being added to the agent")
-                    memReadWriteTool = MemoryReaderWriterTool(execution_id=executionId)
-                    toolbox.append(memReadWriteTool)
-                    # agent_model.tools.append(memReadWriteTool)
-                
-                elif tool.toolName == 'SerperDevTool':
-                    serperDevTool = SerperDevTool()
-                    for param in tool.parameters:
-                        if (param.parameterName.lower() == "serper_api_key") and (param.value is not None) and (param.value.strip()):
-                            os.environ['SERPER_API_KEY'] = param.value
-
-                        elif (param.value is None) or (param.parameterName.lower() == "serper_api_key" and not param.value.strip()):
-                            PipelineAILogs().publishLogs("Serper API key not provided for SerperDevTool.", "red", redisClient=redis_client)
-                            raise HTTPException(status_code=500, detail="Serper API key not provided for SerperDevTool.")
-
-                    logger.info("SerperDevTool -------------------- %s", serperDevTool)
-                    toolbox.append(serperDevTool)
-                    # agent_model.tools.append(serperDevTool)
-
-                elif tool.toolName == "FileWriterTool":
-
-                    logger.info("FileWriterTool being added to the agent")
-
-                    base_dir = os.path.join(os.getcwd(), str(executionId))
-
-                    toolbox.append(FileWriterTool(base_dir=base_dir))
-
-                    # file_writer_tool = get_file_writer_tool(base_dir = base_dir)
-                    
-                    # toolbox.append(file_writer_tool)
-                    # agent_model.tools.append(FileWriterTool(base_dir=base_dir))
-                    
-                elif tool.toolName == 'NL2SQLTool':
-                    nl2sql_tool = None
-                    for param in tool.parameters:
-                        if param.parameterName == "db_uri" and param.value and param.value.strip():
-                            encoded_uri = encode_db_uri(param.value)
-                            nl2sql_tool=SQLTool(db_uri=encoded_uri)
-
-                    if nl2sql_tool == None:
-                        PipelineAILogs().publishLogs("Database URI not provided for NL2SQL tool.", "red", redisClient=redis_client)
-                        raise HTTPException(status_code=500, detail="Database URI not provided for NL2SQL tool.")
-
-                    toolbox.append(nl2sql_tool)
-                    # agent_model.tools.append(nl2sql_tool)
-
-
-            for tool in agent.userTools:
-                tool_class_name = tool.toolClassName
-                logger.debug("user tool class name ------------ %s ",tool_class_name)
-                tool_class_definition = tool.toolClassDef
-                logger.debug("user tool class def ------------ ")
-                tool_instance = self.add_dynamic_user_tools(tool_class_name,tool_class_definition)
-                logger.debug("user tool instance created")
-                # agent_model.tools.append(tool_instance)
-                toolbox.append(tool_instance)
-                code_conversion_task += f"\n\nYou have access to the the tool '{tool_class_name}'. It is advised to use this tool when you have access to it irrespective of whether it has been asked to be used explicitly."
-            
-            if agent.embedding:
+            code_conversion_task = compiled.bind_task(userInputs)
+
+            # The uploaded files are specific to this execution
+            toolbox = [tool_registry.get("DirectoryReadTool")(directory=str(subfolder_path)), tool_registry.get("FileReadTool")()]
+            toolbox.extend(compiled.bind_tools(executionId, llm))
+
+            if compiled.embedding:
 
-                logger.debug("Agent embedding ------------ %s ", agent.embedding)
-                code_conversion_task += self.TOOL_INSTRUCTIONS["KnowledgeRAGTool"]
+                logger.debug("Agent embedding ------------ %s ", compiled.embedding)
 
-                contextTool = KnowledgeRAGTool(input=code_conversion_task,
-                                            agentEmbedding=agent.embedding,
+                contextTool = tool_registry.get("KnowledgeRAGTool")(input=code_conversion_task,
+                                            agentEmbedding=compiled.embedding,
                                             kwargs={"redis_client": redis_client})
                 toolbox.append(contextTool)
                 # agent_model.tools.append(contextTool)
@@ -741,7 +597,7 @@ class PipelineFiles:
 
             task = Task(
                 description=code_conversion_task,
-                expected_output=agent.task.expectedOutput,
+                expected_output=compiled.expected_output,
                 agent=agent_model
             )
     
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import signal
+from cryptography.fernet import InvalidToken
+from helpers.logger_config import logger
+from helpers.executor import execution_pool
+from helpers.execution_store import execution_store
+from helpers.http_client import http_client
+from helpers.outbox import outbox
+from helpers.drain import drain_state, drain, ExecutionInterrupted
+from helpers.job_queue import job_queue, consumer_name, QUEUE_CLAIM_IDLE_MS, QUEUE_MAX_DELIVERIES
+from PipelineModel.PipelineRequest import PipelineRequest
+from pipeline_ai import run_submitted_execution
+
+# Number of executions a single worker process runs at the same time
+QUEUE_WORKER_CONCURRENCY = int(os.getenv("QUEUE_WORKER_CONCURRENCY", "4"))
+
+
+async def keep_alive(consumer, entry_id):
+    while True:
+        await asyncio.sleep(QUEUE_CLAIM_IDLE_MS / 3000)
+        try:
+            await execution_pool.run_control(job_queue.heartbeat, consumer, entry_id)
+        except Exception as e:
+            # A missed heartbeat is retried on the next tick, the entry stays ours for two more of them
+            logger.error("Failed to send heartbeat for entry %s: %s", entry_id, str(e))
+
+
+async def process_entry(consumer, entry_id, fields):
+    executionId = fields.get("executionId")
+
+    deliveries = await execution_pool.run(job_queue.delivery_count, entry_id)
+    if deliveries > QUEUE_MAX_DELIVERIES:
+        reason = f"Execution was delivered {deliveries} times without completing"
+        execution_store.mark_failed(executionId, 500, reason)
+        await execution_pool.run(job_queue.dead_letter, entry_id, fields, reason)
+        return
+
+    try:
+        access_key = job_queue.access_key(fields)
+    except InvalidToken:
+        reason = "Access key of the execution cannot be decrypted, QUEUE_ENCRYPTION_KEY has changed"
+        execution_store.mark_failed(executionId, 500, reason)
+        await execution_pool.run(job_queue.dead_letter, entry_id, fields, reason)
+        return
+
+    logger.info("Worker %s picked execution ---------------- %s (delivery %s)", consumer, executionId, deliveries)
+    heartbeat = asyncio.create_task(keep_alive(consumer, entry_id))
+
+    try:
+        pipelineRequest = PipelineRequest(**json.loads(fields["request"]))
+        await run_submitted_execution(pipelineRequest, access_key)
+    except ExecutionInterrupted:
+        # Stopped by the shutdown, another worker picks it up and resumes from its checkpoints
+        await execution_pool.run(job_queue.requeue, entry_id, fields)
+        execution_store.mark_queued(executionId)
+        return
+    finally:
+        heartbeat.cancel()
+
+    await execution_pool.run(job_queue.ack, entry_id)
+
+
+async def consume(index, stopping):
+    consumer = consumer_name(index)
+    logger.info("Queue consumer started ---------------- %s", consumer)
+
+    while not stopping.is_set():
+        try:
+            entries = await execution_pool.run(job_queue.claim_stalled, consumer)
+            if not entries:
+                entries = await execution_pool.run(job_queue.read, consumer)
+
+            for entry_id, fields in entries:
+                await process_entry(consumer, entry_id, fields)
+
+        except Exception as e:
+            # The entry stays pending and is claimed again once it goes idle
+            logger.error("Queue consumer %s failed: %s", consumer, str(e))
+            await asyncio.sleep(1)
+
+    logger.info("Queue consumer stopped ---------------- %s", consumer)
+
+
+async def main():
+    if job_queue is None:
+        raise RuntimeError("pipeline_worker requires ENABLE_LOGSTREAMING, the Redis configuration and QUEUE_ENCRYPTION_KEY")
+
+    job_queue.ensure_group()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    outbox.start()
+
+    consumers = [asyncio.create_task(consume(index, stopping)) for index in range(QUEUE_WORKER_CONCURRENCY)]
+    await stopping.wait()
+
+    # Consumers take no new entries once stopping is set, the executions they run get the drain timeout
+    # to finish and are interrupted and requeued after it
+    drain_state.start()
+    interrupted = await drain(consumers)
+    if interrupted:
+        logger.warning("%s consumers were interrupted by the shutdown", interrupted)
+
+    await outbox.stop()
+    await http_client.close()
+    execution_pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
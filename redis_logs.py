@@ -8,15 +8,26 @@ from PipelineModel.PipelineLogs.RuntimeLogs import RuntimeLogs
 from helpers.logger_config import logger
 
 from helpers.pg_client import postgres_client
+from helpers.execution_context import current_execution_context
 
 logger.info('Logs is starting up')
 
 class PipelineAILogs:
 
     progress: str = "STARTED"
-    executionId: Optional[str] = None
-    pipelineId: Optional[int] = None
-    sender: Optional[str] = None
+
+    # Log routing comes from the execution context so concurrent executions publish to their own topic
+    @property
+    def executionId(self) -> Optional[str]:
+        return current_execution_context().executionId
+
+    @property
+    def pipelineId(self) -> Optional[int]:
+        return current_execution_context().pipelineId
+
+    @property
+    def sender(self) -> Optional[str]:
+        return current_execution_context().sender
 
     def push_logs_to_database(self,execution_id, logs_json):
 
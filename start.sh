@@ -1,3 +1,8 @@
 #!/bin/bash
 export WORKERS=${FUNCTIONS_WORKER_PROCESS_COUNT:-10}
-conda run --no-capture-output -n env uvicorn pipeline_ai:app --workers $WORKERS --host 0.0.0.0 --port 8080 --loop asyncio --timeout-keep-alive 6000 --log-level debug
\ No newline at end of file
+if [ "${PRELOAD_WORKERS:-False}" = "True" ]; then
+    # Heavy libraries are imported once by the supervisor and shared with the forked workers
+    exec conda run --no-capture-output -n env python supervisor.py
+fi
+# In flight requests get the drain timeout to complete before the lifespan shutdown drains background executions
+conda run --no-capture-output -n env uvicorn pipeline_ai:app --workers $WORKERS --host 0.0.0.0 --port 8080 --loop asyncio --timeout-keep-alive 6000 --timeout-graceful-shutdown ${DRAIN_TIMEOUT:-300} --log-level debug
\ No newline at end of file
@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+# Measures how long pipeline_ai takes to import and to serve its first healthy response and how much
+# memory an idle worker holds, and exits non zero when a measurement is over its budget. Budgets of 0
+# are not checked.
+STARTUP_BUDGET_IMPORT_SECONDS = float(os.getenv("STARTUP_BUDGET_IMPORT_SECONDS", "20"))
+STARTUP_BUDGET_HEALTHY_SECONDS = float(os.getenv("STARTUP_BUDGET_HEALTHY_SECONDS", "40"))
+STARTUP_BUDGET_IDLE_RSS_MB = float(os.getenv("STARTUP_BUDGET_IDLE_RSS_MB", "1500"))
+
+HEALTH_PATH = "/platform/pipeline/api/v1/health"
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+# The application refuses to start without these, the benchmark never calls them
+REQUIRED_ENVIRONMENT = {
+    "ADMIN_URL": "http://127.0.0.1:9/admin",
+    "INSTRUCTIONS_URL": "http://127.0.0.1:9/instructions",
+}
+
+
+def benchmark_environment(**overrides):
+    return {**REQUIRED_ENVIRONMENT, **os.environ, **overrides}
+
+
+def measure_imports(module, top):
+    """Imports the module in a fresh interpreter under -X importtime and sums the self time per top level package."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=benchmark_environment(), capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr[-4000:]}")
+
+    total_us = 0
+    by_package = {}
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+        if name == module and not indent:
+            total_us = cumulative_us
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+
+    packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "seconds": total_us / 1_000_000,
+        "packages": [{"package": package, "seconds": round(self_us / 1_000_000, 3)} for package, self_us in packages],
+    }
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def is_healthy(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{HEALTH_PATH}", timeout=1) as response:
+            return response.status == 200
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return False
+
+
+def start_server(mode, port, workers, log):
+    if mode == "supervisor":
+        command = [sys.executable, "supervisor.py"]
+        environment = benchmark_environment(PORT=str(port), HOST="127.0.0.1", FUNCTIONS_WORKER_PROCESS_COUNT=str(workers))
+    else:
+        command = [sys.executable, "-m", "uvicorn", "pipeline_ai:app", "--host", "127.0.0.1", "--port", str(port), "--loop", "asyncio", "--log-level", "warning"]
+        environment = benchmark_environment()
+    # Logs go to a file, a pipe nobody reads would block the server once it fills up
+    return subprocess.Popen(command, env=environment, stdout=log, stderr=subprocess.STDOUT)
+
+
+def worker_pids(server, mode):
+    if mode != "supervisor":
+        return [server.pid]
+    try:
+        with open(f"/proc/{server.pid}/task/{server.pid}/children") as children:
+            return [int(pid) for pid in children.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def memory_mb(pid):
+    """Resident and proportional set size of a process, shared pages count fully in the first and split in the second."""
+    usage = {"rss_mb": None, "pss_mb": None}
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                usage["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as smaps:
+            for line in smaps:
+                if line.startswith("Pss:"):
+                    usage["pss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except (FileNotFoundError, PermissionError):
+        pass
+    return usage
+
+
+def measure_server(mode, workers, timeout, settle):
+    port = free_port()
+    log = tempfile.TemporaryFile(mode="w+")
+    started = time.monotonic()
+    server = start_server(mode, port, workers, log)
+    try:
+        while not is_healthy(port):
+            if server.poll() is not None:
+                log.seek(0)
+                raise RuntimeError(f"Server exited with {server.returncode} before becoming healthy:\n{log.read()[-4000:]}")
+            if time.monotonic() - started > timeout:
+                raise RuntimeError(f"Server did not become healthy within {timeout} seconds")
+            time.sleep(0.1)
+        healthy_seconds = time.monotonic() - started
+
+        # Lets every forked worker finish its startup before memory is read
+        time.sleep(settle)
+        return {
+            "healthy_seconds": healthy_seconds,
+            "workers": [{"pid": pid, **memory_mb(pid)} for pid in worker_pids(server, mode)],
+        }
+
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+
+
+def check_budgets(report, budgets):
+    failures = []
+    if budgets["import_seconds"] and report["import"]["seconds"] > budgets["import_seconds"]:
+        failures.append(f"import took {report['import']['seconds']:.2f}s, budget {budgets['import_seconds']}s")
+
+    server = report.get("server")
+    if server:
+        if budgets["healthy_seconds"] and server["healthy_seconds"] > budgets["healthy_seconds"]:
+            failures.append(f"first healthy response after {server['healthy_seconds']:.2f}s, budget {budgets['healthy_seconds']}s")
+        for worker in server["workers"]:
+            if budgets["idle_rss_mb"] and worker["rss_mb"] and worker["rss_mb"] > budgets["idle_rss_mb"]:
+                failures.append(f"worker {worker['pid']} holds {worker['rss_mb']}MB idle, budget {budgets['idle_rss_mb']}MB")
+    return failures
+
+
+def print_report(report, failures):
+    print(f"Import of pipeline_ai: {report['import']['seconds']:.2f}s")
+    for entry in report["import"]["packages"]:
+        print(f"  {entry['package']:<32} {entry['seconds']:>8.3f}s")
+
+    server = report.get("server")
+    if server:
+        print(f"First healthy response ({report['mode']}): {server['healthy_seconds']:.2f}s")
+        for worker in server["workers"]:
+            print(f"  worker {worker['pid']}: rss {worker['rss_mb']}MB, pss {worker['pss_mb']}MB")
+
+    for failure in failures:
+        print(f"OVER BUDGET: {failure}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup and idle memory benchmark of the pipeline API")
+    parser.add_argument("--mode", choices=["uvicorn", "supervisor"], default="uvicorn", help="Serve a single uvicorn worker or the forking supervisor")
+    parser.add_argument("--workers", type=int, default=2, help="Workers started in supervisor mode")
+    parser.add_argument("--top", type=int, default=15, help="Packages listed in the import breakdown")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the first healthy response")
+    parser.add_argument("--settle", type=float, default=2, help="Seconds to wait after the first healthy response before reading memory")
+    parser.add_argument("--import-only", action="store_true", help="Skip starting the server")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--budget-import-seconds", type=float, default=STARTUP_BUDGET_IMPORT_SECONDS)
+    parser.add_argument("--budget-healthy-seconds", type=float, default=STARTUP_BUDGET_HEALTHY_SECONDS)
+    parser.add_argument("--budget-idle-rss-mb", type=float, default=STARTUP_BUDGET_IDLE_RSS_MB)
+    args = parser.parse_args()
+
+    report = {"mode": args.mode, "import": measure_imports("pipeline_ai", args.top)}
+    if not args.import_only:
+        report["server"] = measure_server(args.mode, args.workers, args.timeout, args.settle)
+
+    failures = check_budgets(report, {
+        "import_seconds": args.budget_import_seconds,
+        "healthy_seconds": args.budget_healthy_seconds,
+        "idle_rss_mb": args.budget_idle_rss_mb,
+    })
+
+    if args.json:
+        print(json.dumps({**report, "failures": failures}, indent=2))
+    else:
+        print_report(report, failures)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
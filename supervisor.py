@@ -0,0 +1,227 @@
+import gc
+import importlib
+import os
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+import uvicorn
+from helpers.logger_config import logger
+
+# Runs the API as forked uvicorn workers sharing the heavy libraries the supervisor imported before forking.
+# The application itself is imported by each worker after the fork, so no client, pool or thread crosses it.
+WORKERS = int(os.getenv("FUNCTIONS_WORKER_PROCESS_COUNT", "10"))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8080"))
+
+# A worker is replaced after starting this many executions or when its resident memory grows above
+# the ceiling, 0 disables either limit. The replacement is forked before the old worker drains.
+WORKER_MAX_EXECUTIONS = int(os.getenv("WORKER_MAX_EXECUTIONS", "0"))
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "0"))
+WORKER_CHECK_INTERVAL = float(os.getenv("WORKER_CHECK_INTERVAL", "5"))
+
+PRELOAD_MODULES = [
+    module.strip() for module in os.getenv(
+        "PRELOAD_MODULES",
+        "crewai,crewai_tools,langchain_core,langchain_community,litellm,boto3,chromadb,pandas,tika"
+    ).split(",") if module.strip()
+]
+
+# A worker that exits this soon after being forked is respawned with a delay so a broken start does not spin
+MIN_WORKER_LIFETIME = 5
+
+PID_MESSAGE = struct.Struct("i")
+
+
+def preload():
+    started = time.monotonic()
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            logger.warning("Could not preload %s: %s", module, str(e))
+    # Objects that exist before the fork are left out of garbage collection, otherwise the first collection
+    # in each worker would touch and copy every page holding them
+    gc.freeze()
+    logger.info("Preloaded %s modules in %.1fs", len(PRELOAD_MODULES), time.monotonic() - started)
+
+
+def resident_memory_mb():
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class RecyclingServer(uvicorn.Server):
+    """uvicorn server that shuts itself down, draining like on a stop signal, once it is due to be replaced."""
+
+    def __init__(self, config, retire_pipe):
+        super().__init__(config)
+        self.retire_pipe = retire_pipe
+        self.retiring = False
+
+    def retire_reason(self):
+        pipeline_ai = sys.modules["pipeline_ai"]
+        if WORKER_MAX_EXECUTIONS and pipeline_ai.started_executions >= WORKER_MAX_EXECUTIONS:
+            return f"started {pipeline_ai.started_executions} executions"
+        if WORKER_MAX_RSS_MB:
+            rss = resident_memory_mb()
+            if rss > WORKER_MAX_RSS_MB:
+                return f"resident memory of {rss:.0f}MB"
+        return None
+
+    async def on_tick(self, counter):
+        should_exit = await super().on_tick(counter)
+        # uvicorn ticks every 0.1 seconds
+        if should_exit or self.retiring or counter % max(1, int(WORKER_CHECK_INTERVAL * 10)):
+            return should_exit
+
+        reason = self.retire_reason()
+        if reason is None:
+            return False
+
+        logger.info("Worker %s is retiring after %s", os.getpid(), reason)
+        self.retiring = True
+        # Tells the supervisor to fork the replacement now instead of when this worker has drained
+        os.write(self.retire_pipe, PID_MESSAGE.pack(os.getpid()))
+        return True
+
+
+def run_worker(listener, retire_pipe):
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+
+    import pipeline_ai
+    from helpers.drain import DRAIN_TIMEOUT
+
+    config = uvicorn.Config(
+        pipeline_ai.app,
+        loop="asyncio",
+        timeout_keep_alive=6000,
+        timeout_graceful_shutdown=int(DRAIN_TIMEOUT),
+        log_level=os.getenv("LOG_LEVEL", "debug").lower()
+    )
+    RecyclingServer(config, retire_pipe).run(sockets=[listener])
+
+
+class Supervisor:
+    """Forks the workers, replaces the ones that retire or die and stops them all on a stop signal."""
+
+    def __init__(self):
+        self.listener = None
+        self.retire_read = None
+        self.retire_write = None
+        self.workers = {}
+        self.retiring = set()
+        # Times at which workers that exited right after their start are forked again
+        self.respawns = []
+        self.stopping = False
+
+    def listen(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((HOST, PORT))
+        listener.listen(2048)
+        return listener
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                os.close(self.retire_read)
+                run_worker(self.listener, self.retire_write)
+            except BaseException as e:
+                logger.error("Worker %s failed: %s", os.getpid(), str(e))
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        self.workers[pid] = time.monotonic()
+        logger.info("Started worker ---------------- %s", pid)
+        return pid
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def read_retirements(self):
+        readable, _, _ = select.select([self.retire_read], [], [], 1.0)
+        if not readable:
+            return
+        data = os.read(self.retire_read, PID_MESSAGE.size * 64)
+        for (pid,) in PID_MESSAGE.iter_unpack(data[:len(data) - len(data) % PID_MESSAGE.size]):
+            if pid in self.workers and pid not in self.retiring:
+                self.retiring.add(pid)
+                if not self.stopping:
+                    self.spawn()
+
+    def reap(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            started = self.workers.pop(pid, None)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                logger.info("Retired worker exited ---------------- %s", pid)
+                continue
+
+            logger.error("Worker %s exited unexpectedly with status %s", pid, os.waitstatus_to_exitcode(status))
+            if not self.stopping:
+                if started is not None and time.monotonic() - started < MIN_WORKER_LIFETIME:
+                    # Delayed without blocking the loop, which keeps serving retirements and stop signals
+                    self.respawns.append(time.monotonic() + MIN_WORKER_LIFETIME)
+                else:
+                    self.spawn()
+
+    def respawn(self):
+        now = time.monotonic()
+        due = [at for at in self.respawns if at <= now]
+        self.respawns = [at for at in self.respawns if at > now]
+        for _ in due:
+            self.spawn()
+
+    def run(self):
+        self.listener = self.listen()
+        self.retire_read, self.retire_write = os.pipe()
+
+        preload()
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        logger.info("Supervisor %s starting %s workers on %s:%s", os.getpid(), WORKERS, HOST, PORT)
+        for _ in range(WORKERS):
+            self.spawn()
+
+        while not self.stopping:
+            self.read_retirements()
+            self.reap()
+            self.respawn()
+
+        # Every worker drains its executions on SIGTERM, see helpers/drain.py
+        logger.info("Supervisor stopping %s workers", len(self.workers))
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        while self.workers:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self.workers.pop(pid, None)
+
+        self.listener.close()
+
+
+if __name__ == "__main__":
+    Supervisor().run()
@@ -0,0 +1,12 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    # Same client options as helpers/redis_client.py, the Lua scripts need fakeredis[lua]
+    return fakeredis.FakeRedis(decode_responses=True)
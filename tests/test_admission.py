@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+import helpers.admission as admission_module
+from helpers.admission import AdmissionController, BATCH, INTERACTIVE
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(admission_module, "ADMISSION_MAX_CONCURRENT", 1)
+    monkeypatch.setattr(admission_module, "ADMISSION_MAX_PER_USER", 1)
+    monkeypatch.setattr(admission_module, "ADMISSION_MAX_QUEUED", 3)
+    monkeypatch.setattr(admission_module, "ADMISSION_MAX_QUEUED_PER_USER", 2)
+
+
+def test_full_queue_is_rejected_with_retry_after(limits):
+    async def scenario():
+        controller = AdmissionController()
+        controller.request("a")
+        for user in ("a", "b", "c"):
+            controller.request(user)
+        with pytest.raises(HTTPException) as error:
+            controller.request("d")
+        return error.value, controller.retry_after()
+
+    error, retry_after = asyncio.run(scenario())
+
+    assert error.status_code == 429
+    # Three waiting and one more, on one slot, at the default estimate of a minute each
+    assert error.headers["Retry-After"] == str(retry_after) == "240"
+
+
+def test_user_over_its_queue_share_is_rejected(limits):
+    async def scenario():
+        controller = AdmissionController()
+        controller.request("a")
+        controller.request("a")
+        controller.request("a")
+        with pytest.raises(HTTPException) as error:
+            controller.request("a")
+        # Other users still get queued
+        controller.request("b")
+        return error.value
+
+    assert asyncio.run(scenario()).status_code == 429
+
+
+def test_unknown_priority_is_rejected(limits):
+    async def scenario():
+        with pytest.raises(HTTPException) as error:
+            AdmissionController().request("a", "urgent")
+        return error.value
+
+    assert asyncio.run(scenario()).status_code == 400
+
+
+def test_users_are_admitted_fairly(limits):
+    async def scenario():
+        controller = AdmissionController()
+        running = controller.request("a")
+        tickets = [controller.request("a"), controller.request("a"), controller.request("b")]
+
+        admitted = []
+        current = running
+        while current is not None:
+            controller.release(current)
+            current = next((ticket for ticket in tickets if ticket.admitted.done() and ticket not in admitted), None)
+            if current is not None:
+                admitted.append(current)
+        return [ticket.user for ticket in admitted]
+
+    # a already had its turn, the single execution of b does not wait behind the backlog of a
+    assert asyncio.run(scenario()) == ["b", "a", "a"]
+
+
+def test_interactive_overtakes_batch(limits, monkeypatch):
+    monkeypatch.setattr(admission_module, "ADMISSION_MAX_PER_USER", 10)
+    monkeypatch.setattr(admission_module, "ADMISSION_MAX_QUEUED_PER_USER", 10)
+
+    async def scenario():
+        controller = AdmissionController()
+        running = controller.request("a", BATCH)
+        batch = controller.request("b", BATCH)
+        interactive = controller.request("c", INTERACTIVE)
+        controller.release(running)
+        return interactive.admitted.done(), batch.admitted.done()
+
+    assert asyncio.run(scenario()) == (True, False)
+
+
+def test_release_of_a_waiting_ticket_frees_its_place(limits):
+    async def scenario():
+        controller = AdmissionController()
+        running = controller.request("a")
+        waiting = controller.request("b")
+        controller.release(waiting)
+        controller.release(running)
+        return controller.running, controller.waiting
+
+    assert asyncio.run(scenario()) == (0, [])
+
+
+def test_release_of_a_waiting_ticket_rolls_back_the_user_clock(limits, monkeypatch):
+    monkeypatch.setattr(admission_module, "ADMISSION_MAX_PER_USER", 10)
+
+    async def scenario():
+        controller = AdmissionController()
+        running = controller.request("a")
+        abandoned = controller.request("b")
+        kept = controller.request("b")
+        controller.release(abandoned)
+        other = controller.request("c")
+        controller.release(running)
+        first = kept.admitted.done(), other.admitted.done()
+        controller.release(kept)
+        return kept.finish_tag, controller.last_finish_tag["b"], first, other.admitted.done()
+
+    finish_tag, last_finish_tag, first, second = asyncio.run(scenario())
+
+    # The abandoned ticket no longer counts against b, its next ticket takes the place of the first
+    assert finish_tag == last_finish_tag == 1.0 / admission_module.PRIORITY_WEIGHTS[INTERACTIVE]
+    assert first == (True, False) and second
@@ -0,0 +1,62 @@
+import asyncio
+import json
+import pytest
+
+pipeline_ai = pytest.importorskip("pipeline_ai")
+from PipelineModel.PipelineBatchRequest import PipelineBatchRequest
+
+
+class RecordingRegistry:
+
+    def __init__(self):
+        self.cancelled = []
+
+    def cancel(self, executionId, reason="cancelled by request"):
+        self.cancelled.append(executionId)
+        return True
+
+
+def batch_request(count):
+    return PipelineBatchRequest(pipeLineId=1, executionId="batch", items=[{"topic": str(index)} for index in range(count)], user="user")
+
+
+def test_disconnect_cancels_unfinished_items(monkeypatch):
+    registry = RecordingRegistry()
+    monkeypatch.setattr(pipeline_ai, "cancellation_registry", registry)
+
+    async def run_batch_item(pipelineRequest, access_key):
+        if pipelineRequest.executionId == "batch-0":
+            return {"result": "done"}
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(pipeline_ai, "run_batch_item", run_batch_item)
+
+    async def scenario():
+        lines = pipeline_ai.stream_batch(batch_request(3), "key", 3)
+        first = json.loads(await lines.__anext__())
+        # The client goes away after the first item
+        await lines.aclose()
+        return first
+
+    first = asyncio.run(scenario())
+
+    assert first["executionId"] == "batch-0"
+    assert sorted(registry.cancelled) == ["batch-1", "batch-2"]
+
+
+def test_completed_batch_cancels_nothing(monkeypatch):
+    registry = RecordingRegistry()
+    monkeypatch.setattr(pipeline_ai, "cancellation_registry", registry)
+
+    async def run_batch_item(pipelineRequest, access_key):
+        return {"result": pipelineRequest.userInputs["topic"]}
+
+    monkeypatch.setattr(pipeline_ai, "run_batch_item", run_batch_item)
+
+    async def scenario():
+        return [json.loads(line) async for line in pipeline_ai.stream_batch(batch_request(2), "key", 1)]
+
+    lines = asyncio.run(scenario())
+
+    assert lines[-1] == {"executionId": "batch", "completed": 2, "succeeded": 2, "failed": 0}
+    assert registry.cancelled == []
@@ -0,0 +1,144 @@
+import asyncio
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from litellm.llms.custom_httpx.http_handler import HTTPHandler
+import helpers.cancellation as cancellation_module
+from helpers.cancellation import CancellationRegistry, CancellationScope, ExecutionCancelled, cancel_key
+from helpers.execution_store import ExecutionStore
+
+
+@pytest.fixture
+def store(redis, monkeypatch):
+    store = ExecutionStore(redis)
+    monkeypatch.setattr(cancellation_module, "redis_client", redis)
+    monkeypatch.setattr(cancellation_module, "execution_store", store)
+    return store
+
+
+def test_cancel_of_an_unknown_execution(store, redis):
+    assert not CancellationRegistry().cancel("missing")
+    assert redis.get(cancel_key("missing")) is None
+
+
+def test_cancel_of_a_finished_execution(store, redis):
+    store.claim("exec-1", 1, "user", {})
+    store.mark_succeeded("exec-1", {"output": "done"})
+
+    assert not CancellationRegistry().cancel("exec-1")
+    assert redis.get(cancel_key("exec-1")) is None
+
+
+def test_cancel_of_an_execution_running_elsewhere(store, redis):
+    store.claim("exec-1", 1, "user", {}, leased=True)
+    store.mark_running("exec-1")
+
+    assert CancellationRegistry().cancel("exec-1", "stop")
+    assert redis.get(cancel_key("exec-1")) == "stop"
+
+
+def test_cancel_of_an_execution_running_here(store):
+    registry = CancellationRegistry()
+    scope = CancellationScope("exec-1")
+
+    with registry.track(scope):
+        assert registry.cancel("exec-1", "stop")
+
+    assert scope.reason == "stop"
+
+
+def test_cancel_endpoint_returns_404_for_an_unknown_execution(store, monkeypatch):
+    pipeline_ai = pytest.importorskip("pipeline_ai")
+    monkeypatch.setattr(pipeline_ai, "cancellation_registry", CancellationRegistry())
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(pipeline_ai.cancel_execution("missing"))
+    assert error.value.status_code == 404
+
+
+@pytest.fixture
+def slow_server():
+    """Local endpoint that holds every request until the test ends, and records when a client goes away."""
+    release = threading.Event()
+    disconnected = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.connection.settimeout(0.05)
+            while not release.is_set():
+                try:
+                    if self.connection.recv(1) == b"":
+                        disconnected.set()
+                        return
+                except socket.timeout:
+                    continue
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/", disconnected
+    release.set()
+    server.shutdown()
+
+
+def bedrock_llm(timeout=None):
+    return SimpleNamespace(model="bedrock/anthropic.claude", base_url=None, api_base=None, api_key=None, api_version=None,
+                           timeout=timeout, additional_params={"metadata": {}})
+
+
+def test_cancel_aborts_the_call_in_flight(slow_server, monkeypatch):
+    monkeypatch.setattr(cancellation_module, "CANCEL_POLL_INTERVAL", 0.1)
+    url, disconnected = slow_server
+    scope = CancellationScope("exec-1")
+    threads = []
+
+    def call(llm, messages):
+        threads.append(threading.current_thread().name)
+        return llm.additional_params["client"].post(url, json={"messages": messages})
+
+    threading.Timer(0.3, scope.cancel, args=("stop",)).start()
+    started = time.monotonic()
+    with pytest.raises(ExecutionCancelled):
+        scope.run(call, bedrock_llm(), "hello")
+
+    assert time.monotonic() - started < 2
+    # The provider sees the request go away instead of computing a response nobody reads
+    assert disconnected.wait(2)
+    assert threads[0].startswith("llm-call")
+    scope.close()
+
+
+def test_call_timeout_is_the_remaining_budget():
+    scope = CancellationScope("exec-1", deadline=time.time() + 30)
+    llm = bedrock_llm(timeout=600)
+
+    bound = scope.run(lambda llm, messages: llm, llm, "hello")
+
+    assert 25 < bound.timeout <= 30
+    assert isinstance(bound.additional_params["client"], HTTPHandler)
+    assert bound.additional_params["metadata"] == {}
+    # The pooled LLM is left as it was
+    assert llm.timeout == 600 and "client" not in llm.additional_params
+    scope.close()
+
+
+def test_provider_clients_are_reused_within_an_execution():
+    scope = CancellationScope("exec-1")
+    unknown = SimpleNamespace(**{**vars(bedrock_llm()), "model": "deepseek-r1"})
+
+    first = scope.bind(bedrock_llm()).additional_params["client"]
+    assert scope.bind(bedrock_llm()).additional_params["client"] is first
+    assert "client" not in scope.bind(unknown).additional_params
+
+    scope.close()
+    assert first.client.is_closed
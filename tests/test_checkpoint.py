@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from crewai.tasks.task_output import TaskOutput
+from fastapi import HTTPException
+from helpers.checkpoint import CheckpointStore
+
+
+def pipeline(*descriptions, context=None):
+    """Sequential tasks of one agent, task n gets the explicit context given at context[n] if any."""
+    agent = SimpleNamespace(role="writer", goal="write", backstory="", llm=SimpleNamespace(model="gpt-4o"), tools=[])
+    tasks = [SimpleNamespace(description=description, expected_output="text", agent=agent, tools=[], context=None,
+                             callback=None, output=None) for description in descriptions]
+    for index, upstream in (context or {}).items():
+        tasks[index].context = [tasks[dependency] for dependency in upstream]
+    return tasks
+
+
+def complete(task, raw):
+    """Runs the task callback the way the crew does once a task completes."""
+    task.callback(TaskOutput(description=task.description, raw=raw, agent=task.agent.role))
+
+
+def test_fingerprints_are_chained_to_upstream_tasks():
+    original = CheckpointStore.fingerprints(pipeline("research", "draft", "review"))
+    changed = CheckpointStore.fingerprints(pipeline("research more", "draft", "review"))
+
+    assert original[0] != changed[0]
+    # Unchanged tasks downstream of a changed one get a new fingerprint as well
+    assert original[1] != changed[1] and original[2] != changed[2]
+
+
+def test_fingerprints_only_follow_the_explicit_context():
+    context = {1: [], 2: [1]}
+    original = CheckpointStore.fingerprints(pipeline("research", "draft", "review", context=context))
+    changed = CheckpointStore.fingerprints(pipeline("research more", "draft", "review", context=context))
+
+    assert original[0] != changed[0]
+    assert original[1:] == changed[1:]
+
+
+def test_completed_tasks_are_restored_after_a_failed_task(redis):
+    store = CheckpointStore(redis)
+    tasks = pipeline("research", "draft", "review")
+    assert store.attach("exec-1", tasks) == 0
+    complete(tasks[0], "findings")
+    complete(tasks[1], "first draft")
+    # The third task failed, its callback never ran
+
+    resumed = pipeline("research", "draft", "review")
+    assert store.attach("exec-1", resumed) == 2
+
+    assert [task.output.raw if task.output else None for task in resumed] == ["findings", "first draft", None]
+    assert resumed[2].callback is not None
+
+
+def test_tasks_after_a_changed_task_are_not_restored(redis):
+    store = CheckpointStore(redis)
+    tasks = pipeline("research", "draft", "review")
+    store.attach("exec-1", tasks)
+    for task, raw in zip(tasks, ["findings", "first draft", "notes"]):
+        complete(task, raw)
+
+    resumed = pipeline("research", "draft differently", "review")
+    assert store.attach("exec-1", resumed) == 1
+    assert resumed[0].output.raw == "findings"
+    assert resumed[1].output is None and resumed[2].output is None
+
+
+def test_execution_is_checkpointed_once_attached(redis):
+    store = CheckpointStore(redis)
+    store.save_request("exec-1", {"executionId": "exec-1"})
+    assert not store.is_checkpointed("exec-1")
+
+    store.attach("exec-1", pipeline("research"))
+
+    assert store.is_checkpointed("exec-1")
+    store.clear("exec-1")
+    assert store.get_request("exec-1") is None and not store.is_checkpointed("exec-1")
+
+
+def test_resume_rejects_an_execution_that_was_not_checkpointed(redis, monkeypatch):
+    pipeline_ai = pytest.importorskip("pipeline_ai")
+    store = CheckpointStore(redis)
+    monkeypatch.setattr(pipeline_ai, "checkpoint_store", store)
+    # A hierarchical run stores its request but never attaches checkpoints
+    store.save_request("exec-1", {"executionId": "exec-1"})
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(pipeline_ai.resume_execution("exec-1", "key"))
+    assert error.value.status_code == 409
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(pipeline_ai.resume_execution("unknown", "key"))
+    assert error.value.status_code == 404
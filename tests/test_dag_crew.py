@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+import pytest
+from helpers.dag_crew import build_task_graph, chain_tasks, has_task_graph
+
+
+def pipeline(*dependencies):
+    """Agents with serials 1..n, the nth depending on the serials given at position n-1, and their tasks."""
+    agents = [SimpleNamespace(serial=index + 1, dependsOn=depends) for index, depends in enumerate(dependencies)]
+    tasks = [SimpleNamespace(name=f"task-{agent.serial}", context=None) for agent in agents]
+    return agents, tasks
+
+
+def names(tasks):
+    return [task.name for task in tasks]
+
+
+def test_tasks_are_ordered_after_their_dependencies():
+    agents, tasks = pipeline([3], [], [2], None)
+
+    ordered = build_task_graph(agents, tasks)
+
+    assert names(ordered) == ["task-2", "task-3", "task-1", "task-4"]
+    assert names(tasks[0].context) == ["task-3"]
+    assert names(tasks[2].context) == ["task-2"]
+
+
+def test_root_tasks_get_an_empty_context():
+    agents, tasks = pipeline([], [], [1, 2])
+
+    build_task_graph(agents, tasks)
+
+    assert tasks[0].context == [] and tasks[1].context == []
+    assert names(tasks[2].context) == ["task-1", "task-2"]
+
+
+def test_independent_tasks_keep_the_pipeline_order():
+    agents, tasks = pipeline([], [], [], [1], [1])
+
+    assert names(build_task_graph(agents, tasks)) == ["task-1", "task-2", "task-3", "task-4", "task-5"]
+
+
+def test_dependency_cycle_is_rejected():
+    agents, tasks = pipeline([], [3], [2])
+
+    with pytest.raises(ValueError, match="cycle"):
+        build_task_graph(agents, tasks)
+
+
+@pytest.mark.parametrize("dependencies, message", [
+    (([5], []), "unknown agent"),
+    (([1],), "itself"),
+])
+def test_invalid_dependencies_are_rejected(dependencies, message):
+    agents, tasks = pipeline(*dependencies)
+
+    with pytest.raises(ValueError, match=message):
+        build_task_graph(agents, tasks)
+
+
+def test_duplicate_serials_are_rejected():
+    agents, tasks = pipeline([], [])
+    agents[1].serial = 1
+
+    with pytest.raises(ValueError, match="Duplicate"):
+        build_task_graph(agents, tasks)
+
+
+def test_sequential_pipeline_is_chained():
+    agents, tasks = pipeline(None, None, None)
+
+    assert not has_task_graph(agents)
+    chain_tasks(tasks)
+    assert [names(task.context) for task in tasks] == [[], ["task-1"], ["task-1", "task-2"]]
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from helpers import drain as drain_module
+from helpers.drain import DrainState, SHUTDOWN_REASON, drain
+
+
+class Registry:
+    """Stands in for the cancellation registry, interrupted executions stop once cancel_all is called."""
+
+    def __init__(self):
+        self.reasons = []
+        self.interrupted = None
+
+    def cancel_all(self, reason):
+        self.reasons.append(reason)
+        self.interrupted.set()
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(drain_module, "cancellation_registry", registry)
+    monkeypatch.setattr(drain_module, "DRAIN_INTERRUPT_TIMEOUT", 0.5)
+    return registry
+
+
+def run(registry, *durations, stops_when_interrupted=True, timeout=0.2):
+    """Drains executions taking the given seconds, returns the interrupted count and how many finished."""
+    finished = []
+
+    async def execution(seconds):
+        try:
+            await asyncio.wait_for(registry.interrupted.wait() if stops_when_interrupted else asyncio.sleep(3600), seconds)
+        except asyncio.TimeoutError:
+            pass
+        finished.append(seconds)
+
+    async def scenario():
+        registry.interrupted = asyncio.Event()
+        tasks = [asyncio.create_task(execution(seconds)) for seconds in durations]
+        interrupted = await drain(tasks, timeout=timeout)
+        for task in tasks:
+            task.cancel()
+        return interrupted
+
+    return asyncio.run(scenario()), finished
+
+
+def test_nothing_to_drain(registry):
+    assert asyncio.run(drain([])) == 0
+    assert registry.reasons == []
+
+
+def test_executions_finishing_within_the_timeout_are_not_interrupted(registry):
+    interrupted, finished = run(registry, 0.01, 0.05)
+
+    assert interrupted == 0
+    assert sorted(finished) == [0.01, 0.05]
+    assert registry.reasons == []
+
+
+def test_executions_still_running_at_the_timeout_are_cancelled(registry):
+    interrupted, finished = run(registry, 0.01, 60, 60)
+
+    assert interrupted == 2
+    assert registry.reasons == [SHUTDOWN_REASON]
+    # The interrupted executions stop instead of running for their full minute
+    assert len(finished) == 3
+
+
+def test_drain_gives_up_on_executions_that_ignore_the_interrupt(registry):
+    interrupted, finished = run(registry, 60, stops_when_interrupted=False)
+
+    assert interrupted == 1
+    assert registry.reasons == [SHUTDOWN_REASON]
+    assert finished == []
+
+
+def test_drain_file_starts_draining(tmp_path, monkeypatch):
+    monkeypatch.setattr(drain_module, "DRAIN_FILE", str(tmp_path / "drain"))
+    state = DrainState()
+    assert not state.is_draining()
+
+    (tmp_path / "drain").touch()
+
+    assert state.is_draining()
@@ -0,0 +1,47 @@
+import asyncio
+import threading
+from helpers.execution_context import ExecutionContext, bind_execution_context, current_execution_context
+from helpers.executor import execution_pool
+from helpers.secret_manager import secret_manager
+from redis_logs import PipelineAILogs
+
+
+def test_concurrent_executions_keep_their_own_routing_and_credentials():
+    barrier = threading.Barrier(2)
+
+    def read():
+        # Both executions are bound before either reads, a shared singleton would return the last one
+        barrier.wait(timeout=5)
+        logs = PipelineAILogs()
+        return logs.executionId, logs.pipelineId, logs.sender, secret_manager.access_key
+
+    async def execution(executionId, pipelineId, user):
+        bind_execution_context(executionId=executionId, pipelineId=pipelineId, sender=user)
+        secret_manager.access_key = f"key-{user}"
+        return await execution_pool.run(read)
+
+    async def scenario():
+        return await asyncio.gather(execution("exec-1", 1, "alice"), execution("exec-2", 2, "bob"))
+
+    assert asyncio.run(scenario()) == [("exec-1", 1, "alice", "key-alice"), ("exec-2", 2, "bob", "key-bob")]
+
+
+def test_binding_inside_an_execution_does_not_leak_to_the_caller():
+    async def execution():
+        bind_execution_context(executionId="exec-1")
+        secret_manager.access_key = "key"
+
+    async def scenario():
+        await asyncio.create_task(execution())
+        return current_execution_context()
+
+    assert asyncio.run(scenario()) == ExecutionContext()
+
+
+def test_binding_keeps_the_fields_it_does_not_set():
+    async def scenario():
+        bind_execution_context(executionId="exec-1", pipelineId=7, sender="alice")
+        secret_manager.access_key = "key"
+        return current_execution_context()
+
+    assert asyncio.run(scenario()) == ExecutionContext(executionId="exec-1", pipelineId=7, sender="alice", access_key="key")
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+import pytest
+import helpers.execution_store as execution_store_module
+from helpers.execution_store import ExecutionStore, ExecutionStatus
+from helpers.executor import execution_pool, EXECUTION_POOL_SIZE
+
+
+@pytest.fixture
+def store(redis):
+    return ExecutionStore(redis)
+
+
+def test_claim_creates_the_execution_once(store):
+    assert store.claim("exec-1", 1, "user", {"a": 1}, leased=True) is None
+    assert store.claim("exec-1", 1, "user", {"a": 1}, leased=True) == ExecutionStatus.QUEUED
+
+    execution = store.get("exec-1")
+    assert execution["request"] == {"a": 1}
+    assert not ExecutionStore.is_abandoned(execution)
+
+
+def test_expired_lease_can_be_claimed_again(store, monkeypatch):
+    monkeypatch.setattr(execution_store_module, "EXECUTION_LEASE_SECONDS", -1)
+    store.claim("exec-1", 1, "user", {}, leased=True)
+    store.mark_running("exec-1")
+
+    assert ExecutionStore.is_abandoned(store.get("exec-1"))
+    assert store.claim("exec-1", 1, "user", {}, leased=True) is None
+
+
+def test_renewed_lease_is_not_claimed_again(store, monkeypatch):
+    monkeypatch.setattr(execution_store_module, "EXECUTION_LEASE_SECONDS", -1)
+    store.claim("exec-1", 1, "user", {}, leased=True)
+    store.mark_running("exec-1")
+
+    monkeypatch.setattr(execution_store_module, "EXECUTION_LEASE_SECONDS", 60)
+    store.renew_lease("exec-1")
+
+    assert store.claim("exec-1", 1, "user", {}, leased=True) == ExecutionStatus.RUNNING
+
+
+def test_succeeded_and_failed_executions(store):
+    store.claim("done", 1, "user", {})
+    store.mark_succeeded("done", {"output": "ok"})
+    assert store.claim("done", 1, "user", {}) == ExecutionStatus.SUCCESS
+    assert store.get("done")["result"] == {"output": "ok"}
+
+    store.claim("failed", 1, "user", {})
+    store.mark_failed("failed", 500, "boom")
+    assert store.claim("failed", 1, "user", {}) is None
+
+
+def test_lease_survives_a_saturated_execution_pool(store, monkeypatch):
+    pipeline_ai = pytest.importorskip("pipeline_ai")
+    lease_seconds = 0.4
+    monkeypatch.setattr(pipeline_ai, "execution_store", store)
+    monkeypatch.setattr(pipeline_ai, "EXECUTION_LEASE_SECONDS", lease_seconds)
+    monkeypatch.setattr(execution_store_module, "EXECUTION_LEASE_SECONDS", lease_seconds)
+
+    async def long_run():
+        await asyncio.sleep(lease_seconds * 4)
+        return {"output": "ok"}
+
+    async def scenario():
+        store.claim("exec-1", 1, "user", {}, leased=True)
+        release = threading.Event()
+        # Every pipeline worker is busy, like a worker running as many crews as admission allows
+        blockers = [asyncio.ensure_future(execution_pool.run(release.wait, 10)) for _ in range(EXECUTION_POOL_SIZE)]
+        try:
+            execution = asyncio.create_task(pipeline_ai.track_execution("exec-1", long_run()))
+            await asyncio.sleep(lease_seconds * 3)
+            assert not ExecutionStore.is_abandoned(store.get("exec-1"))
+            assert store.claim("exec-1", 1, "user", {}, leased=True) == ExecutionStatus.QUEUED
+            return await execution
+        finally:
+            release.set()
+            await asyncio.gather(*blockers)
+
+    started = time.monotonic()
+    assert asyncio.run(scenario()) == {"output": "ok"}
+    assert time.monotonic() - started < 5
+    assert store.get("exec-1")["status"] == ExecutionStatus.SUCCESS
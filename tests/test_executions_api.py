@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from helpers.execution_store import ExecutionStore
+
+pipeline_ai = pytest.importorskip("pipeline_ai")
+
+
+@pytest.fixture
+def store(redis, monkeypatch):
+    store = ExecutionStore(redis)
+    monkeypatch.setattr(pipeline_ai, "execution_store", store)
+    store.claim("exec-1", 7, "user", {"userInputs": {}})
+    store.mark_succeeded("exec-1", {"output": "done"})
+    return store
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    checked = []
+
+    async def getPipelinePayload(access_key, pipeLineId):
+        checked.append((access_key, pipeLineId))
+        if access_key != "valid":
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        return {"pipeline": {}}
+
+    monkeypatch.setattr(pipeline_ai, "getPipelinePayload", getPipelinePayload)
+    return checked
+
+
+def status_code(coroutine):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(coroutine)
+    return error.value.status_code
+
+
+def test_execution_requires_an_access_key(store, admin):
+    assert status_code(pipeline_ai.get_execution("exec-1")) == 400
+    assert admin == []
+
+
+def test_execution_rejects_an_access_key_the_admin_api_rejects(store, admin):
+    assert status_code(pipeline_ai.get_execution("exec-1", "stolen")) == 401
+    assert admin == [("stolen", "7")]
+
+
+def test_execution_is_returned_without_its_request(store, admin):
+    execution = asyncio.run(pipeline_ai.get_execution("exec-1", "valid"))
+
+    assert execution["status"] == "SUCCESS"
+    assert execution["result"] == {"output": "done"}
+    assert "request" not in execution
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+from contextvars import ContextVar
+from helpers.executor import execution_pool
+
+request_id = ContextVar("request_id", default=None)
+
+
+def test_run_carries_the_callers_context_to_the_worker_thread():
+    async def scenario():
+        request_id.set("exec-1")
+        return await execution_pool.run(lambda: (request_id.get(), threading.current_thread().name))
+
+    value, thread = asyncio.run(scenario())
+
+    assert value == "exec-1"
+    assert thread.startswith("pipeline-worker")
+
+
+def test_run_passes_arguments_through():
+    async def scenario():
+        return await execution_pool.run(lambda left, right, scale=1: (left + right) * scale, 2, 3, scale=10)
+
+    assert asyncio.run(scenario()) == 50
+
+
+def test_values_set_on_the_worker_thread_stay_there():
+    async def scenario():
+        request_id.set("exec-1")
+        await execution_pool.run(request_id.set, "changed")
+        return request_id.get()
+
+    assert asyncio.run(scenario()) == "exec-1"
+
+
+def test_concurrent_runs_each_see_their_own_context():
+    barrier = threading.Barrier(2)
+
+    def read():
+        # Both runs are on worker threads at the same time before either reads
+        barrier.wait(timeout=5)
+        return request_id.get()
+
+    async def run(executionId):
+        request_id.set(executionId)
+        return await execution_pool.run(read)
+
+    async def scenario():
+        return await asyncio.gather(run("exec-1"), run("exec-2"))
+
+    assert asyncio.run(scenario()) == ["exec-1", "exec-2"]
@@ -0,0 +1,97 @@
+import asyncio
+import time
+import httpx
+import pytest
+from helpers.http_client import http_client
+
+pipeline_ai = pytest.importorskip("pipeline_ai")
+
+
+def test_child_loop_closes_its_http_client():
+    clients = []
+
+    async def execution():
+        clients.append(http_client.get_client())
+        return "done"
+
+    assert pipeline_ai.run_in_child_loop(execution()) == "done"
+    assert pipeline_ai.run_in_child_loop(execution()) == "done"
+
+    assert clients[0] is not clients[1]
+    assert all(client.is_closed for client in clients)
+    assert http_client.client is None
+
+
+def test_child_loop_closes_its_http_client_when_the_execution_fails():
+    async def execution():
+        http_client.get_client()
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        pipeline_ai.run_in_child_loop(execution())
+    assert http_client.client is None
+
+
+def test_client_of_another_loop_is_left_open():
+    async def open_client():
+        return http_client.get_client()
+
+    client = asyncio.run(open_client())
+    asyncio.run(http_client.close_loop_client())
+
+    assert not client.is_closed
+    asyncio.run(http_client.close())
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    """Serves the sync client from a mock transport replaying the given responses or errors."""
+    replies = []
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return httpx.Response(reply)
+
+    monkeypatch.setattr(http_client, "loop", None)
+    monkeypatch.setattr(http_client, "get_sync_client", lambda: httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    return replies, requests
+
+
+@pytest.mark.parametrize("endpoint", ["history", "status"])
+def test_history_and_status_posts_are_not_retried_after_a_read_timeout(transport, endpoint):
+    replies, requests = transport
+    replies.extend([httpx.ReadTimeout("timed out"), 200])
+
+    with pytest.raises(httpx.ReadTimeout):
+        http_client.request_sync("POST", "https://admin.example.com/history", endpoint)
+    assert len(requests) == 1
+
+
+@pytest.mark.parametrize("endpoint", ["history", "status"])
+def test_history_and_status_posts_are_not_retried_after_a_gateway_timeout(transport, endpoint):
+    replies, requests = transport
+    replies.extend([504, 200])
+
+    assert http_client.request_sync("POST", "https://admin.example.com/history", endpoint).status_code == 504
+    assert len(requests) == 1
+
+
+def test_history_posts_are_retried_when_they_never_reached_the_server(transport):
+    replies, requests = transport
+    replies.extend([httpx.ConnectError("refused"), 503, 200])
+
+    assert http_client.request_sync("POST", "https://admin.example.com/history", "history").status_code == 200
+    assert len(requests) == 3
+
+
+def test_payload_requests_are_retried_after_a_read_timeout(transport):
+    replies, requests = transport
+    replies.extend([httpx.ReadTimeout("timed out"), 200])
+
+    assert http_client.request_sync("GET", "https://admin.example.com/pipeline", "payload").status_code == 200
+    assert len(requests) == 2
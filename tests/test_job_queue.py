@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+from helpers.job_queue import JobQueue, QUEUE_STREAM
+
+
+@pytest.fixture
+def queue(redis):
+    queue = JobQueue(redis, Fernet.generate_key())
+    queue.ensure_group()
+    return queue
+
+
+def test_access_key_is_not_stored_in_plain_text(queue, redis):
+    queue.enqueue({"executionId": "exec-1"}, "secret")
+
+    [(entry_id, fields)] = redis.xrange(QUEUE_STREAM)
+    assert "secret" not in fields["access_key"]
+    assert queue.access_key(fields) == "secret"
+
+
+def test_missing_access_key_stays_missing(queue):
+    queue.enqueue({"executionId": "exec-1"}, None)
+
+    [(entry_id, fields)] = queue.read("consumer", block_ms=None)
+    assert queue.access_key(fields) is None
+
+
+def test_entry_of_another_key_cannot_be_read(queue, redis):
+    queue.enqueue({"executionId": "exec-1"}, "secret")
+    [(entry_id, fields)] = redis.xrange(QUEUE_STREAM)
+
+    with pytest.raises(InvalidToken):
+        JobQueue(redis, Fernet.generate_key()).access_key(fields)
+
+
+def test_heartbeat_keeps_running_after_a_failure(monkeypatch):
+    pipeline_worker = pytest.importorskip("pipeline_worker")
+    beats = []
+
+    class FlakyQueue:
+        def heartbeat(self, consumer, entry_id):
+            beats.append(entry_id)
+            if len(beats) == 1:
+                raise ConnectionError("Redis went away")
+
+    monkeypatch.setattr(pipeline_worker, "job_queue", FlakyQueue())
+    monkeypatch.setattr(pipeline_worker, "QUEUE_CLAIM_IDLE_MS", 30)
+
+    async def scenario():
+        heartbeat = asyncio.create_task(pipeline_worker.keep_alive("consumer", "1-0"))
+        await asyncio.sleep(0.2)
+        heartbeat.cancel()
+        return heartbeat
+
+    heartbeat = asyncio.run(scenario())
+    assert len(beats) >= 3
+    assert heartbeat.cancelled()
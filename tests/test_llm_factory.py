@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+import pytest
+from helpers.llm_factory import LLMFactory, bind_metadata
+
+
+def azure(deployment="gpt-4o", temperature=0.2):
+    return SimpleNamespace(aiEngine="AzureOpenAI", model="gpt-4o", llmDeploymentName=deployment, temperature=temperature,
+                           maxToken=1000, azureEndpoint="https://east.example.com", apiKey="key", llmApiVersion="2024-06-01")
+
+
+def test_same_definition_shares_one_llm():
+    factory = LLMFactory()
+
+    assert factory.get(azure()) is factory.get(azure())
+    assert factory.get(azure(temperature=0.7)) is not factory.get(azure())
+
+
+def test_least_recently_used_llm_is_evicted():
+    factory = LLMFactory(max_size=2)
+    first = factory.get(azure("first"))
+    factory.get(azure("second"))
+    factory.get(azure("first"))
+    factory.get(azure("third"))
+
+    assert factory.get(azure("first")) is first
+    assert [llm.model for llm in factory.entries.values()] == ["azure/third", "azure/first"]
+
+
+def test_create_binds_the_run_metadata_to_a_copy():
+    factory = LLMFactory()
+    pooled = factory.get(azure())
+
+    first = factory.create(azure(), {"trace_id": "exec-1"})
+    second = factory.create(azure(), {"trace_id": "exec-2"})
+
+    assert first is not pooled and second is not pooled
+    assert first.additional_params["metadata"] == {"trace_id": "exec-1"}
+    assert second.additional_params["metadata"] == {"trace_id": "exec-2"}
+    # The pooled LLM keeps its placeholder, no run sees the metadata of another
+    assert pooled.additional_params["metadata"] == {}
+    assert first.model == second.model == pooled.model
+
+
+def test_bind_metadata_leaves_llms_without_metadata_alone():
+    llm = SimpleNamespace(additional_params={"aws_region_name": "us-east-1"})
+
+    bound = bind_metadata(llm, {"trace_id": "exec-1"})
+
+    assert bound is not llm
+    assert bound.additional_params == {"aws_region_name": "us-east-1"}
+
+
+def test_unsupported_engine_is_rejected():
+    with pytest.raises(ValueError, match="Unsupported LLM type"):
+        LLMFactory().get(SimpleNamespace(aiEngine="Other"))
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import sqlite3
+import httpx
+import pytest
+from cryptography.fernet import Fernet
+import helpers.outbox as outbox_module
+from helpers.outbox import Outbox
+
+
+class RecordingClient:
+    """Answers outbox deliveries with the status codes queued per URL, 200 once they run out."""
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses or {}
+        self.requests = []
+
+    async def request(self, method, url, endpoint, headers=None, json=None):
+        self.requests.append((url, headers, json))
+        statuses = self.statuses.get(url, [])
+        return httpx.Response(statuses.pop(0) if statuses else 200, request=httpx.Request(method, url))
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "ENABLE_OUTBOX", True)
+    monkeypatch.setattr(outbox_module, "OUTBOX_ENCRYPTION_KEY", Fernet.generate_key().decode("utf-8"))
+    monkeypatch.setattr(outbox_module, "OUTBOX_PATH", str(tmp_path / "outbox.db"))
+    monkeypatch.setattr(Outbox, "_instance", None)
+    outbox = Outbox()
+    yield outbox
+    outbox.executor.shutdown()
+    outbox.connection.close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = RecordingClient()
+    monkeypatch.setattr(outbox_module, "http_client", client)
+    return client
+
+
+def rows(outbox):
+    return outbox.connection.execute("SELECT execution_id, url, attempts, dead FROM outbox ORDER BY id").fetchall()
+
+
+def make_due(outbox):
+    outbox.connection.execute("UPDATE outbox SET next_attempt_at = 0 WHERE dead = 0")
+
+
+def test_outbox_is_disabled_without_an_encryption_key(monkeypatch):
+    monkeypatch.setattr(outbox_module, "ENABLE_OUTBOX", True)
+    monkeypatch.setattr(outbox_module, "OUTBOX_ENCRYPTION_KEY", None)
+    monkeypatch.setattr(Outbox, "_instance", None)
+
+    assert not Outbox().enabled
+
+
+def test_access_key_is_not_stored_in_plain_text(outbox, client):
+    asyncio.run(outbox.enqueue("exec-1", "status", "http://admin/status", {"access-key": "secret"}, {"status": "SUCCESS"}))
+
+    raw = sqlite3.connect(outbox_module.OUTBOX_PATH).execute("SELECT headers FROM outbox").fetchone()[0]
+    assert "secret" not in raw
+
+    assert asyncio.run(outbox.flush()) == 1
+    url, headers, body = client.requests[0]
+    assert headers["access-key"] == "secret" and headers["Idempotency-Key"]
+    assert body == {"status": "SUCCESS"}
+    assert rows(outbox) == []
+
+
+def test_records_of_an_execution_are_delivered_in_order(outbox, client):
+    async def scenario():
+        for index in range(3):
+            await outbox.enqueue("exec-1", "history", f"http://admin/{index}", {}, {"index": index})
+        await outbox.enqueue("exec-2", "history", "http://admin/other", {}, {})
+        return await outbox.flush()
+
+    assert asyncio.run(scenario()) == 4
+    assert [url for url, _, _ in client.requests if url != "http://admin/other"] == ["http://admin/0", "http://admin/1", "http://admin/2"]
+    assert rows(outbox) == []
+
+
+def test_failed_record_holds_back_the_later_ones(outbox, client):
+    client.statuses["http://admin/0"] = [503]
+
+    async def scenario():
+        for index in range(3):
+            await outbox.enqueue("exec-1", "history", f"http://admin/{index}", {}, {})
+        delivered = await outbox.flush()
+        # The failed record waits for its backoff, the later ones must not overtake it
+        assert await outbox.flush() == 0
+        make_due(outbox)
+        return delivered, await outbox.flush()
+
+    assert asyncio.run(scenario()) == (3, 3)
+    assert [url for url, _, _ in client.requests] == ["http://admin/0", "http://admin/0", "http://admin/1", "http://admin/2"]
+    assert rows(outbox) == []
+
+
+def test_rejected_record_is_dead_and_purged_after_retention(outbox, client, monkeypatch):
+    client.statuses["http://admin/0"] = [400]
+
+    async def scenario():
+        await outbox.enqueue("exec-1", "history", "http://admin/0", {}, {})
+        await outbox.enqueue("exec-1", "history", "http://admin/1", {}, {})
+        await outbox.flush()
+        # A dead record no longer holds back the rest of its execution
+        await outbox.flush()
+
+    asyncio.run(scenario())
+    assert rows(outbox) == [("exec-1", "http://admin/0", 1, 1)]
+
+    assert asyncio.run(outbox.purge()) == 0
+    monkeypatch.setattr(outbox_module, "OUTBOX_DEAD_RETENTION", -1)
+    assert asyncio.run(outbox.purge()) == 1
+    assert rows(outbox) == []
+
+
+def test_record_is_dead_after_max_attempts(outbox, client, monkeypatch):
+    monkeypatch.setattr(outbox_module, "OUTBOX_MAX_ATTEMPTS", 2)
+    client.statuses["http://admin/0"] = [503, 503]
+
+    async def scenario():
+        await outbox.enqueue("exec-1", "status", "http://admin/0", {}, {})
+        await outbox.flush()
+        assert rows(outbox) == [("exec-1", "http://admin/0", 1, 0)]
+        make_due(outbox)
+        await outbox.flush()
+
+    asyncio.run(scenario())
+    assert rows(outbox) == [("exec-1", "http://admin/0", 2, 1)]
@@ -0,0 +1,104 @@
+import asyncio
+import httpx
+import pytest
+from helpers import payload_cache as payload_cache_module
+from helpers.payload_cache import PayloadCache
+
+
+class Admin:
+    """Fake admin API answering fetch(headers) with a 304 when the ETag still matches."""
+
+    def __init__(self):
+        self.version = 1
+        self.requests = []
+
+    async def fetch(self, headers):
+        self.requests.append(headers)
+        await asyncio.sleep(0.01)
+        etag = f'"v{self.version}"'
+        if headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, json={"pipeline": {"version": self.version}}, headers={"ETag": etag})
+
+
+def get(cache, admin, pipeLineId="7", access_key="key"):
+    return asyncio.run(cache.get(pipeLineId, access_key, admin.fetch))
+
+
+def test_fresh_payload_is_served_without_a_request():
+    cache, admin = PayloadCache(8), Admin()
+
+    assert get(cache, admin) == get(cache, admin) == {"pipeline": {"version": 1}}
+    assert admin.requests == [{}]
+
+
+def test_callers_get_their_own_copy():
+    cache, admin = PayloadCache(8), Admin()
+    get(cache, admin)["pipeline"]["version"] = 99
+
+    assert get(cache, admin) == {"pipeline": {"version": 1}}
+
+
+def test_stale_payload_is_revalidated(monkeypatch):
+    monkeypatch.setattr(payload_cache_module, "PAYLOAD_CACHE_TTL", 0)
+    cache, admin = PayloadCache(8), Admin()
+    get(cache, admin)
+
+    assert get(cache, admin) == {"pipeline": {"version": 1}}
+    admin.version = 2
+    assert get(cache, admin) == {"pipeline": {"version": 2}}
+    assert admin.requests == [{}, {"If-None-Match": '"v1"'}, {"If-None-Match": '"v1"'}]
+
+
+def test_invalidated_pipeline_is_fetched_again():
+    cache, admin = PayloadCache(8), Admin()
+    get(cache, admin, "7")
+    get(cache, admin, "8")
+    admin.version = 2
+
+    cache.invalidate("7")
+
+    assert get(cache, admin, "7") == {"pipeline": {"version": 2}}
+    assert get(cache, admin, "8") == {"pipeline": {"version": 1}}
+    assert admin.requests == [{}, {}, {}]
+
+
+def test_payload_is_only_served_for_the_same_access_key():
+    cache, admin = PayloadCache(8), Admin()
+    get(cache, admin, access_key="key")
+    get(cache, admin, access_key="other")
+
+    assert len(admin.requests) == 2
+
+
+def test_concurrent_requests_share_one_fetch():
+    cache, admin = PayloadCache(8), Admin()
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get("7", "key", admin.fetch) for _ in range(5)))
+
+    payloads = asyncio.run(scenario())
+
+    assert payloads == [{"pipeline": {"version": 1}}] * 5
+    assert admin.requests == [{}]
+    assert cache.inflight == {}
+
+
+def test_least_recently_used_payload_is_evicted():
+    cache, admin = PayloadCache(2), Admin()
+    for pipeLineId in ("1", "2", "1", "3"):
+        get(cache, admin, pipeLineId)
+
+    assert [key[0] for key in cache.entries] == ["1", "3"]
+
+
+def test_failed_fetch_is_not_cached():
+    cache, admin = PayloadCache(8), Admin()
+
+    async def failing(headers):
+        raise httpx.ConnectError("refused")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(cache.get("7", "key", failing))
+
+    assert get(cache, admin) == {"pipeline": {"version": 1}}
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+import pytest
+from litellm.exceptions import RateLimitError
+from helpers import rate_limiter
+from helpers.rate_limiter import LLMRateLimiter, OVERRUNS_KEY, deployment
+
+LLM = SimpleNamespace(model="azure/gpt-4o", base_url=None, api_base="https://east.example.com", additional_params={})
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def set_limits(rpm=0, tpm=0):
+        monkeypatch.setattr(rate_limiter, "LLM_RATE_LIMITS", {LLM.model: {"rpm": rpm, "tpm": tpm}})
+    return set_limits
+
+
+@pytest.fixture
+def limiter(redis, monkeypatch):
+    limiter = LLMRateLimiter(redis, max_wait=0, retries=2)
+    monkeypatch.setattr(limiter, "sleep", lambda seconds: None)
+    return limiter
+
+
+def test_acquire_waits_once_the_requests_are_taken(limiter):
+    assert limiter.bucket(LLM, 2, 0, 0, "acquire") == 0
+    assert limiter.bucket(LLM, 2, 0, 0, "acquire") == 0
+
+    # Two requests per minute refill one request every 30 seconds
+    assert limiter.bucket(LLM, 2, 0, 0, "acquire") == pytest.approx(30, abs=1)
+
+
+def test_charged_completion_tokens_hold_back_the_next_call(limiter):
+    assert limiter.bucket(LLM, 0, 600, 100, "acquire") == 0
+    limiter.bucket(LLM, 0, 600, 700, "charge")
+
+    # 200 tokens in debt plus 100 for the prompt at 10 tokens a second
+    assert limiter.bucket(LLM, 0, 600, 100, "acquire") == pytest.approx(30, abs=1)
+
+
+def test_drain_empties_both_buckets(limiter):
+    limiter.bucket(LLM, 60, 6000, 0, "drain")
+
+    assert limiter.bucket(LLM, 60, 6000, 0, "acquire") == pytest.approx(1, abs=0.1)
+
+
+def test_buckets_are_kept_per_deployment(limiter):
+    other = SimpleNamespace(**dict(vars(LLM), api_base="https://west.example.com"))
+    limiter.bucket(LLM, 1, 0, 0, "acquire")
+
+    assert limiter.bucket(other, 1, 0, 0, "acquire") == 0
+
+
+def test_tokens_are_not_counted_without_a_token_limit(limiter, limits, monkeypatch):
+    def count_tokens(*args, **kwargs):
+        raise AssertionError("tokens counted")
+
+    monkeypatch.setattr(rate_limiter, "count_tokens", count_tokens)
+    for rpm in (0, 60):
+        limits(rpm=rpm)
+        assert limiter.call(lambda llm, messages: "answer", LLM, [{"role": "user", "content": "hi"}], [{"role": "user", "content": "hi"}]) == "answer"
+
+
+def test_call_over_the_limit_is_sent_and_counted(limiter, limits, redis):
+    limits(rpm=1)
+    limiter.call(lambda llm: "first", LLM, None)
+
+    assert limiter.call(lambda llm: "second", LLM, None) == "second"
+    assert redis.hget(OVERRUNS_KEY, deployment(LLM)) == "1"
+
+
+def test_rate_limited_call_is_retried_and_drains_the_bucket(limiter, limits, monkeypatch):
+    limits(rpm=60)
+    drained = []
+    monkeypatch.setattr(limiter, "drain", lambda llm: drained.append(llm))
+    responses = [RateLimitError("slow down", llm_provider="azure", model=LLM.model), "answer"]
+
+    def limited(llm):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert limiter.call(limited, LLM, None) == "answer"
+    assert drained == [LLM]
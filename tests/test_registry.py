@@ -0,0 +1,58 @@
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from helpers.registry import LazyRegistry
+
+
+@pytest.fixture
+def slow_module(tmp_path, monkeypatch):
+    """A module that logs each of its imports and takes a moment to import, like a heavy tool."""
+    (tmp_path / "slow_tool.py").write_text(
+        "import time\n"
+        f"open({str(tmp_path / 'imports.log')!r}, 'a').write('imported\\n')\n"
+        "time.sleep(0.2)\n"
+        "class SlowTool:\n"
+        "    pass\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield "slow_tool"
+    sys.modules.pop("slow_tool", None)
+
+
+def test_concurrent_lookups_import_once_and_share_the_class(slow_module, tmp_path):
+    registry = LazyRegistry("tool", {"SlowTool": f"{slow_module}:SlowTool"})
+    barrier = threading.Barrier(8)
+
+    def lookup():
+        barrier.wait(timeout=5)
+        return registry.get("SlowTool")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        loaded = list(pool.map(lambda _: lookup(), range(8)))
+
+    assert (tmp_path / "imports.log").read_text() == "imported\n"
+    assert all(tool is loaded[0] for tool in loaded)
+    assert loaded[0].__name__ == "SlowTool"
+
+
+def test_nothing_is_imported_before_the_first_lookup(slow_module):
+    registry = LazyRegistry("tool", {"SlowTool": f"{slow_module}:SlowTool"})
+
+    assert "SlowTool" in registry
+    assert slow_module not in sys.modules
+    assert registry.loaded == {}
+
+
+def test_path_without_an_attribute_resolves_to_the_module(slow_module):
+    registry = LazyRegistry("provider", {"slow": slow_module})
+
+    assert registry.get("slow") is sys.modules[slow_module]
+
+
+def test_unknown_name_is_rejected():
+    registry = LazyRegistry("tool", {})
+
+    with pytest.raises(KeyError, match="Unknown tool Missing"):
+        registry.get("Missing")
+
@@ -0,0 +1,129 @@
+import base64
+import numpy as np
+import pytest
+from crewai import LLM
+import helpers.semantic_cache as semantic_cache_module
+from helpers.semantic_cache import Namespace, SemanticResponseCache, bind_semantic_cache
+from PipelineModel.agentDetails import AgentDetails
+from PipelineModel.agentEmbedding import AgentEmbedding
+from PipelineModel.agentLLM import AgentLLM
+from PipelineModel.taskDetails import TaskDetails
+
+
+def encoded(value):
+    return base64.b64encode(value.encode("utf-8")).decode("utf-8")
+
+
+def azure_embedding(api_key):
+    return AgentEmbedding(
+        aiEngine="AzureOpenAI",
+        embedding_model="text-embedding-3-small",
+        embedding_deployment_name="embeddings",
+        embedding_api_version="2024-02-01",
+        embedding_api_key=api_key,
+        embedding_azure_endpoint="https://example.openai.azure.com",
+    )
+
+
+def agent_details(embedding=None):
+    return AgentDetails(
+        id=1,
+        role="Writer",
+        goal="Write",
+        backstory="Writes things",
+        verbose=False,
+        allowDelegation=False,
+        task=TaskDetails(description="Write about {topic}", expectedOutput="Text"),
+        llm=AgentLLM(model="gpt-4o", aiEngine="AzureOpenAI", temperature=0, maxToken=100, topP=1,
+                     llmDeploymentName="gpt-4o", apiKey="key", azureEndpoint="https://example.openai.azure.com",
+                     llmApiVersion="2024-02-01"),
+        embedding=embedding,
+    )
+
+
+class RecordingEmbeddings:
+    def __init__(self, embedding):
+        self.embedding = embedding
+
+    def embed_query(self, text):
+        return [1.0, 0.0] if "topic" in text else [0.0, 1.0]
+
+
+@pytest.fixture
+def embedders(monkeypatch):
+    created = []
+
+    def embedding_function(embedding):
+        created.append(embedding)
+        return RecordingEmbeddings(embedding)
+
+    monkeypatch.setattr(semantic_cache_module, "embedding_function", embedding_function)
+    monkeypatch.setattr(semantic_cache_module, "semantic_response_cache", SemanticResponseCache())
+    return created
+
+
+def test_agent_without_embedding_falls_back_to_the_decoded_master_embedding(embedders):
+    pipeline_ai = pytest.importorskip("pipeline_ai")
+    master = azure_embedding(encoded("master-secret"))
+
+    agent, _ = pipeline_ai.setup_agents(agent_details(), {}, False, {}, "exec-1", pipelineId=7,
+                                        semantic_cache=True, master_embedding=master)
+
+    binding = agent.llm.semantic_cache
+    assert binding.namespace == "7"
+    assert binding.embedding.embedding_api_key == "master-secret"
+    # The payload itself keeps the encoded key
+    assert master.embedding_api_key == encoded("master-secret")
+
+    semantic_cache_module.semantic_response_cache.embed(binding, "Write about the topic")
+    assert embedders[0].embedding_api_key == "master-secret"
+
+
+def test_agent_embedding_is_used_as_is(embedders):
+    llm = LLM(model="azure/gpt-4o", temperature=0)
+    bind_semantic_cache(llm, 7, [azure_embedding("agent-key")], azure_embedding(encoded("master-secret")))
+    assert llm.semantic_cache.embedding.embedding_api_key == "agent-key"
+
+
+def test_manager_uses_the_decoded_master_embedding(embedders):
+    llm = LLM(model="azure/gpt-4o", temperature=0)
+    bind_semantic_cache(llm, 7, None, azure_embedding(encoded("master-secret")))
+    assert llm.semantic_cache.embedding.embedding_api_key == "master-secret"
+
+
+def test_without_any_embedding_the_cache_stays_off(embedders):
+    llm = LLM(model="azure/gpt-4o", temperature=0)
+    bind_semantic_cache(llm, 7, None, None)
+    assert getattr(llm, "semantic_cache", None) is None
+
+
+def normalized(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_namespace_returns_the_most_similar_response_of_the_same_scope():
+    namespace = Namespace()
+    namespace.add("scope", normalized(1, 0), "first", 10)
+    namespace.add("scope", normalized(1, 0.2), "second", 10)
+    namespace.add("other", normalized(1, 0.05), "other scope", 10)
+
+    response, similarity = namespace.search("scope", normalized(1, 0.19), 0.9)
+    assert response == "second"
+    assert similarity > 0.99
+    assert namespace.search("scope", normalized(0, 1), 0.9) is None
+
+
+def test_namespace_evicts_the_least_recently_used_and_expired_entries():
+    namespace = Namespace()
+    namespace.add("scope", normalized(1, 0), "first", 2)
+    namespace.add("scope", normalized(0, 1), "second", 2)
+    namespace.search("scope", normalized(1, 0), 0.9)
+    namespace.add("scope", normalized(1, 1), "third", 2)
+
+    assert namespace.responses == ["first", "third"]
+    assert namespace.vectors.shape == (2, 2)
+
+    namespace.expire(-1)
+    assert len(namespace) == 0
+    assert namespace.search("scope", normalized(1, 0), 0.9) is None
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+import pytest
+
+uvicorn = pytest.importorskip("uvicorn")
+
+import supervisor
+from supervisor import PID_MESSAGE, RecyclingServer, Supervisor
+
+CHECK_TICK = int(supervisor.WORKER_CHECK_INTERVAL * 10)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """A worker's server after the given number of started executions, with the supervisor's end of its pipe."""
+    read, write = os.pipe()
+
+    def create(started_executions=0):
+        monkeypatch.setitem(sys.modules, "pipeline_ai", SimpleNamespace(started_executions=started_executions))
+        config = uvicorn.Config(lambda scope, receive, send: None, ws="none")
+        config.load()
+        return RecyclingServer(config, write)
+
+    yield create, read
+    os.close(read)
+    os.close(write)
+
+
+def test_worker_retires_after_its_executions(server, monkeypatch):
+    monkeypatch.setattr(supervisor, "WORKER_MAX_EXECUTIONS", 3)
+    create, read = server
+
+    assert asyncio.run(create(started_executions=2).on_tick(CHECK_TICK)) is False
+
+    retiring = create(started_executions=3)
+    assert asyncio.run(retiring.on_tick(CHECK_TICK)) is True
+    assert retiring.retiring
+    assert PID_MESSAGE.unpack(os.read(read, PID_MESSAGE.size)) == (os.getpid(),)
+
+
+def test_worker_retires_above_its_memory_ceiling(server, monkeypatch):
+    monkeypatch.setattr(supervisor, "WORKER_MAX_RSS_MB", 1000)
+    create, read = server
+
+    monkeypatch.setattr(supervisor, "resident_memory_mb", lambda: 900)
+    assert create().retire_reason() is None
+
+    monkeypatch.setattr(supervisor, "resident_memory_mb", lambda: 1200)
+    assert create().retire_reason() == "resident memory of 1200MB"
+
+
+def test_limits_are_only_checked_every_interval(server, monkeypatch):
+    monkeypatch.setattr(supervisor, "WORKER_MAX_EXECUTIONS", 1)
+    create, read = server
+
+    assert asyncio.run(create(started_executions=5).on_tick(CHECK_TICK + 1)) is False
+
+
+def test_worker_dying_at_startup_is_respawned_later_without_blocking(monkeypatch):
+    exits = [(101, 256), (0, 0)]
+    monkeypatch.setattr(os, "waitpid", lambda pid, options: exits.pop(0))
+    monkeypatch.setattr(time, "sleep", lambda seconds: pytest.fail("the supervisor loop blocked"))
+    owner = Supervisor()
+    spawned = []
+    monkeypatch.setattr(owner, "spawn", lambda: spawned.append(True))
+    owner.workers[101] = time.monotonic()
+
+    owner.reap()
+    owner.respawn()
+    assert spawned == [] and len(owner.respawns) == 1
+
+    owner.respawns = [time.monotonic() - 1]
+    owner.respawn()
+    assert spawned == [True] and owner.respawns == []
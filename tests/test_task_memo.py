@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+from crewai.tasks.task_output import TaskOutput
+from helpers.task_memo import TaskMemo
+from PipelineModel.PipelineModel import PipelineModel
+
+
+def tool(class_name):
+    return type(class_name, (), {})()
+
+
+def task(description="summarize", tools=()):
+    agent = SimpleNamespace(role="writer", goal="write", backstory="", llm=SimpleNamespace(model="gpt-4o"), tools=list(tools))
+    return SimpleNamespace(description=description, expected_output="text", agent=agent, tools=[], context=None, output=None)
+
+
+def done(raw):
+    return SimpleNamespace(output=TaskOutput(description="upstream", raw=raw, agent="writer"))
+
+
+def test_tasks_without_tools_or_with_read_only_tools_are_memoizable():
+    assert TaskMemo.memoizable(task())
+    assert TaskMemo.memoizable(task(tools=[tool("ScopedSerperDevTool"), tool("KnowledgeRAGTool")]))
+
+
+def test_tasks_with_any_other_tool_are_always_executed():
+    for class_name in ["FileWriterTool", "MemoryReaderWriterTool", "SQLTool", "WeatherTool"]:
+        assert not TaskMemo.memoizable(task(tools=[tool("ScrapeWebsiteTool"), tool(class_name)])), class_name
+
+
+def test_key_follows_the_task_and_its_upstream_outputs():
+    key = TaskMemo.key("7", task(), [done("a")])
+
+    assert TaskMemo.key("7", task(), [done("a")]) == key
+    assert TaskMemo.key("7", task(), [done("b")]) != key
+    assert TaskMemo.key("7", task("translate"), [done("a")]) != key
+    # Memoized outputs are never shared between pipelines
+    assert TaskMemo.key("8", task(), [done("a")]) != key
+
+
+def test_memoized_output_is_returned_until_it_expires(redis):
+    memo = TaskMemo(redis, ttl=60)
+    key = TaskMemo.key("7", task(), [])
+    assert memo.get(key) is None
+
+    memo.put(key, TaskOutput(description="summarize", raw="summary", agent="writer"))
+
+    assert memo.get(key).raw == "summary"
+    assert 0 < redis.ttl(key) <= 60
+
+
+def test_memoization_is_off_unless_the_pipeline_opts_in():
+    pipeline = PipelineModel(pipelineId=7, pipeLineAgents=[], langfuse={})
+
+    assert pipeline.taskMemo is False
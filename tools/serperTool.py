@@ -0,0 +1,51 @@
+import json
+from typing import Optional
+
+import requests
+from crewai_tools.tools.serper_dev_tool.serper_dev_tool import SerperDevTool
+from pydantic import Field
+from helpers.logger_config import logger
+
+
+class ScopedSerperDevTool(SerperDevTool):
+    """SerperDevTool that keeps its API key on the instance instead of os.environ['SERPER_API_KEY'],
+    so concurrent executions configured with different keys do not overwrite each other."""
+
+    api_key: Optional[str] = Field(default=None, exclude=True, repr=False)
+
+    def _make_api_request(self, search_query: str, search_type: str) -> dict:
+        search_url = self._get_search_url(search_type)
+        payload = {"q": search_query, "num": self.n_results}
+
+        if self.country != "":
+            payload["gl"] = self.country
+        if self.location != "":
+            payload["location"] = self.location
+        if self.locale != "":
+            payload["hl"] = self.locale
+
+        headers = {
+            "X-API-KEY": self.api_key,
+            "content-type": "application/json",
+        }
+
+        response = None
+        try:
+            response = requests.post(search_url, headers=headers, json=payload, timeout=10)
+            response.raise_for_status()
+            results = response.json()
+            if not results:
+                logger.error("Empty response from Serper API")
+                raise ValueError("Empty response from Serper API")
+            return results
+
+        except requests.exceptions.RequestException as e:
+            error_msg = f"Error making request to Serper API: {e}"
+            if response is not None and hasattr(response, "content"):
+                error_msg += f"\nResponse content: {response.content}"
+            logger.error(error_msg)
+            raise
+
+        except json.JSONDecodeError as e:
+            logger.error(f"Error decoding JSON response from Serper API: {e}")
+            raise